@@ -0,0 +1,56 @@
+import argparse
+import gc
+import sys
+import tracemalloc
+sys.path.append(sys.path[0] + '/..')
+from parser import ASTArena, ASTNode, parse_source
+from synthetic import synthetic_program
+
+
+class DictASTNode:
+    # the previous dict-backed representation, rebuilt here as the baseline
+    def __init__(self, node_type, value=None, children=None):
+        self.node_type = node_type
+        self.value = value
+        self.children = children if children else []
+
+
+def copy_tree(node_class, node):
+    # value strings are shared with the parsed tree, so only the node structure itself is measured
+    if node is None:
+        return None
+    return node_class(node.node_type, node.value, [copy_tree(node_class, child) for child in node.children])
+
+
+def allocated_by(function, *args):
+    gc.collect()
+    tracemalloc.start()
+    result = function(*args)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description = "Memory used by the AST representations")
+    arg_parser.add_argument("--statements", type = int, nargs = "+", default = [1000, 10000, 100000])
+
+    args = arg_parser.parse_args()
+
+    print(f"{'statements':>10} {'dict nodes (MB)':>16} {'slotted (MB)':>13} {'arena (MB)':>11} {'saving':>7}")
+    for statements in args.statements:
+        ast, parser, errors = parse_source(synthetic_program(statements))
+        assert not errors and parser.is_success
+
+        _, dict_size = allocated_by(copy_tree, DictASTNode, ast)
+        _, slotted_size = allocated_by(copy_tree, ASTNode, ast)
+        _, arena_size = allocated_by(ASTArena.from_tree, ast)
+
+        megabyte = 1024 * 1024
+        print(f"{statements:>10} {dict_size / megabyte:>16.2f} {slotted_size / megabyte:>13.2f} "
+              f"{arena_size / megabyte:>11.2f} {dict_size / arena_size:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
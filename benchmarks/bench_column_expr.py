@@ -0,0 +1,73 @@
+import argparse
+import contextlib
+import gc
+import io
+import sys
+import time
+import tracemalloc
+sys.path.append(sys.path[0] + '/..')
+import code_generator
+import numpy as np
+import optimised_code_generator
+import pandas as pd
+from parser import parse_source
+from runtime import top_n
+
+# DISPLAY statements with three column expressions over a wide table: the code generator copies the whole table for
+# each expression, the optimised code generator derives the columns on a shallow copy of the rows that are shown
+
+statements = {
+    "all rows": 'DISPLAY ("c0", "c1" + 10, "c2" * 2, "c3" - 1, header = true);\n',
+    "filter, sort, num": 'DISPLAY ("c0", "c1" + 10, "c2" * 2, "c3" - 1, num = 10, sort = ("c0"), '
+                         'filter = ("c4" > 500), header = true);\n',
+}
+
+
+def measure(code, frame, repeat):
+    # returns the best time and the peak memory allocated while running code (numpy reports its arrays to
+    # tracemalloc), not counting the table itself
+    code_object = compile(code, "<csvlang>", "exec")
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            exec(code_object, {"pd": pd, "top_n": top_n, "a0": frame})
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    gc.collect()
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        exec(code_object, {"pd": pd, "top_n": top_n, "a0": frame})
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description = "Time and peak memory of column expressions on wide tables")
+    arg_parser.add_argument("--rows", type = int, default = 100000)
+    arg_parser.add_argument("--columns", type = int, default = 200)
+    arg_parser.add_argument("--repeat", type = int, default = 3)
+
+    args = arg_parser.parse_args()
+
+    generator = np.random.default_rng(0)
+    frame = pd.DataFrame(generator.integers(0, 1000, (args.rows, args.columns)),
+                         columns=[f"c{i}" for i in range(args.columns)])
+    print(f"{args.rows} rows x {args.columns} columns, {frame.memory_usage().sum() / 1024 / 1024:.1f} MB\n")
+
+    print(f"{'statement':>18} {'generator':>25} {'seconds':>8} {'peak MB':>8}")
+    for name, statement in statements.items():
+        ast, parser, errors = parse_source('LOAD ("wide.csv", header = true);\n' + statement)
+        for generator_name, generator_module in [("code_generator", code_generator),
+                                                 ("optimised_code_generator", optimised_code_generator)]:
+            # the LOAD is not run; a0 is the table built above
+            load, display = generator_module.generate_statements(ast)
+            seconds, peak = measure(display, frame, args.repeat)
+            print(f"{name:>18} {generator_name:>25} {seconds:>8.3f} {peak / 1024 / 1024:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+sys.path.append(sys.path[0] + '/..')
+import code_generator
+import optimised_code_generator
+from parser import Parser, Token
+from scanner import scanner
+from synthetic import synthetic_program
+
+generators = {"code_generator": code_generator, "optimised_code_generator": optimised_code_generator}
+
+
+def scan(source_code):
+    tokens, errors = scanner(source_code)
+    return tokens
+
+
+def parse(tokens):
+    parser = Parser(Token(token_class, lexeme) for token_class, lexeme in tokens)
+    return parser.parse_program()
+
+
+def measure(repeat, function, *args):
+    # the best of repeat untraced runs gives the time; one more run under tracemalloc gives the peak memory
+    seconds = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        seconds = elapsed if seconds is None else min(seconds, elapsed)
+
+    gc.collect()
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def stages(source_code, repeat, skipped):
+    # yields (stage, generator, seconds, peak bytes); a stage in skipped is not run
+    tokens, seconds, peak = measure(repeat, scan, source_code)
+    yield "scanner", None, seconds, peak
+    ast, seconds, peak = measure(repeat, parse, tokens)
+    yield "parser", None, seconds, peak
+
+    for name, generator in generators.items():
+        # generating includes the optimisation passes, dead LOAD elimination among them
+        if ("generate_python_code", name) not in skipped:
+            _, seconds, peak = measure(repeat, generator.generate_python_code, ast)
+            yield "generate_python_code", name, seconds, peak
+        else:
+            yield "generate_python_code", name, None, None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as file:
+        baseline = {(result["stage"], result["generator"], result["statements"]): result["seconds"]
+                    for result in json.load(file)["results"]}
+    print(f"\nchange against {baseline_path}:")
+    for result in results:
+        previous = baseline.get((result["stage"], result["generator"], result["statements"]))
+        if previous and result["seconds"]:
+            print(f"{result['stage']:>21} {result['generator'] or '':>25} {result['statements']:>7} "
+                  f"{result['seconds'] / previous:>6.2f}x")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description = "Time and peak memory of each compiler stage")
+    arg_parser.add_argument("--statements", type = int, nargs = "+", default = [10, 100, 1000, 10000, 100000])
+    arg_parser.add_argument("--repeat", type = int, default = 3)
+    arg_parser.add_argument("--budget", type = float, default = 30.0,
+                            help = "Seconds after which a stage is not run for larger programs")
+    arg_parser.add_argument("--output", default = "compiler_benchmark.json")
+    arg_parser.add_argument("--baseline", help = "JSON written by an earlier run to compare against")
+
+    args = arg_parser.parse_args()
+
+    results = []
+    skipped = set()
+    print(f"{'stage':>21} {'generator':>25} {'statements':>10} {'seconds':>9} {'peak MB':>8}")
+    for statements in args.statements:
+        source_code = synthetic_program(statements)
+        for stage, generator, seconds, peak in stages(source_code, args.repeat, skipped):
+            results.append({"stage": stage, "generator": generator, "statements": statements,
+                            "bytes": len(source_code), "seconds": seconds, "peak_bytes": peak})
+            if seconds is None:
+                print(f"{stage:>21} {generator or '':>25} {statements:>10} {'skipped':>9}")
+                continue
+            if seconds > args.budget:
+                skipped.add((stage, generator))
+            print(f"{stage:>21} {generator or '':>25} {statements:>10} {seconds:>9.4f} {peak / 1024 / 1024:>8.1f}")
+
+    with open(args.output, "w") as file:
+        json.dump({"python": sys.version, "platform": platform.platform(), "repeat": args.repeat,
+                   "results": results}, file, indent = 2)
+    print(f"\nwrote {args.output}")
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
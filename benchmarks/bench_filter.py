@@ -0,0 +1,91 @@
+import argparse
+import sys
+import time
+sys.path.append(sys.path[0] + '/..')
+import code_generator
+import optimised_code_generator
+from parser import ASTNode, Parser, parse_source
+
+
+class RecursiveParser(Parser):
+    # the previous recursive descent filter parser, kept here as the baseline
+    def parse_expression(self):
+        token = self.current_token()
+        if token.token_type == "string":
+            self.advance()
+            return ASTNode("COLUMN", value=token.value)
+        elif token.token_type == "number":
+            self.advance()
+            return ASTNode("NUMBER", value=token.value)
+        self.advance()
+        expr = self.parse_condition()
+        self.expect("separator", ")")
+        return expr
+
+    def parse_condition(self):
+        left = self.parse_expression()
+        operator = self.expect("operator").to_node('OPERATOR')
+        right = self.parse_expression()
+        condition_node = ASTNode("CONDITION", children=[left, operator, right])
+        while self.current_token().token_type == "operator" and self.current_token().value in ["&", "|"]:
+            logical_operator = self.current_token().to_node('OPERATOR')
+            self.advance()
+            next_condition = self.parse_condition()
+            condition_node = ASTNode("CONDITION", children=[condition_node, logical_operator, next_condition])
+        return condition_node
+
+
+def allow_list_filter(terms):
+    return " | ".join(f'"goods" = "item{i}"' for i in range(terms))
+
+
+def mixed_filter(terms):
+    return " | ".join(f'("sales" >= {i} & "goods" = "item{i}")' for i in range(terms // 2))
+
+
+def program(condition):
+    return f'LOAD ("csv_files/sales.csv", header = true);\nDISPLAY ("goods", "sales", filter = ({condition}));\n'
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    try:
+        result = function(*args)
+    except RecursionError:
+        return "RecursionError", None
+    return f"{time.perf_counter() - start:.3f}", result
+
+
+def recursive_parse(source_code):
+    from scanner import scanner
+    from parser import Token
+    tokens, errors = scanner(source_code)
+    return RecursiveParser([Token(token[0], token[1]) for token in tokens]).parse_program()
+
+
+def generate_and_compile(generator, ast):
+    code = generator.generate_python_code(ast)
+    compile(code, "<csvlang>", "exec")
+    return code
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description = "Stress benchmark for very large filter predicates")
+    arg_parser.add_argument("--terms", type = int, nargs = "+", default = [100, 1000, 10000])
+
+    args = arg_parser.parse_args()
+
+    print(f"{'filter':>10} {'terms':>6} {'recursive parse':>16} {'parse':>7} {'codegen+compile':>16} "
+          f"{'optimised':>10}")
+    for name, make_filter in [("allow-list", allow_list_filter), ("mixed", mixed_filter)]:
+        for terms in args.terms:
+            source_code = program(make_filter(terms))
+            old_parse_time, _ = timed(recursive_parse, source_code)
+            parse_time, (ast, parser, errors) = timed(parse_source, source_code)
+            codegen_time, _ = timed(generate_and_compile, code_generator, ast)
+            optimised_time, _ = timed(generate_and_compile, optimised_code_generator, ast)
+            print(f"{name:>10} {terms:>6} {old_parse_time:>16} {parse_time:>7} {codegen_time:>16} {optimised_time:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import argparse
+import os
+import sys
+import time
+sys.path.append(sys.path[0] + '/..')
+sys.path.append(sys.path[0] + '/csvbench')
+import pandas as pd
+from generate_data import generate
+from parser import parse_source
+from plan_generator import generate_filter_expression, generate_filter_mask
+from runtime import filter_mask
+
+# multi-term filters over a large sales.csv: one & expression computes every term over every row, filter_mask()
+# computes the most selective term first and the others only on the rows that are still alive
+
+filters = {
+    "selective last": '"sales" >= 20 & "goods" <> "Pen" & "date" = "1-1-22"',
+    "selective first": '"goods" = "Paper" & "sales" >= 200 & "sales" < 5000',
+    "three strings": '"goods" <> "Pen" & "date" <> "1-1-22" & "goods" = "Tea"',
+    "none selective": '"sales" > 1 & "sales" < 9000 & "goods" <> "Pen"',
+}
+
+
+def condition(source):
+    ast, parser, errors = parse_source(f'LOAD ("a.csv", header = true);\nDISPLAY ("goods", filter = ({source}));\n')
+    display = ast.children[1]
+    return next(child for child in display.children if child is not None and child.node_type == "FILTER-ATTR") \
+        .children[2]
+
+
+def timed(expression, data, repeat):
+    code_object = compile(f"a0.loc[{expression}]", "<csvlang>", "eval")
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = eval(code_object, {"pd": pd, "filter_mask": filter_mask, "a0": data})
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(rows)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description = "Multi-term filters: one & expression against filter_mask()")
+    arg_parser.add_argument("--rows", type = int, default = 10_000_000)
+    arg_parser.add_argument("--repeat", type = int, default = 3)
+    arg_parser.add_argument("--seed", type = int, default = 0)
+    arg_parser.add_argument("--data", default = os.path.join(sys.path[0], "csvbench", "data"))
+
+    args = arg_parser.parse_args()
+
+    data = pd.read_csv(generate(args.data, args.rows, args.seed)["sales"], header=[0])
+    print(f"{args.rows} rows\n")
+
+    print(f"{'filter':>16} {'rows kept':>10} {'& expression s':>15} {'filter_mask s':>14} {'speedup':>8}")
+    for name, source in filters.items():
+        node = condition(source)
+        expression, kept = timed(generate_filter_expression(node, "a0"), data, args.repeat)
+        mask, mask_kept = timed(generate_filter_mask(node, "a0"), data, args.repeat)
+        assert kept == mask_kept
+        print(f"{name:>16} {kept:>10} {expression:>15.3f} {mask:>14.3f} {expression / mask:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+sys.path.append(sys.path[0] + '/..')
+sys.path.append(sys.path[0] + '/csvbench')
+import code_generator
+import optimised_code_generator
+import pandas as pd
+from generate_data import generate
+from parser import parse_source
+
+# a selective DISPLAY/STORE over a large sales.csv: the code generator sorts every row before the filter drops
+# most of them, the optimised code generator filters first and sorts only the rows that pass
+
+
+def program(path, threshold, output):
+    return (f'LOAD ("{path}", header = true);\n'
+            f'DISPLAY ("goods", "sales", num = 10, header = true, sort = ("sales"), filter = ("sales" >= {threshold}));\n'
+            f'STORE ("goods", "sales", header = true, sort = ("goods", "sales"), filter = ("sales" >= {threshold}), '
+            f'path = "{output}");\n')
+
+
+def statement_code(generator, source_code):
+    # the code of each statement; the LOAD is run once, outside the timings
+    ast, parser, errors = parse_source(source_code)
+    return generator.generate_statements(ast)
+
+
+def timed(code, namespace, repeat):
+    code_object = compile(code, "<csvlang>", "exec")
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            exec(code_object, dict(namespace))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description = "Filter-before-sort benchmark for DISPLAY and STORE")
+    arg_parser.add_argument("--rows", type = int, default = 10_000_000)
+    arg_parser.add_argument("--selectivity", type = float, default = 0.01, help = "Fraction of rows the filter keeps")
+    arg_parser.add_argument("--repeat", type = int, default = 3)
+    arg_parser.add_argument("--seed", type = int, default = 0)
+    arg_parser.add_argument("--data", default = os.path.join(sys.path[0], "csvbench", "data"))
+
+    args = arg_parser.parse_args()
+
+    path = generate(args.data, args.rows, args.seed)["sales"]
+    data = pd.read_csv(path, header=[0])
+    threshold = int(data["sales"].quantile(1 - args.selectivity))
+    print(f"{args.rows} rows, filter \"sales\" >= {threshold} keeps {(data['sales'] >= threshold).mean():.2%}\n")
+
+    output = os.path.join(args.data, "filter_sort_output.csv")
+    source_code = program(path, threshold, output)
+    print(f"{'generator':>25} {'DISPLAY s':>10} {'STORE s':>10}")
+    try:
+        for name, generator in [("code_generator", code_generator),
+                                ("optimised_code_generator", optimised_code_generator)]:
+            load, display, store = statement_code(generator, source_code)
+            # LOAD binds a0, which both statements read
+            namespace = {"pd": pd, "a0": data}
+            print(f"{name:>25} {timed(display, namespace, args.repeat):>10.3f} "
+                  f"{timed(store, namespace, args.repeat):>10.3f}")
+            print(f"{'':>25} {display.splitlines()[0]}")
+    finally:
+        if os.path.exists(output):
+            os.remove(output)
+
+
+if __name__ == "__main__":
+    main()
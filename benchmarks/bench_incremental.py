@@ -0,0 +1,57 @@
+import argparse
+import random
+import sys
+import time
+sys.path.append(sys.path[0] + '/..')
+from incremental import IncrementalParser
+from parser import parse_source
+from synthetic import synthetic_program
+
+
+def single_character_edits(source_code, count, seed):
+    # replace one letter inside a random string literal, which keeps the program valid
+    random_state = random.Random(seed)
+    positions = [position for position, character in enumerate(source_code)
+                 if character.isalpha() and source_code[position - 1] == '"']
+    for _ in range(count):
+        position = random_state.choice(positions)
+        character = random_state.choice("abcdefghijklmnopqrstuvwxyz")
+        source_code = source_code[:position] + character + source_code[position + 1:]
+        yield source_code
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description = "Latency of single character edits with the incremental parser")
+    arg_parser.add_argument("--statements", type = int, default = 50000)
+    arg_parser.add_argument("--edits", type = int, default = 20)
+    arg_parser.add_argument("--seed", type = int, default = 0)
+
+    args = arg_parser.parse_args()
+
+    source_code = synthetic_program(args.statements)
+    edits = list(single_character_edits(source_code, args.edits, args.seed))
+
+    start = time.perf_counter()
+    for edit in edits:
+        parse_source(edit)
+    full_time = (time.perf_counter() - start) / len(edits)
+
+    incremental = IncrementalParser()
+    start = time.perf_counter()
+    incremental.update(source_code)
+    cold_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for edit in edits:
+        incremental.update(edit)
+    edit_time = (time.perf_counter() - start) / len(edits)
+
+    print(f"statements: {args.statements}, bytes: {len(source_code)}")
+    print(f"full re-parse per edit:        {full_time * 1000:9.1f} ms")
+    print(f"incremental cold update:       {cold_time * 1000:9.1f} ms")
+    print(f"incremental update per edit:   {edit_time * 1000:9.1f} ms")
+    print(f"statements re-parsed per edit: {incremental.reparsed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import argparse
+import sys
+import time
+sys.path.append(sys.path[0] + '/..')
+from scanner import scanner, char_scanner
+from synthetic import synthetic_program_of_size
+
+
+def best_of(function, program, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(program)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description = "Benchmark the master-pattern scanner against char_scanner")
+    arg_parser.add_argument("--sizes", type = int, nargs = "+", default = [1, 10, 100], help = "Input sizes in MB")
+    arg_parser.add_argument("--repeat", type = int, default = 3)
+    arg_parser.add_argument("--skip-reference", action = "store_true",
+                            help = "Only time scanner() (char_scanner is very slow on 100 MB inputs)")
+
+    args = arg_parser.parse_args()
+
+    print(f"{'size (MB)':>10} {'char_scanner (s)':>18} {'scanner (s)':>12} {'speedup':>8} {'MB/s':>8}")
+    for size in args.sizes:
+        program = synthetic_program_of_size(size * 1024 * 1024)
+
+        new_time, new_result = best_of(scanner, program, args.repeat)
+        if args.skip_reference:
+            old_time = float("nan")
+        else:
+            old_time, old_result = best_of(char_scanner, program, args.repeat)
+            assert old_result == new_result, "scanner() and char_scanner() disagree"
+
+        print(f"{size:>10} {old_time:>18.3f} {new_time:>12.3f} {old_time / new_time:>7.1f}x {size / new_time:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import argparse
+import glob
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+repository = os.path.abspath(os.path.join(sys.path[0], '..'))
+
+# programs that never need pandas, next to the sample programs
+pandas_free_programs = {
+    "print_only": 'PRINT ("Nightly job started");\nPRINT ("Nightly job finished");\n',
+    "create_delete": 'CREATE ("csv_files/scratch.csv");\nLOAD ("csv_files/scratch.csv", header = false, tag = "tmp");\n'
+                     'PRINT ("Removing the scratch file");\nDELETE (tag = "tmp");\n',
+}
+
+
+def import_times(stderr):
+    # -X importtime prints "import time: self [us] | cumulative | imported package" for every module
+    total = 0
+    pandas = 0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, cumulative, module = line[len("import time:"):].split("|")
+        total += int(self_time)
+        if module.strip() == "pandas":
+            pandas = int(cumulative)
+    return total / 1000, pandas / 1000
+
+
+def run(generator, program, working_directory, options):
+    # each run starts from a fresh copy of the csv files, since programs may store or delete them
+    shutil.rmtree(os.path.join(working_directory, "csv_files"), ignore_errors=True)
+    shutil.copytree(os.path.join(repository, "csv_files"), os.path.join(working_directory, "csv_files"))
+    with open(program) as file:
+        relative_directory = "nested/programs" if "../../csv_files" in file.read() else "."
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-X", "importtime", os.path.join(repository, generator), program,
+                                *options], cwd=os.path.join(working_directory, relative_directory),
+                               capture_output=True, text=True)
+    return time.perf_counter() - start, completed.stderr
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description = "Cold start latency of the code generators per program")
+    arg_parser.add_argument("--repeat", type = int, default = 5)
+    arg_parser.add_argument("--cache", action = "store_true", help = "Measure warm runs that hit __csvcache__")
+
+    args = arg_parser.parse_args()
+
+    working_directory = tempfile.mkdtemp()
+    os.makedirs(os.path.join(working_directory, "nested", "programs"))
+    programs = sorted(glob.glob(os.path.join(repository, "sample_programs", "*", "*.csvlang")))
+    for name, source_code in pandas_free_programs.items():
+        path = os.path.join(working_directory, f"{name}.csvlang")
+        with open(path, "w") as file:
+            file.write(source_code)
+        programs.append(path)
+
+    options = [] if args.cache else ["--no-cache"]
+    print(f"{'generator':>26} {'program':>40} {'wall ms':>8} {'imports ms':>11} {'pandas ms':>10}")
+    try:
+        for generator in ["code_generator.py", "optimised_code_generator.py"]:
+            for program in programs:
+                if args.cache:
+                    run(generator, program, working_directory, options)
+                timings = [run(generator, program, working_directory, options) for _ in range(args.repeat)]
+                wall = statistics.median(timing for timing, stderr in timings) * 1000
+                total, pandas = import_times(timings[-1][1])
+                name = os.path.relpath(program, os.path.join(repository, "sample_programs")) \
+                    if program.startswith(repository) else os.path.basename(program)
+                print(f"{generator:>26} {name:>40} {wall:>8.1f} {total:>11.1f} {pandas:>10.1f}")
+    finally:
+        shutil.rmtree(working_directory)
+        if args.cache:
+            for cache_directory in glob.glob(os.path.join(repository, "sample_programs", "*", "__csvcache__")):
+                shutil.rmtree(cache_directory)
+
+if __name__ == "__main__":
+    main()
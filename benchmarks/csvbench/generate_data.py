@@ -0,0 +1,115 @@
+import argparse
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+
+# seeded data shaped like csv_files/sales.csv, student_scores.csv and matrix.csv, written in chunks so that
+# 50M row files never have to fit in memory
+
+chunk_rows = 1_000_000
+
+goods_nouns = ["Paper", "Pen", "Eggs", "Bread", "Shelf", "Chair", "Milk", "Tea", "Coffee", "Rice", "Soap", "Lamp",
+               "Table", "Notebook", "Pencil", "Apple", "Banana", "Juice", "Butter", "Cheese"]
+first_names = ["Abhishek", "Githanjali", "Darren", "Priya", "Rahul", "Sara", "John", "Maria", "Wei", "Yuki",
+               "Ahmed", "Fatima", "Lucas", "Emma", "Noah", "Olivia", "Arjun", "Meera", "Chen", "Ana"]
+
+
+def goods_names(count = 2000):
+    # the first names are the plain nouns, so filters on "Paper" still match the most frequent product
+    return [noun if i < len(goods_nouns) else f"{noun} {i // len(goods_nouns)}"
+            for i, noun in ((i, goods_nouns[i % len(goods_nouns)]) for i in range(count))]
+
+
+def sale_dates(days = 3 * 365):
+    # formatted like the sample data: month-day-two digit year
+    start = datetime.date(2022, 1, 1)
+    return [f"{date.month}-{date.day}-{date.year % 100}"
+            for date in (start + datetime.timedelta(days=day) for day in range(days))]
+
+
+def student_names(count = 5000):
+    return [f"{first_names[i % len(first_names)]}{'' if i < len(first_names) else i // len(first_names)}"
+            for i in range(count)]
+
+
+def sales_chunk(generator, rows):
+    goods = np.array(goods_names())
+    dates = np.array(sale_dates())
+    # a few goods sell far more often than the rest
+    ranks = np.minimum(generator.zipf(1.3, rows) - 1, len(goods) - 1)
+    return pd.DataFrame({
+        "goods": goods[ranks],
+        "date": dates[generator.integers(0, len(dates), rows)],
+        "sales": np.clip(generator.lognormal(3.5, 1.0, rows).astype(np.int64), 1, 10000),
+    })
+
+
+def student_scores_chunk(generator, rows):
+    names = np.array(student_names())
+    return pd.DataFrame({
+        "name": names[generator.integers(0, len(names), rows)],
+        "score": np.clip(generator.normal(65, 15, rows).round(), 0, 100).astype(np.int64),
+        "age": generator.integers(17, 31, rows),
+    })
+
+
+def matrix_chunk(generator, rows):
+    return pd.DataFrame(generator.normal(50, 20, (rows, 3)).round(1))
+
+
+datasets = {
+    "sales": (sales_chunk, True),
+    "sales1": (sales_chunk, True),
+    "student_scores": (student_scores_chunk, True),
+    "matrix": (matrix_chunk, False),
+}
+
+
+def data_path(directory, name, rows):
+    return os.path.join(directory, f"{name}_{rows}.csv")
+
+
+def write_dataset(directory, name, rows, seed):
+    make_chunk, header = datasets[name]
+    # every dataset and size gets its own stream, so adding a dataset does not change the others
+    generator = np.random.default_rng([seed, rows, list(datasets).index(name)])
+    path = data_path(directory, name, rows)
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w", newline="") as file:
+        for start in range(0, rows, chunk_rows):
+            make_chunk(generator, min(chunk_rows, rows - start)).to_csv(
+                file, index=False, header=header and start == 0)
+    os.replace(temporary_path, path)
+    return path
+
+
+def generate(directory, rows, seed = 0, force = False):
+    # returns {dataset: path}, writing only the files that do not exist yet
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for name in datasets:
+        path = data_path(directory, name, rows)
+        if force or not os.path.exists(path):
+            write_dataset(directory, name, rows, seed)
+        paths[name] = path
+    return paths
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description = "Generate the CSVBench data sets")
+    arg_parser.add_argument("--rows", type = int, nargs = "+", default = [1000, 10000, 100000, 1000000])
+    arg_parser.add_argument("--seed", type = int, default = 0)
+    arg_parser.add_argument("--data", default = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+    arg_parser.add_argument("--force", action = "store_true", help = "Regenerate files that already exist")
+
+    args = arg_parser.parse_args()
+
+    for rows in args.rows:
+        for name, path in generate(args.data, rows, args.seed, args.force).items():
+            print(f"{rows:>10} {name:>15} {os.path.getsize(path) / 1024 / 1024:>10.1f} MB  {path}")
+
+
+if __name__ == "__main__":
+    main()
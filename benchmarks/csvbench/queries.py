@@ -0,0 +1,48 @@
+# the CSVBench query mix, modelled on sample_programs/; {sales}, {sales1}, {student_scores} and {matrix} are the
+# generated data sets, {scratch} is a fresh copy of {student_scores} for queries that rewrite their input, and
+# {output} is a path the query may write to
+
+queries = {
+    "display_head": (
+        'LOAD ("{sales}", header = true);\n'
+        'DISPLAY ("goods", "sales", num = 10, header = true);\n'
+    ),
+    "display_sorted": (
+        'LOAD ("{sales}", header = true);\n'
+        'DISPLAY ("goods", "sales", num = 10, header = true, sort = ("sales"));\n'
+    ),
+    "display_filter": (
+        'LOAD ("{sales}", header = true);\n'
+        'DISPLAY ("goods", "sales", header = true, filter = (("sales" >= 100 & "goods" = "Paper") | ("sales" = 5)));\n'
+    ),
+    "store_filter": (
+        'LOAD ("{student_scores}", header = true);\n'
+        'STORE ("name", "score", header = true, sort = ("score"), filter = ("score" >= 90), path = "{output}");\n'
+    ),
+    "print_aggregates": (
+        'LOAD ("{sales}", header = true);\n'
+        'PRINT ("The maximum sales: ", MAX("sales"));\n'
+        'PRINT ("The minimum sales: ", MIN("sales"));\n'
+        'PRINT ("The total sales: ", SUM("sales"));\n'
+        'PRINT ("The total number of goods: ", COUNT("goods"));\n'
+    ),
+    "student_average": (
+        'LOAD ("{student_scores}", header = true);\n'
+        'DISPLAY ("name", "score", num = 5, header = true);\n'
+        'PRINT ("The average score: ", AVERAGE("score"));\n'
+    ),
+    "matrix_columns": (
+        'LOAD ("{matrix}", header = false, tag = "batch1");\n'
+        'DISPLAY (1, 2, header = false, sort = (2), tag = "batch1");\n'
+    ),
+    "merge_save": (
+        'LOAD ("{sales}", header = true, tag = "batch1");\n'
+        'LOAD ("{sales1}", header = true, tag = "batch2");\n'
+        'MERGE ("batch1", "batch2", save = true, path = "{output}");\n'
+        'PRINT ("The total sales of batch 1: ", SUM("sales"), tag = "batch1");\n'
+    ),
+    "remove_rows": (
+        'LOAD ("{scratch}", header = true);\n'
+        'REMOVE (("Abhishek", "20", "24"), ("Darren", "13", "22"));\n'
+    ),
+}
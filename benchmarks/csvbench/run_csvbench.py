@@ -0,0 +1,132 @@
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from queries import queries
+
+repository = os.path.abspath(os.path.join(sys.path[0], '..', '..'))
+
+# every backend is a command line that runs one .csvlang program
+backends = {
+    "code_generator": [sys.executable, os.path.join(repository, "code_generator.py")],
+    "optimised_code_generator": [sys.executable, os.path.join(repository, "optimised_code_generator.py")],
+    "plan_interpreter": [sys.executable, os.path.join(repository, "plan_interpreter.py")],
+    "plan_interpreter_streaming": [sys.executable, os.path.join(repository, "plan_interpreter.py"),
+                                   "--chunk-rows", "100000"],
+}
+
+
+datasets = ["sales", "sales1", "student_scores", "matrix"]
+
+
+def generate(directory, rows, seed):
+    # the data is generated in a child process: a forked child starts with the RSS high-water mark of its parent, so
+    # the runner itself must never load numpy or pandas, or every query would report at least their memory
+    subprocess.run([sys.executable, os.path.join(sys.path[0], "generate_data.py"), "--rows", str(rows),
+                    "--seed", str(seed), "--data", directory], stdout=subprocess.DEVNULL, check=True)
+    return {name: os.path.join(directory, f"{name}_{rows}.csv") for name in datasets}
+
+
+def percentile(sorted_values, percent):
+    # nearest rank, which stays meaningful for a handful of runs
+    return sorted_values[max(0, math.ceil(percent / 100 * len(sorted_values)) - 1)]
+
+
+def run_once(command, paths, timeout):
+    # returns (seconds, peak RSS in bytes, exit code, stderr); os.wait4 gives the resource usage of this one
+    # child, so the RSS of earlier runs does not leak into it
+    shutil.copy(paths["student_scores"], paths["scratch"])
+    if os.path.exists(paths["output"]):
+        os.remove(paths["output"])
+
+    with tempfile.TemporaryFile() as stderr:
+        start = time.perf_counter()
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=stderr, cwd=repository)
+        timer = threading.Timer(timeout, process.kill)
+        timer.start()
+        _, status, usage = os.wait4(process.pid, 0)
+        seconds = time.perf_counter() - start
+        timer.cancel()
+        process.returncode = os.waitstatus_to_exitcode(status)
+        stderr.seek(0)
+        error = stderr.read().decode(errors="replace").strip()
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+    return seconds, peak_rss, process.returncode, error
+
+
+def run_query(backend, query, rows, paths, work_directory, repeat, timeout):
+    program = os.path.join(work_directory, f"{query}_{rows}.csvlang")
+    with open(program, "w") as file:
+        file.write(queries[query].format(**paths))
+    command = backends[backend] + [program]
+
+    # the first run compiles the program into __csvcache__, like the first of a scheduler's runs
+    run_once(command, paths, timeout)
+    runs = [run_once(command, paths, timeout) for _ in range(repeat)]
+
+    failures = [(code, error) for seconds, peak_rss, code, error in runs if code != 0]
+    if failures:
+        code, error = failures[0]
+        return {"backend": backend, "query": query, "rows": rows, "error": error.splitlines()[-1] if error
+                else f"exit code {code}"}
+
+    latencies = sorted(seconds for seconds, peak_rss, code, error in runs)
+    p50 = percentile(latencies, 50)
+    return {"backend": backend, "query": query, "rows": rows, "runs": len(runs),
+            "p50_seconds": p50, "p90_seconds": percentile(latencies, 90), "p99_seconds": percentile(latencies, 99),
+            "rows_per_second": rows / p50, "peak_rss_bytes": max(peak_rss for seconds, peak_rss, code, error in runs)}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description = "CSVBench: end-to-end latency, throughput and memory per query")
+    arg_parser.add_argument("--rows", type = int, nargs = "+", default = [1000, 10000, 100000])
+    arg_parser.add_argument("--queries", nargs = "+", choices = list(queries), default = list(queries))
+    arg_parser.add_argument("--backends", nargs = "+", choices = list(backends), default = list(backends))
+    arg_parser.add_argument("--repeat", type = int, default = 5)
+    arg_parser.add_argument("--timeout", type = float, default = 600.0, help = "Seconds before a run is killed")
+    arg_parser.add_argument("--seed", type = int, default = 0)
+    arg_parser.add_argument("--data", default = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+    arg_parser.add_argument("--output", default = "csvbench.json")
+
+    args = arg_parser.parse_args()
+
+    work_directory = tempfile.mkdtemp()
+    results = []
+    print(f"{'backend':>25} {'query':>17} {'rows':>9} {'p50 s':>8} {'p90 s':>8} {'p99 s':>8} {'rows/s':>11} "
+          f"{'peak RSS MB':>11}")
+    try:
+        for rows in args.rows:
+            paths = generate(args.data, rows, args.seed)
+            paths["scratch"] = os.path.join(work_directory, "scratch.csv")
+            paths["output"] = os.path.join(work_directory, "output.csv")
+            for backend in args.backends:
+                for query in args.queries:
+                    result = run_query(backend, query, rows, paths, work_directory, args.repeat, args.timeout)
+                    results.append(result)
+                    if "error" in result:
+                        print(f"{backend:>25} {query:>17} {rows:>9} failed: {result['error']}")
+                        continue
+                    print(f"{backend:>25} {query:>17} {rows:>9} {result['p50_seconds']:>8.3f} "
+                          f"{result['p90_seconds']:>8.3f} {result['p99_seconds']:>8.3f} "
+                          f"{result['rows_per_second']:>11.0f} {result['peak_rss_bytes'] / 1024 / 1024:>11.1f}")
+    finally:
+        shutil.rmtree(work_directory)
+
+    with open(args.output, "w") as file:
+        json.dump({"python": sys.version, "platform": platform.platform(), "seed": args.seed, "repeat": args.repeat,
+                   "results": results}, file, indent = 2)
+    print(f"\nwrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+# synthetic CSVLang programs for the benchmarks, built by cycling through statements modelled on sample_programs/
+
+statement_templates = [
+    'LOAD ("csv_files/sales.csv", header = true, tag = "batch{i}");',
+    'DISPLAY ("goods", "sales", num = {n}, header = true, sort = ("goods"), tag = "batch{i}");',
+    'DISPLAY ("goods", "sales" + {n}, header = true, filter = (("sales" >= {n} & "goods" = "Paper") | ("sales" = 5)));',
+    'STORE ("goods", "sales", num = {n}, header = true, path = "csv_files/out{i}.csv", tag = "batch{i}");',
+    'PRINT ("The total sales of batch {i}: ", SUM("sales"), tag = "batch{i}");',
+    'PRINT ("The maximum sales: ", MAX("sales"));',
+    'MERGE ("batch{i}", "batch{i}", save = false);',
+    'DISPLAY (1, 2, 3, header = false, sort = (2));',
+]
+
+
+def synthetic_statements(count):
+    for i in range(count):
+        template = statement_templates[i % len(statement_templates)]
+        yield template.format(i = i // len(statement_templates), n = 1 + i % 97)
+
+
+def synthetic_program(statements):
+    return "\n".join(synthetic_statements(statements)) + "\n"
+
+
+def synthetic_program_of_size(size_in_bytes):
+    lines = []
+    size = 0
+    for statement in synthetic_statements(size_in_bytes):
+        lines.append(statement)
+        size += len(statement) + 1
+        if size >= size_in_bytes:
+            break
+    return "\n".join(lines) + "\n"
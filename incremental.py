@@ -0,0 +1,96 @@
+import re
+
+from parser import ASTNode, LexicalError, Parser, lazy_tokens
+from scanner import ERROR, tokenize
+
+
+# a statement ends at the first ";" outside of a string; an unclosed string runs to the end of the source,
+# exactly as it does in the scanner
+statement_pattern = re.compile(r'[^";]*(?:"[^"]*"?[^";]*)*;?')
+
+
+def split_statements(source_code):
+    return [statement for statement in statement_pattern.findall(source_code) if statement]
+
+
+class ParsedStatement:
+    __slots__ = ("nodes", "lines", "lexical_errors", "errors")
+
+    def __init__(self, nodes, lines, lexical_errors, errors):
+        self.nodes = nodes # statement nodes parsed from the chunk (one for a valid statement)
+        self.lines = lines # how far the chunk moves the parser's line counter
+        self.lexical_errors = lexical_errors
+        self.errors = errors
+
+
+def parse_statement_source(statement, first_line = 1):
+    scan = tokenize(statement)
+    lexical_errors = []
+    parser = Parser(lazy_tokens(scan, lexical_errors))
+    parser.current_line = first_line
+
+    try:
+        program = parser.parse_program()
+    except LexicalError:
+        lexical_errors.extend(lexeme for token_class, lexeme, line, column in scan if token_class == ERROR)
+        return ParsedStatement([], 0, lexical_errors, [])
+
+    return ParsedStatement(list(program.children), parser.current_line - first_line, [], parser.errors)
+
+
+class IncrementalParser:
+    # re-lexes and re-parses only the statements whose text changed since the previous update(); CSVLang
+    # statements are independent at parse time, so the cached statement nodes are spliced into a new PROGRAM
+    def __init__(self):
+        self.cache = {}
+        self.ast = None
+        self.is_success = True
+        self.errors = []
+        self.lexical_errors = []
+        self.reparsed = 0
+
+    def update(self, source_code):
+        cache = {}
+        nodes = []
+        errors = []
+        lexical_errors = []
+        line = 1
+        self.reparsed = 0
+
+        offset = 0
+
+        for statement in split_statements(source_code):
+            parsed = cache.get(statement) or self.cache.get(statement)
+            if parsed is None:
+                parsed = parse_statement_source(statement, line)
+                self.reparsed += 1
+                if parsed.errors and not lexical_errors:
+                    # error recovery may skip past the ";", so the rest of the source is parsed as one piece to
+                    # report the same errors as a full parse; only valid statements are reused
+                    parsed = parse_statement_source(source_code[offset:], line)
+                    nodes.extend(parsed.nodes)
+                    errors.extend(parsed.errors)
+                    lexical_errors.extend(parsed.lexical_errors)
+                    break
+                if not parsed.errors and not parsed.lexical_errors:
+                    cache[statement] = parsed
+            else:
+                cache[statement] = parsed
+            offset += len(statement)
+            nodes.extend(parsed.nodes)
+            errors.extend(parsed.errors)
+            lexical_errors.extend(parsed.lexical_errors)
+            line += parsed.lines
+
+        self.cache = cache
+        self.errors = errors
+        self.lexical_errors = lexical_errors
+        self.is_success = not errors and not lexical_errors
+        self.ast = None if lexical_errors else ASTNode("PROGRAM", children=nodes)
+        return self.ast, lexical_errors
+
+    def report_errors(self):
+        if self.errors:
+            print(f'\nSyntax Error(s) Found:\n')
+            for error in self.errors:
+                print(error)
@@ -1,387 +1,575 @@
-import argparse
-import sys
-
-from parser import Token, Parser
-from scanner import scanner
-
-
-import_flag = False
-
-aggr_methods = {
-    "average": "mean",
-    "sum": "sum",
-    "max": "max",
-    "min": "min",
-    "count": "nunique"
+import math
+
+import plan_generator
+from plan import Aggregate, Aggregates, AppendRows, Bind, ColumnExpr, Concat, CreateFile, DeleteFile, DeleteRows, \
+    Derive, Display, Filter, Fused, Limit, MergeFiles, Prefetch, Prefetched, Print, Program, Project, Ref, Scan, \
+    Shared, Sort, Statement, TopN, Write, base_tag, condition_columns, relations, remove_dead_loads, rule_pass, \
+    same_file, transform
+
+
+def reuse_loaded_files(program):
+    # a LOAD of a file that an earlier LOAD read with the same header binds the DataFrame that is already in memory,
+    # as long as neither the file nor that tag has been changed in between
+    loaded = {}
+    statements = []
+    for statement in program.statements:
+        steps = []
+        for step in statement.steps:
+            if statement.kind == "LOAD-STMT" and isinstance(step.relation, Scan):
+                key = (step.relation.path, step.relation.header)
+                if key in loaded:
+                    step = Bind(step.tag, Ref(loaded[key]))
+                for other_key in [other_key for other_key, tag in loaded.items() if tag == step.tag]:
+                    del loaded[other_key]
+                if isinstance(step.relation, Scan):
+                    loaded[key] = step.tag
+            elif isinstance(step, (Bind, DeleteRows)):
+                loaded = {key: tag for key, tag in loaded.items() if tag != step.tag}
+            if isinstance(step, (Write, MergeFiles, AppendRows, DeleteRows, CreateFile, DeleteFile)):
+                loaded = {key: tag for key, tag in loaded.items() if not same_file(key[0], step.path)}
+            steps.append(step)
+        statements.append(Statement(statement.kind, steps))
+    return Program(statements)
+
+def copy_merged_files(program):
+    # a MERGE with save = true of tags that still hold their files as a LOAD with a header (or the read after an ADD)
+    # read them copies the files, and only parses them when their headers differ. The files must not have been
+    # written since they were read (through any spelling of their paths), nor the tags changed by REMOVE. A LOAD that
+    # nothing else reads is then removed
+    scanned = {} # tag -> the path it was read from
+    statements = []
+    for statement in program.statements:
+        steps = []
+        for step in statement.steps:
+            if isinstance(step, Write) and isinstance(step.relation, Concat) and step.relation.relations \
+                    and all(isinstance(item, Ref) and item.tag in scanned for item in step.relation.relations):
+                paths = [scanned[item.tag] for item in step.relation.relations]
+                if not any(same_file(step.path, path) for path in paths):
+                    step = MergeFiles(paths, step.path)
+            if isinstance(step, Bind):
+                if isinstance(step.relation, Scan) and step.relation.header and step.relation.columns is None:
+                    scanned[step.tag] = step.relation.path
+                else:
+                    scanned.pop(step.tag, None)
+            elif isinstance(step, DeleteRows):
+                scanned.pop(step.tag, None)
+            if isinstance(step, (Write, MergeFiles, AppendRows, DeleteRows, CreateFile, DeleteFile)):
+                scanned = {tag: path for tag, path in scanned.items() if not same_file(path, step.path)}
+            steps.append(step)
+        statements.append(Statement(statement.kind, steps))
+    return Program(statements)
+
+def filter_before_sort(node):
+    # the filter mask only needs the rows, not their order, so it is applied first and only the rows that pass are
+    # sorted; the sort is stable, so rows with equal keys stay in file order, whichever rows were dropped. A sort
+    # without keys only copies the DataFrame and is removed
+    if isinstance(node, Sort) and not node.keys:
+        return node.input
+    if isinstance(node, Filter) and isinstance(node.input, Sort):
+        sort = node.input
+        return sort.replace(input=node.replace(input=sort.input))
+    return None
+
+arithmetic_operators = {
+    '+': lambda a, b: a + b,
+    '-': lambda a, b: a - b,
+    '*': lambda a, b: a * b,
+    '/': lambda a, b: a / b,
+    '%': lambda a, b: a % b,
 }
 
-operator_map = {
-    '<>': '!=',
-    '=': '==',
+comparison_operators = {
+    '=': lambda a, b: a == b,
+    '<>': lambda a, b: a != b,
+    '<': lambda a, b: a < b,
+    '>': lambda a, b: a > b,
+    '<=': lambda a, b: a <= b,
+    '>=': lambda a, b: a >= b,
 }
 
-path_map = {}
-active_path = ""
-active_tag = "a0"
-declared_tags = []
-declared_paths = {}
-
-def convert_to_shift(expr):
-    num1, num2 = map(int, expr.split('*'))
-
-    shifts = []
-    position = 0
-    while num2 > 0:
-        if num2 & 1:
-            shifts.append(f"({num1} << {position})")
-        num2 >>= 1
-        position += 1
-
-    shift_expr = " + ".join(shifts)
-    return shift_expr
-
-def generate_filter_expression(node, tag):
-    res = []
-    for i, child in enumerate(node.children):
-        if child.node_type == 'CONDITION':
-            res.append(generate_filter_expression(child, tag))
-        elif child.node_type == 'COLUMN':
-            if i > 0 and node.children[i - 1].node_type == 'OPERATOR':
-                res.append(child.value)
-            else:
-                res.append(f'{tag}[{child.value}]')
-        elif child.node_type == 'OPERATOR':
-            res.append(operator_map[child.value]
-               if operator_map.keys().__contains__(child.value)
-               else child.value)
-        elif child.node_type == 'NUMBER':
-            res.append(child.value)
-
-    return process_sub_expression(res)
-
-def process_sub_expression(sub_expression):
-    if isinstance(sub_expression, str):
-        return sub_expression
-
-    if isinstance(sub_expression, list):
-        if len(sub_expression) == 3 and sub_expression[1] in '+-/%*':
-            if sub_expression[1] == '*':
-                return str(convert_to_shift(f"{sub_expression[0]} {sub_expression[1]} {sub_expression[2]}"))
-            else:
-                return str(eval(f"{sub_expression[0]} {sub_expression[1]} {sub_expression[2]}"))
-        elif len(sub_expression) == 3 and isinstance(sub_expression[1], str) and sub_expression[1] in ['&', '|']:
-            left_expr = process_sub_expression(sub_expression[0])
-            operator = sub_expression[1]
-            right_expr = process_sub_expression(sub_expression[2])
-            return f"({left_expr} {operator} {right_expr})"
-        else:
-            sub_expressions = [process_sub_expression(item) for item in sub_expression]
-            return f"({' '.join(sub_expressions)})"
-
-def generate_python_code(node):
-    global import_flag
-    global active_path
-    global active_tag
-    code = ""
-
-    if node.node_type == "PROGRAM":
-        for child in node.children:
-            code += generate_python_code(child) + "\n"
-
-    elif node.node_type == "LOAD-STMT":
-        path = ""
-        header = ""
-        tag = "a0"
-
-        if not import_flag:
-            code += f"from pathlib import Path\n"
-            code += f"import pandas as pd\n\n"
-            import_flag = True
-
-        for child in node.children:
-            if child is None: continue
-            if child.node_type == "PATH":
-                path = child.value
-            elif child.node_type == "HEADER-ATTR":
-                header = f"{child.children[2].value}"
-            elif child.node_type == "TAG-ATTR":
-                tag = f"{child.children[2].value[1:-1]}"
-                path_map[tag] = path
-
-        active_path = path
-        active_tag = tag
-        declared_tags.append(tag)
-
-        if declared_paths.keys().__contains__(path) and declared_paths[path]['header'] == header:
-            code += f"{tag} = {declared_paths[path]['tag']}"
+# the comparison with its operands swapped
+mirrored_comparisons = {'=': '=', '<>': '<>', '<': '>', '>': '<', '<=': '>=', '>=': '<='}
+
+def number_value(node):
+    # the int or float of a NUMBER node (folding can make floats and negative numbers), or None for other nodes
+    if node.node_type != 'NUMBER':
+        return None
+    return float(node.value) if any(character in node.value for character in '.e') else int(node.value)
+
+def number_node(value):
+    from parser import ASTNode
+    return ASTNode("NUMBER", value=repr(value))
+
+def condition_node(*children):
+    from parser import ASTNode
+    return ASTNode("CONDITION", children=children)
+
+def operator_node(operator):
+    from parser import ASTNode
+    return ASTNode("OPERATOR", value=operator)
+
+def is_column_expression(node):
+    # an operand that reads a column wherever it stands: arithmetic on a column, or a column in a CONDITION of its own
+    # (a bare COLUMN right of an operator is a string)
+    return node.node_type == 'CONDITION'
+
+def fold_operand(node):
+    # folds the constant arithmetic of a comparison operand with Python's int and float semantics, puts constants
+    # right of the column and removes + 0, - 0 and * 1. Rewrites that are only exact for integers, like moving
+    # constants across the comparison, are not made, since the type of a column is not known here
+    if node.node_type != 'CONDITION' or len(node.children) != 3 or node.children[1].value not in arithmetic_operators:
+        return node
+
+    left, operator, right = node.children
+    left = fold_operand(left)
+    right = fold_operand(right)
+    a = number_value(left)
+    b = number_value(right)
+    if a is not None and b is not None:
+        try:
+            value = arithmetic_operators[operator.value](a, b)
+            # a float that overflows has no literal, so it is computed when the program runs
+            if type(value) is int or math.isfinite(value):
+                return number_node(value)
+        except ArithmeticError:
+            # a division by zero still fails when the program runs
+            pass
+    elif a is not None and operator.value in ['+', '*'] and is_column_expression(right):
+        left, right, b = right, left, a
+    if b is not None and type(b) is int and left.node_type in ['COLUMN', 'CONDITION'] \
+            and (operator.value in ['+', '-'] and b == 0 or operator.value == '*' and b == 1):
+        return left if left.node_type == 'CONDITION' else condition_node(left)
+    if left.node_type == 'CONDITION' and len(left.children) == 1:
+        left = left.children[0]
+
+    if left is node.children[0] and right is node.children[2]:
+        return node
+    return condition_node(left, operator, right)
+
+def fold_comparison(node):
+    left, operator, right = node.children
+    left = fold_operand(left)
+    right = fold_operand(right)
+    a = number_value(left)
+    b = number_value(right)
+    if a is not None and b is not None:
+        return node, comparison_operators[operator.value](a, b)
+    if a is not None and is_column_expression(right):
+        left, right = right, left
+        operator = operator_node(mirrored_comparisons[operator.value])
+    if left.node_type == 'CONDITION' and len(left.children) == 1:
+        # a column left of the operator is read as a column without a CONDITION of its own
+        left = left.children[0]
+
+    if left is node.children[0] and operator is node.children[1] and right is node.children[2]:
+        return node, None
+    return condition_node(left, operator, right), None
+
+def range_term(term):
+    # (column, operator, number) of a comparison of a column with a number, or None
+    if term.node_type == 'CONDITION' and len(term.children) == 3 and term.children[0].node_type == 'COLUMN' \
+            and term.children[1].value in comparison_operators:
+        value = number_value(term.children[2])
+        if value is not None:
+            return term.children[0].value, term.children[1].value, value
+    return None
+
+def intersect_ranges(terms):
+    # the comparisons of one column with numbers that together select the rows all of terms select, or None when no
+    # row can pass. A missing value fails every comparison but <>, which the result keeps while it matters
+    lower = upper = equal = None
+    excluded = []
+    for term in terms:
+        column, operator, value = range_term(term)
+        if operator in ['>', '>=']:
+            if lower is None or value > lower[1] or value == lower[1] and operator == '>':
+                lower = (operator, value, term)
+        elif operator in ['<', '<=']:
+            if upper is None or value < upper[1] or value == upper[1] and operator == '<':
+                upper = (operator, value, term)
+        elif operator == '=':
+            if equal is not None and value != equal[1]:
+                return None
+            equal = equal or (operator, value, term)
         else:
-            declared_paths[path] = {'header': header, 'tag': tag}
-            code += f"{tag} = pd.read_csv({path}, header={'[0]' if header == 'true' else 'None'})"
-
-    elif node.node_type == "DISPLAY-STMT":
-        columns = []
-        num = None
-        sort_columns = []
-        filter_cond = None
-        tag = active_tag
-        col_index_flag = False
-        sort_col_index_flag = False
-
-        for child in node.children:
-            if child is None: continue
-            if child.node_type == "COLUMN-LIST" or child.node_type == "COL-INDEX-LIST":
-                if child.node_type == "COL-INDEX-LIST": col_index_flag = True
-                for val in child.children:
-                    if val.node_type == "COLUMN-EXPR" or val.node_type == "COL-INDEX-EXPR":
-                        code += f'a1 = {active_tag if tag != "a1" else tag}.copy()'
-                        code += (f'\na1[{val.children[0].value if val.node_type == "COLUMN-EXPR" else int(val.children[0].value) - 1}] = '
-                                 f'a1[{val.children[0].value if val.node_type == "COLUMN-EXPR" else int(val.children[0].value) - 1}] {val.children[1].value} {val.children[2].value}\n')
-                        tag = 'a1'
-                columns = [col.value.strip('"') if col.node_type == 'COLUMN' or col.node_type == 'COL-INDEX' else
-                        col.children[0].value.strip('"')for col in child.children]
-            elif child.node_type == "NUM-ATTR":
-                num = child.children[2].value
-            elif child.node_type == "SORT-ATTR":
-                if child.children[2].node_type == 'COL-INDEX-LIST':
-                    sort_col_index_flag = True
-                    sort_columns = [int(col.value)-1 for col in child.children[2].children]
-                else:
-                    sort_columns = [col.value.strip('"') for col in child.children[2].children]
-            elif child.node_type == "FILTER-ATTR":
-                filter_cond = child.children[2]
-            elif child.node_type == "TAG-ATTR":
-                tag = f"{child.children[2].value[1:-1]}" if tag != 'a1' else 'a1'
-
-        if sort_col_index_flag:
-            sort_columns = f'[{tag}.columns[i] for i in {sort_columns}]'
-
-        if filter_cond is None:
-            if num is None:
-                code += f'a4 = ({tag}.sort_values(by={sort_columns}))'
+            excluded.append((operator, value, term))
+
+    def admits(value):
+        return (lower is None or comparison_operators[lower[0]](value, lower[1])) and \
+            (upper is None or comparison_operators[upper[0]](value, upper[1]))
+
+    if equal is None and lower is not None and upper is not None and lower[1] == upper[1]:
+        if lower[0] == '>' or upper[0] == '<':
+            return None
+        equal = ('=', lower[1], condition_node(terms[0].children[0], operator_node('='), lower[2].children[2]))
+    if equal is not None:
+        if not admits(equal[1]) or any(value == equal[1] for operator, value, term in excluded):
+            return None
+        return [equal[2]]
+    if lower is not None and upper is not None and lower[1] > upper[1]:
+        return None
+
+    kept = {}
+    for operator, value, term in excluded:
+        if admits(value) and value not in kept:
+            kept[value] = term
+    return [bound[2] for bound in [lower, upper] if bound is not None] + list(kept.values())
+
+def unite_ranges(terms):
+    # the comparisons of one column with numbers that together select the rows any of terms selects: the weakest
+    # lower and upper bounds, and the equalities they do not cover. Terms with <> are left as they are
+    if any(range_term(term)[1] == '<>' for term in terms):
+        return terms
+
+    lower = upper = None
+    equal = {}
+    for term in terms:
+        column, operator, value = range_term(term)
+        if operator in ['>', '>=']:
+            if lower is None or value < lower[1] or value == lower[1] and operator == '>=':
+                lower = (operator, value, term)
+        elif operator in ['<', '<=']:
+            if upper is None or value > upper[1] or value == upper[1] and operator == '<=':
+                upper = (operator, value, term)
+        elif value not in equal:
+            equal[value] = term
+
+    def covers(value):
+        return any(bound is not None and comparison_operators[bound[0]](value, bound[1]) for bound in [lower, upper])
+
+    return [bound[2] for bound in [lower, upper] if bound is not None] + \
+        [term for value, term in equal.items() if not covers(value)]
+
+def merge_ranges(terms, logical):
+    # merges the comparisons of each column with numbers into the place of the first of them; None when the
+    # conjunction can select no row
+    columns = {}
+    for term in terms:
+        compared = range_term(term)
+        if compared is not None:
+            columns.setdefault(compared[0], []).append(term)
+
+    merged = []
+    for term in terms:
+        compared = range_term(term)
+        if compared is None or len(columns[compared[0]]) == 1:
+            merged.append(term)
+        elif columns[compared[0]][0] is term:
+            column_terms = intersect_ranges(columns[compared[0]]) if logical == '&' \
+                else unite_ranges(columns[compared[0]])
+            if column_terms is None:
+                return None
+            merged.extend(column_terms)
+    return merged
+
+def is_constant_arithmetic(node):
+    return node.node_type == 'CONDITION' and len(node.children) == 3 \
+        and node.children[1].value in arithmetic_operators \
+        and all(child.node_type == 'NUMBER' or is_constant_arithmetic(child) for child in node.children[::2])
+
+def holds_unfolded_constant(node):
+    # whether a condition still has arithmetic on numbers alone, which fold_operand() leaves when it cannot fold it
+    if node.node_type != 'CONDITION':
+        return False
+    return is_constant_arithmetic(node) or any(holds_unfolded_constant(child) for child in node.children)
+
+def fold_logical(node):
+    logical = node.children[1].value
+    if any(child.node_type != 'CONDITION' for child in node.children[::2]):
+        # a bare operand is a column first and a string after an operator, so its place cannot change
+        return node, None
+
+    folded = [fold_condition(child) for child in node.children[::2]]
+    # constant arithmetic left for the program, like 1 / 0, may fail when it runs, so the terms that hold it are
+    # never dropped by deciding the whole condition here
+    decidable = not any(holds_unfolded_constant(term) for term, truth in folded)
+    terms = []
+    for term, truth in folded:
+        if truth is None:
+            if len(term.children) >= 3 and term.children[1].value == logical \
+                    and all(item.node_type == 'CONDITION' for item in term.children[::2]):
+                terms.extend(term.children[::2])
             else:
-                code += f'a4 = ({tag}.sort_values(by={sort_columns}).head({num}))'
+                terms.append(term)
+        elif truth == (logical == '|'):
+            # a term that is always true decides an |, one that is always false an &
+            if decidable:
+                return node, truth
+            terms.append(term)
+
+    merged = merge_ranges(terms, logical)
+    if merged is None and decidable:
+        return node, False
+    terms = terms if merged is None else merged
+    if not terms:
+        return node, logical == '&'
+    if len(terms) == 1:
+        return terms[0], None
+    if len(terms) * 2 - 1 == len(node.children) and all(term is child for term, child in
+                                                        zip(terms, node.children[::2])):
+        return node, None
+    children = [terms[0]]
+    for term in terms[1:]:
+        children += [node.children[1], term]
+    return condition_node(*children), None
+
+def fold_condition(node):
+    # returns the simplified condition, and True or False when it holds for every row or for none of them
+    if node.node_type != 'CONDITION':
+        return node, None
+    if len(node.children) >= 3 and node.children[1].value in ['&', '|']:
+        return fold_logical(node)
+    if len(node.children) == 3 and node.children[1].value in comparison_operators:
+        return fold_comparison(node)
+    return node, None
+
+def simplify_filters(node):
+    # a filter that holds for every row is removed, and one that holds for none keeps no rows without computing a
+    # mask; the others are folded and their comparisons of a column with numbers merged
+    if not isinstance(node, Filter):
+        return None
+    condition, truth = fold_condition(node.condition)
+    if truth is True:
+        return node.input
+    elif truth is False:
+        return Limit(node.input, 0)
+    return None if condition is node.condition else node.replace(condition=condition)
+
+def relation_columns(node):
+    # the columns of its base tag a relation reads, or None when it needs all of them
+    if isinstance(node, (Project, Sort, TopN)):
+        if node.by_index:
+            return None
+        return node.columns if isinstance(node, Project) else node.keys
+    elif isinstance(node, (ColumnExpr, Aggregate)):
+        return None if node.by_index else [node.column]
+    elif isinstance(node, Derive):
+        return None if any(expression[3] for expression in node.expressions) \
+            else [expression[0] for expression in node.expressions]
+    elif isinstance(node, Filter):
+        return list(condition_columns(node.condition))
+    return []
+
+def prune_loaded_columns(program):
+    # a LOAD with a header only parses the columns that the rest of the program reads from its DataFrame. Column
+    # positions, MERGE, REMOVE (which writes every column back) and a tag whose columns are never read keep every column
+    loads = {} # tag -> the LOAD its DataFrame comes from, as (statement, step)
+    columns = {} # LOAD -> {column: None} in order of first use, or None for every column
+
+    def use(tag, used):
+        load = loads.get(tag)
+        if load is None or columns[load] is None:
+            return
+        if used is None:
+            columns[load] = None
         else:
-            if num is None:
-                code += (f'a4 = ({tag}.sort_values(by={sort_columns}).loc['
-                         f'{generate_filter_expression(filter_cond, tag)}])')
-            else:
-                code += (f'a4 = ({tag}.sort_values(by={sort_columns}).loc['
-                         f'{generate_filter_expression(filter_cond, tag)}].head'
-                         f'({num}))')
-
-        code += f'\nprint(a4.loc[:, {columns}])' if col_index_flag == False\
-            else f'\nprint(a4.iloc[:, {[int(col)-1 for col in columns]}])'
-        code += "\nprint("")"
-
-    elif node.node_type == "STORE-STMT":
-        columns = []
-        num = None
-        sort_columns = []
-        filter_cond = None
-        tag = active_tag
-        col_index_flag = False
-        path = ""
-
-        for child in node.children:
-            if child is None: continue
-            if child.node_type == "COLUMN-LIST" or child.node_type == "COL-INDEX-LIST":
-                if child.node_type == "COL-INDEX-LIST": col_index_flag = True
-                for val in child.children:
-                    if val.node_type == "COLUMN-EXPR" or val.node_type == "COL-INDEX-EXPR":
-                        code += f'a1 = {active_tag if tag != "a1" else tag}.copy()'
-                        code += (
-                            f'\na1[{val.children[0].value if val.node_type == "COLUMN-EXPR" else int(val.children[0].value) - 1}] = '
-                            f'a1[{val.children[0].value if val.node_type == "COLUMN-EXPR" else int(val.children[0].value) - 1}] {val.children[1].value} {val.children[2].value}\n')
-                        tag = 'a1'
-                columns = [
-                    col.value.strip('"') if col.node_type == 'COLUMN' or col.node_type == 'COL-INDEX' else col.children[
-                        0].value.strip('"') for col in child.children]
-            elif child.node_type == "NUM-ATTR":
-                num = child.children[2].value
-            elif child.node_type == "SORT-ATTR":
-                sort_columns = [col.value.strip('"') for col in child.children[2].children]
-            elif child.node_type == "FILTER-ATTR":
-                filter_cond = child.children[2]
-            elif child.node_type == "TAG-ATTR":
-                tag = f"{child.children[2].value[1:-1]}" if tag != 'a1' else 'a1'
-            elif child.node_type == "PATH-ATTR":
-                path = child.children[2].value
-
-        if filter_cond is None:
-            if num is None:
-                code += f'a4 = ({tag}.sort_values(by={sort_columns}))'
-            else:
-                code += f'a4 = ({tag}.sort_values(by={sort_columns}).head({num}))'
-        else:
-            if num is None:
-                code += (f'a4 = ({tag}.sort_values(by={sort_columns}).loc['
-                         f'{generate_filter_expression(filter_cond, tag)}])')
+            columns[load].update(dict.fromkeys(used))
+
+    for i, statement in enumerate(program.statements):
+        for j, step in enumerate(statement.steps):
+            if isinstance(step, (Display, Write)) and not isinstance(step.relation, Project):
+                use(base_tag(step.relation), None)
+            elif isinstance(step, DeleteRows):
+                use(step.tag, None)
+            for node in relations(step):
+                if isinstance(node, Concat):
+                    for relation in node.relations:
+                        use(base_tag(relation), None)
+                else:
+                    use(base_tag(node), relation_columns(node))
+
+            if isinstance(step, Bind):
+                if isinstance(step.relation, Ref):
+                    loads[step.tag] = loads.get(step.relation.tag)
+                elif isinstance(step.relation, Scan):
+                    loads[step.tag] = (i, j)
+                    columns[(i, j)] = {} if step.relation.header else None
+                else:
+                    loads.pop(step.tag, None)
+
+    statements = [Statement(statement.kind, list(statement.steps)) for statement in program.statements]
+    for (i, j), used in columns.items():
+        if used:
+            step = statements[i].steps[j]
+            statements[i].steps[j] = step.replace(relation=step.relation.replace(columns=list(used)))
+    return Program(statements)
+
+def reads_derived_columns(node, derive):
+    # whether a Filter, Sort or TopN reads a column the Derive below it rewrites; a name and a position may be the
+    # same column, so they are assumed to be
+    names = {column for column, operator, operand, by_index in derive.expressions if not by_index}
+    positions = {column for column, operator, operand, by_index in derive.expressions if by_index}
+    if isinstance(node, Filter):
+        return bool(positions or names.intersection(condition_columns(node.condition)))
+    elif isinstance(node, (Sort, TopN)):
+        return bool(names or positions.intersection(node.keys)) if node.by_index \
+            else bool(positions or names.intersection(node.keys))
+    return False
+
+def lift_column_expressions(node):
+    # the column expressions of a DISPLAY or STORE become one Derive, which is moved above the filter, sort and num
+    # that do not read its columns, so only the rows that are shown or stored are computed
+    if isinstance(node, ColumnExpr):
+        expression = (node.column, node.operator, node.operand, node.by_index)
+        if isinstance(node.input, Derive):
+            return node.input.replace(expressions=node.input.expressions + [expression])
+        return Derive(node.input, [expression])
+    if isinstance(node, (Filter, Sort, TopN, Limit)) and isinstance(node.input, Derive) \
+            and not reads_derived_columns(node, node.input):
+        lifted = node.replace(input=node.input.input)
+        return node.input.replace(input=lift_column_expressions(lifted) or lifted)
+    return None
+
+def filter_by_terms(node):
+    # a conjunction is computed by runtime.filter_mask(), which evaluates its most selective terms first and the
+    # others only on the rows they keep. Once no row is left it skips the rest, so a condition with constant
+    # arithmetic that folding left for the program, like 10 % 0, is computed whole and still fails
+    if isinstance(node, Filter) and not node.by_terms and not holds_unfolded_constant(node.condition):
+        return node.replace(by_terms=True)
+    return None
+
+def limit_sort_to_top_n(node):
+    # num with sort only keeps the first rows, which top_n() finds without sorting the whole table
+    if isinstance(node, Limit) and isinstance(node.input, Sort) and node.input.keys:
+        sort = node.input
+        return TopN(sort.input, sort.keys, node.count, sort.by_index)
+    return None
+
+def reuse_shared_results(program):
+    # a DISPLAY or STORE that computes the same rows as the previous one, from a tag that has not been bound again
+    # (by LOAD or ADD) or changed by REMOVE since, reuses them
+    previous = None
+    statements = []
+    for statement in program.statements:
+        steps = []
+        for step in statement.steps:
+            if isinstance(step, (Display, Write)) and isinstance(step.relation, Project):
+                if step.relation.input == previous:
+                    step = step.replace(relation=step.relation.replace(input=Shared(previous)))
+                else:
+                    previous = step.relation.input
+            elif isinstance(step, (Bind, DeleteRows)) and previous is not None and base_tag(previous) == step.tag:
+                previous = None
+            steps.append(step)
+        statements.append(Statement(statement.kind, steps))
+    return Program(statements)
+
+def fuse_aggregates(program):
+    # the PRINT aggregates of a tag are computed into a3 together, at the first of them, until LOAD, ADD or REMOVE
+    # changes the tag or a PRINT aggregate of another tag needs a3
+    groups = []
+    group = None
+    group_tag = None
+    for i, statement in enumerate(program.statements):
+        for j, step in enumerate(statement.steps):
+            if isinstance(step, Print) and isinstance(step.aggregate, Aggregate):
+                tag = base_tag(step.aggregate)
+                if group is None or tag != group_tag:
+                    group = []
+                    group_tag = tag
+                    groups.append(group)
+                group.append((i, j))
+            elif isinstance(step, (Bind, DeleteRows)) and step.tag == group_tag:
+                group = None
+                group_tag = None
+
+    statements = [Statement(statement.kind, list(statement.steps)) for statement in program.statements]
+    for group in groups:
+        if len(group) < 2:
+            continue
+        aggregates = list(dict.fromkeys((step.aggregate.column, step.aggregate.function, step.aggregate.by_index)
+                                        for step in (statements[i].steps[j] for i, j in group)))
+        for i, j in group:
+            aggregate = statements[i].steps[j].aggregate
+            position = aggregates.index((aggregate.column, aggregate.function, aggregate.by_index))
+            statements[i].steps[j] = statements[i].steps[j].replace(aggregate=Fused(aggregate, position))
+        i, j = group[0]
+        first = statements[i].steps[j].aggregate.aggregate
+        statements[i].steps.insert(j, Bind("a3", Aggregates(first.input, aggregates)))
+    return Program(statements)
+
+def select_columns(program):
+    # a DISPLAY or STORE that copies rows by a filter or a full sort first selects the columns it reads, and those
+    # that later DISPLAYs and STOREs reusing its rows show, so the other columns are never copied; a filter selects
+    # the rows and columns at once
+    statements = [Statement(statement.kind, list(statement.steps)) for statement in program.statements]
+    groups = [] # [(statement, step) of a DISPLAY or STORE that computes its rows, {column: None} or None]
+    for i, statement in enumerate(statements):
+        for j, step in enumerate(statement.steps):
+            if not (isinstance(step, (Display, Write)) and isinstance(step.relation, Project)):
+                continue
+            if isinstance(step.relation.input, Shared):
+                group = groups[-1]
             else:
-                code += (f'a4 = ({tag}.sort_values(by={sort_columns}).loc['
-                         f'{generate_filter_expression(filter_cond, tag)}].head'
-                         f'({num}))')
-
-        code += f'\na4.loc[:, {columns}].to_csv({path}, index=False)' if col_index_flag == False else f'\na4.iloc[:, {[int(col) - 1 for col in columns]}].to_csv({path}, index=False)'
-        code += '\nprint("")'
-
-    elif node.node_type == "PRINT-STMT":
-        message = ""
-        tag = active_tag
-        column = ""
-        aggr_method = ""
-
-        for child in node.children:
-            if child is None: continue
-            if child.node_type == "MESSAGE":
-                message = child.value
-            elif child.node_type == "AGGR-FUNC":
-                aggr_func = child.value
-                column = child.children[0]
-                aggr_method = aggr_methods[str(aggr_func).lower()]
-            elif child.node_type == "TAG-ATTR":
-                tag = f"{child.children[2].value[1:-1]}"
-
-        column = column.value if column.node_type == 'COLUMN' else f'{tag}.columns[{column.value}]'
-        code += f"print({message}, {tag}[{column}].{aggr_method}())" if aggr_method else f"print({message})"
-
-    elif node.node_type == "MERGE-STMT":
-        csv_list = []
-        path = ""
-        save = "false"
-
-        for child in node.children:
-            if child is None: continue
-            if child.node_type == "PATH-ATTR":
-                path = child.children[2].value
-            elif child.node_type == "SAVE-ATTR":
-                save = child.children[2].value
-            elif child.node_type == "TAG-LIST":
-                csv_list = [node.value[1:-1] for node in child.children]
-
-        code += f"print(pd.concat([{', '.join(csv_list)}]))\nprint("")" \
-            if save == "false" else f"pd.concat([{', '.join(csv_list)}]).to_csv({path}, index=False)"
-
-    elif node.node_type == "DELETE-STMT":
-        tag = ""
-
-        for child in node.children:
-            if child.node_type == "TAG-ATTR":
-                tag = f"{child.children[2].value[1:-1]}"
-
-        code += f'file_path = Path({path_map[tag]})'
-        code += f'\nfile_path.unlink()'
-
-    elif node.node_type == "CREATE-STMT":
-        path = ""
-
-        for child in node.children:
-            if child.node_type == "PATH":
-                path = child.value
-
-        active_path = path
-        active_tag = 'a0'
-        code += f'open({path}, "w").close()'
-
-    elif node.node_type == "ADD-STMT":
-        cols = []
-
-        for child in node.children[0].children:
-            if child.node_type == "TUPLE":
-                cols.append([child.value for child in child.children])
-
-        code += f'with open({active_path}, "a") as file:'
-        for col in cols:
-            code += f'\n\tfile.write("{",".join([val[1:-1] for val in col])}\\n")'
-
-        code += f"\n{active_tag} = pd.read_csv({active_path}, header=[0])"
-
-    elif node.node_type == "REMOVE-STMT":
-        cols = []
-
-        for child in node.children[0].children:
-            if child.node_type == "TUPLE":
-                cols.append([child.value for child in child.children])
-
-        formatted_cols = [
-            tuple(
-                float(val.strip('"')) if val.strip('"').replace('.', '', 1).isdigit() else val.strip('"')
-                for val in col
-            )
-            for col in cols
-        ]
-
-        code += f'''
-a2 = {active_tag}.apply(lambda row: tuple(row.dropna().values) in {formatted_cols}, axis=1)
-{active_tag} = {active_tag}[~a2]
-{active_tag}.to_csv({active_path}, index=False, header=False)
-        '''
-
-    return code
-
-def optimize_code(code: str):
-    tags_to_be_removed = []
-    for tag in declared_tags:
-        if not(code.__contains__(f'{tag}.') or code.__contains__(f'{tag}[')):
-            tags_to_be_removed.append(tag)
-
-    filtered_code = "\n".join(
-        line for line in code.splitlines()
-        if not any(unwanted_substring in line for unwanted_substring in tags_to_be_removed)
-    )
-    return filtered_code + '\n'
+                pipeline = list(relations(step.relation.input))
+                copies_rows = isinstance(pipeline[0], Ref) and any(isinstance(node, (Filter, Sort)) for node in pipeline)
+                group = [(i, j), dict.fromkeys(step.relation.columns) if copies_rows else None]
+                groups.append(group)
+                for node in pipeline:
+                    used = relation_columns(node)
+                    if used is None:
+                        group[1] = None
+                        break
+                    if group[1] is not None:
+                        group[1].update(dict.fromkeys(used))
+            if step.relation.by_index:
+                group[1] = None
+            elif group[1] is not None:
+                group[1].update(dict.fromkeys(step.relation.columns))
+
+    for (i, j), columns in groups:
+        if columns is not None:
+            step = statements[i].steps[j]
+            selected = transform(step.relation.input,
+                                 lambda node: Project(node, list(columns)) if isinstance(node, Ref) else None)
+            statements[i].steps[j] = step.replace(relation=step.relation.replace(input=selected))
+    return Program(statements)
+
+def prefetch_loads(program):
+    # the files of the LOADs that no earlier statement writes are read on a thread pool from the first of those
+    # LOADs, and each LOAD waits for its own DataFrame. A file written before its LOAD is read at the LOAD. Runs last,
+    # since the other passes rewrite the Scans of LOADs
+    written = []
+    loads = [] # (statement, step) of the LOADs to prefetch
+    for i, statement in enumerate(program.statements):
+        for j, step in enumerate(statement.steps):
+            if statement.kind == "LOAD-STMT" and isinstance(step, Bind) and isinstance(step.relation, Scan) \
+                    and not any(same_file(step.relation.path, path) for path in written):
+                loads.append((i, j))
+            if isinstance(step, (Write, MergeFiles, AppendRows, DeleteRows, CreateFile, DeleteFile)):
+                written.append(step.path)
+    # a single file has nothing to be read with
+    if len(loads) < 2:
+        return program
+
+    statements = [Statement(statement.kind, list(statement.steps)) for statement in program.statements]
+    scans = []
+    for position, (i, j) in enumerate(loads):
+        step = statements[i].steps[j]
+        scans.append(step.relation)
+        statements[i].steps[j] = step.replace(relation=Prefetched(step.relation, position))
+    i, j = loads[0]
+    statements[i].steps.insert(j, Prefetch(scans))
+    return Program(statements)
+
+optimisation_passes = [copy_merged_files, remove_dead_loads, reuse_loaded_files, rule_pass(filter_before_sort),
+                       rule_pass(simplify_filters), rule_pass(lift_column_expressions),
+                       rule_pass(limit_sort_to_top_n), rule_pass(filter_by_terms), reuse_shared_results,
+                       select_columns, fuse_aggregates, prune_loaded_columns, prefetch_loads]
+
+
+def generate_statements(node):
+    return plan_generator.generate_statements(node, optimisation_passes)
+
+def generate_python_code(node):
+    return plan_generator.generate_python_code(node, optimisation_passes)
+
+def compile_source(source_code):
+    return plan_generator.compile_source(source_code, optimisation_passes)
 
 def main():
-    arg_parser = argparse.ArgumentParser(description = "Code Generator for CSV Lang")
-    arg_parser.add_argument("file", help = "Path to the CSV Lang source code")
-
-    args = arg_parser.parse_args()
-
-    # Read the file
-    try:
-        with open(args.file, "r") as file:
-            source_code = file.read()
-    except FileNotFoundError:
-        print(f"\nError: File {args.file} not found.\n")
-        sys.exit(1)
-
-    global path_map
-    global declared_tags
-    global active_path
-    global active_tag
-    global declared_paths
-
-    path_map= {}
-    active_path = ""
-    active_tag = "a0"
-    declared_tags = []
-    declared_paths = {}
-
-    tokens, errors = scanner(source_code)
-
-    if errors is None or len(errors) == 0:
-        scanned_tokens = []
-        for token in tokens:
-            scanned_tokens.append(Token(token[0], token[1]))
-
-        parser = Parser(scanned_tokens)
-
-        ast, is_success = parser.parse()
-        if is_success:
-            global import_flag
-            import_flag = False
-            generated_code = optimize_code(generate_python_code(ast))
-            print("\nGenerated Python Code:\n")
-            print(generated_code)
-
-            print("CSVLang Output\n")
-            exec(generated_code)
-            print("")
-    else:
-        print("\nLexical Errors Found:\n")
-        for error in errors:
-            print(error)
-        print("")
+    plan_generator.main(optimisation_passes, True)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
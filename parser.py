@@ -1,13 +1,22 @@
 import argparse
 import sys
+from array import array
 
-from scanner import scanner
+from scanner import ERROR, tokenize
+
+
+class LexicalError(Exception):
+    pass
 
 
 class Token:
-    def __init__(self, token_type, value):
+    __slots__ = ("token_type", "value", "line", "column")
+
+    def __init__(self, token_type, value, line = None, column = None):
         self.token_type = token_type
         self.value = value
+        self.line = line
+        self.column = column
 
     def __repr__(self):
         return f"Token({self.token_type}, {self.value})"
@@ -17,11 +26,29 @@ class Token:
         return ASTNode(node_type, self.value)
 
 
+# interned node kinds: every node stores a small integer and looks its node_type string up here
+node_types = []
+node_kinds = {}
+
+def node_kind(node_type):
+    kind = node_kinds.get(node_type)
+    if kind is None:
+        kind = node_kinds[node_type] = len(node_types)
+        node_types.append(node_type)
+    return kind
+
+
 class ASTNode:
+    __slots__ = ("kind", "value", "children")
+
     def __init__(self, node_type, value=None, children=None):
-        self.node_type = node_type
+        self.kind = node_kind(node_type)
         self.value = value
-        self.children = children if children else []
+        self.children = tuple(children) if children else () # leaves share the empty tuple
+
+    @property
+    def node_type(self):
+        return node_types[self.kind]
 
     def display_tree(self, indent=0):
         if self.value is None:
@@ -34,12 +61,127 @@ class ASTNode:
                 child.display_tree(indent + 2)
 
 
+class ASTArena:
+    # the whole tree in flat parallel arrays, laid out breadth first so that the children of node i are
+    # the index range first_child[i] : first_child[i] + child_count[i]; missing children (None) get NONE_KIND
+    NONE_KIND = 0xFFFF
+
+    def __init__(self):
+        self.kinds = array("H")
+        self.values = []
+        self.first_child = array("I")
+        self.child_count = array("H")
+
+    @classmethod
+    def from_tree(cls, root):
+        arena = cls()
+        queue = [root]
+        position = 0
+        while position < len(queue):
+            node = queue[position]
+            position += 1
+            if node is None:
+                arena.kinds.append(cls.NONE_KIND)
+                arena.values.append(None)
+                arena.first_child.append(0)
+                arena.child_count.append(0)
+                continue
+            arena.kinds.append(node.kind)
+            arena.values.append(node.value)
+            arena.first_child.append(len(queue))
+            arena.child_count.append(len(node.children))
+            queue.extend(node.children)
+        return arena
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def node(self, index):
+        return None if self.kinds[index] == self.NONE_KIND else ArenaNode(self, index)
+
+    def root(self):
+        return self.node(0)
+
+
+class ArenaNode:
+    # read-only view of one arena slot with the same interface as ASTNode
+    __slots__ = ("arena", "index")
+
+    def __init__(self, arena, index):
+        self.arena = arena
+        self.index = index
+
+    @property
+    def kind(self):
+        return self.arena.kinds[self.index]
+
+    @property
+    def node_type(self):
+        return node_types[self.arena.kinds[self.index]]
+
+    @property
+    def value(self):
+        return self.arena.values[self.index]
+
+    @property
+    def children(self):
+        first = self.arena.first_child[self.index]
+        return [self.arena.node(i) for i in range(first, first + self.arena.child_count[self.index])]
+
+    display_tree = ASTNode.display_tree
+
+
+class TokenStream:
+    # sliding window over a token iterator, so the parser never holds the whole token list in memory
+    def __init__(self, tokens, history = 4):
+        self.tokens = iter(tokens)
+        self.buffer = []
+        self.offset = 0 # position of buffer[0] in the token stream
+        self.history = history # tokens kept behind the parser for prev_token() / backtrack()
+        self.exhausted = False
+
+    def get(self, position):
+        index = position - self.offset
+        if index < 0:
+            return None
+        while index >= len(self.buffer) and not self.exhausted:
+            try:
+                self.buffer.append(next(self.tokens))
+            except StopIteration:
+                self.exhausted = True
+        return self.buffer[index] if index < len(self.buffer) else None
+
+    def release(self, position):
+        stale = position - self.history - self.offset
+        if stale >= 64:
+            del self.buffer[:stale]
+            self.offset += stale
+
+
+# binding strength of the operators in a filter condition, weakest first. & and | bind equally and group from the
+# right, as the recursive parser grouped them: "a" = 1 & "b" = 2 | "c" = 3 is "a" = 1 & ("b" = 2 | "c" = 3)
+logical_operators = ["&", "|"]
+condition_precedence = {
+    "|": 1, "&": 1,
+    "=": 3, "<>": 3, "<": 3, ">": 3, "<=": 3, ">=": 3,
+    "+": 4, "-": 4,
+    "*": 5, "/": 5, "%": 5,
+}
+
+
+def condition_from(node, chain):
+    # a chain of & or | terms is built from the right, so its children are kept in reverse
+    return ASTNode("CONDITION", children=node[::-1]) if chain else node
+
+
 class Parser:
     def __init__(self, tokens):
-        self.tokens = tokens
+        self.tokens = tokens if isinstance(tokens, TokenStream) else TokenStream(tokens)
         self.position = 0
         self.current_line = 1
         self.is_success = True
+        self.errors = []
+        self.statement_lines = [] # source line of each statement in the PROGRAM node
 
     def advance_line(self):
         self.current_line += 1
@@ -50,25 +192,17 @@ class Parser:
         self.advance()
 
     def current_token(self):
-        if self.position < len(self.tokens):
-            return self.tokens[self.position]
-        else:
-            return None
+        return self.tokens.get(self.position)
 
     def prev_token(self):
-        if len(self.tokens) > self.position - 1 >= 0:
-            return self.tokens[self.position - 1]
-        else:
-            return None
+        return self.tokens.get(self.position - 1)
 
     def next_token(self):
-        if len(self.tokens) > self.position + 1 >= 0:
-            return self.tokens[self.position + 1]
-        else:
-            return None
+        return self.tokens.get(self.position + 1)
 
     def advance(self):
         self.position += 1
+        self.tokens.release(self.position)
 
     def backtrack(self):
         self.position -= 1
@@ -91,16 +225,16 @@ class Parser:
 
     def parse_program(self):
         nodes = []
-        while self.position < len(self.tokens):
+        while self.current_token() is not None:
             try:
+                line = self.current_token().line
                 node = self.parse_statement()
                 nodes.append(node)
+                self.statement_lines.append(line)
                 self.expect("separator", ";")
             except SyntaxError as err:
-                if self.is_success:
-                    self.is_success = False
-                    print(f'\nSyntax Error(s) Found:\n')
-                print(f'{err}')
+                self.is_success = False
+                self.errors.append(f'{err}')
                 if 'Missing semicolon at' not in str(err):
                     self.go_to_next_line()
 
@@ -531,40 +665,122 @@ class Parser:
         self.expect("separator", ")")
         return ASTNode("AGGR-FUNC", value=value, children=[parameter_node])
 
-    def parse_expression(self):
+    def parse_operand(self):
         token = self.current_token()
 
-        if token.token_type == "string":
+        if token is None:
+            raise SyntaxError(f"Expected string or number but found nothing in expression at line {self.current_line}")
+        elif token.token_type == "string":
             self.advance()
             return ASTNode("COLUMN", value=token.value)
         elif token.token_type == "number":
             self.advance()
             return ASTNode("NUMBER", value=token.value)
-        elif token.token_type == "separator" and token.value == "(":
-            self.advance()
-            expr = self.parse_condition()
-            self.expect("separator", ")")
-            return expr
         else:
             raise SyntaxError(f"Unexpected {token.token_type} {token.value} in expression at line {self.current_line}")
 
-    def parse_condition(self):
-        left = self.parse_expression()
-        operator = self.expect("operator").to_node('OPERATOR')
-        right = self.parse_expression()
+    def reduce_condition(self, operands, operators):
+        operator = operators.pop()
+        right, right_chain = operands.pop()
+        left, left_chain = operands.pop()
+
+        if operator.value in logical_operators:
+            # & and | build flat n-ary conditions: a run of one operator is kept as a list of children while it can
+            # still grow to the left, and a run of the other operator becomes one of its terms
+            if right_chain != operator.value:
+                right = [condition_from(right, right_chain)]
+            right.append(operator)
+            right.append(condition_from(left, left_chain))
+            operands.append((right, operator.value))
+        else:
+            left = condition_from(left, left_chain)
+            right = condition_from(right, right_chain)
+            operands.append((ASTNode("CONDITION", children=[left, operator, right]), None))
 
-        condition_node = ASTNode("CONDITION", children=[left, operator, right])
+    def parse_condition(self):
+        # iterative precedence climbing, with an explicit stack for parentheses, so that neither the number of
+        # & / | terms nor the nesting depth is limited by Python's recursion limit
+        groups = []
+        operands = []
+        operators = []
+        operator_count = 0
+
+        while True:
+            token = self.current_token()
+            if token is not None and token.token_type == "separator" and token.value == "(":
+                self.advance()
+                groups.append((operands, operators, operator_count))
+                operands, operators, operator_count = [], [], 0
+                continue
+
+            operands.append((self.parse_operand(), None))
+
+            token = self.current_token()
+            while groups and token is not None and token.token_type != "operator":
+                if operator_count == 0:
+                    self.expect("operator")
+                self.expect("separator", ")")
+                while operators:
+                    self.reduce_condition(operands, operators)
+                node = condition_from(*operands[0])
+                operands, operators, operator_count = groups.pop()
+                operands.append((node, None))
+                token = self.current_token()
+
+            if token is None or token.token_type != "operator":
+                if operator_count == 0:
+                    self.expect("operator")
+                break
 
-        while self.current_token().token_type == "operator" and self.current_token().value in ["&", "|"]:
-            logical_operator = self.current_token().to_node('OPERATOR')
+            precedence = condition_precedence[token.value]
+            while operators and (condition_precedence[operators[-1].value] > precedence or
+                                 condition_precedence[operators[-1].value] == precedence
+                                 and token.value not in logical_operators):
+                self.reduce_condition(operands, operators)
+            operators.append(token.to_node('OPERATOR'))
+            operator_count += 1
             self.advance()
-            next_condition = self.parse_condition()
-            condition_node = ASTNode("CONDITION", children=[condition_node, logical_operator, next_condition])
 
-        return condition_node
+        if groups:
+            self.expect("separator", ")")
+        while operators:
+            self.reduce_condition(operands, operators)
+        return condition_from(*operands[0])
+
+    def report_errors(self):
+        if not self.is_success:
+            print(f'\nSyntax Error(s) Found:\n')
+            for error in self.errors:
+                print(error)
 
     def parse(self):
-        return self.parse_program(), self.is_success
+        ast = self.parse_program()
+        self.report_errors()
+        return ast, self.is_success
+
+
+def lazy_tokens(scan, lexical_errors):
+    for token_class, lexeme, line, column in scan:
+        if token_class == ERROR:
+            lexical_errors.append(lexeme)
+            raise LexicalError(lexeme)
+        yield Token(token_class, lexeme, line, column)
+
+
+def parse_source(source_code):
+    # scanning and parsing overlap: the parser pulls tokens from the lexer only as it needs them, and a
+    # lexical error stops the parse, after which the rest of the source is only scanned for more errors
+    scan = tokenize(source_code)
+    lexical_errors = []
+    parser = Parser(lazy_tokens(scan, lexical_errors))
+
+    try:
+        ast = parser.parse_program()
+    except LexicalError:
+        lexical_errors.extend(lexeme for token_class, lexeme, line, column in scan if token_class == ERROR)
+        return None, parser, lexical_errors
+
+    return ast, parser, lexical_errors
 
 
 def main():
@@ -581,17 +797,11 @@ def main():
         print(f"\nError: File {args.file} not found.\n")
         sys.exit(1)
 
-    tokens, errors = scanner(source_code)
-
-    if errors is None or len(errors) == 0:
-        scanned_tokens = []
-        for token in tokens:
-            scanned_tokens.append(Token(token[0], token[1]))
-
-        parser = Parser(scanned_tokens)
+    ast, parser, errors = parse_source(source_code)
 
-        ast, is_success = parser.parse()
-        if is_success:
+    if len(errors) == 0:
+        parser.report_errors()
+        if parser.is_success:
             print("\nGenerated AST:\n")
             ast.display_tree()
         print("")
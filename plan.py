@@ -0,0 +1,554 @@
+import os
+
+# logical plan between the AST and the generated Python. build_plan() resolves the implicit state of a CSVLang
+# program (the active tag and path, the tags of the loaded files) once, so the code generators lower explicit
+# operators instead of tracking that state in module globals, and optimisations are rewrites of the plan.
+#
+# Relations produce a DataFrame: Scan, Ref, ColumnExpr, Derive, Sort, TopN, Filter, Limit, Project, Concat, Shared
+# and Prefetched, or values: Aggregate, Aggregates and Fused.
+# Steps are what a statement does with them: Bind, Display, Write, MergeFiles, Print, AppendRows, DeleteRows,
+# CreateFile, DeleteFile and Prefetch. Columns are kept as written in CSVLang: names without their quotes and 1-based
+# positions.
+
+
+class PlanNode:
+    __slots__ = ()
+    fields = ()
+    # the fields holding input relations (a relation, a list of relations or None), which rewrites descend into
+    inputs = ()
+
+    def replace(self, **changes):
+        return type(self)(*(changes.get(field, getattr(self, field)) for field in self.fields))
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(hashable(getattr(self, field)) == hashable(getattr(other, field))
+                                                 for field in self.fields)
+
+    def __hash__(self):
+        return hash((type(self).__name__,) + tuple(hashable(getattr(self, field)) for field in self.fields))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(repr(getattr(self, field)) for field in self.fields)})"
+
+
+def hashable(value):
+    # lists become tuples and AST nodes (filter conditions) compare by their structure
+    if isinstance(value, list):
+        return tuple(hashable(item) for item in value)
+    elif hasattr(value, "children"):
+        return (value.kind, value.value, tuple(hashable(child) for child in value.children))
+    return value
+
+
+class Scan(PlanNode):
+    __slots__ = fields = ("path", "header", "columns")
+
+    def __init__(self, path, header, columns = None):
+        self.path = path # the path literal, with its quotes
+        self.header = header
+        self.columns = columns # the only columns the program reads, or None for all of them
+
+
+class Ref(PlanNode):
+    __slots__ = fields = ("tag",)
+
+    def __init__(self, tag):
+        self.tag = tag
+
+
+class ColumnExpr(PlanNode):
+    __slots__ = fields = ("input", "column", "operator", "operand", "by_index")
+    inputs = ("input",)
+
+    def __init__(self, input, column, operator, operand, by_index = False):
+        self.input = input
+        self.column = column
+        self.operator = operator
+        self.operand = operand # the number literal
+        self.by_index = by_index
+
+
+class Derive(PlanNode):
+    # the columns expressions rewrite, applied in order to a shallow copy of the input, so the other columns are not
+    # copied; expressions are (column, operator, operand, by_index) tuples
+    __slots__ = fields = ("input", "expressions")
+    inputs = ("input",)
+
+    def __init__(self, input, expressions):
+        self.input = input
+        self.expressions = expressions
+
+
+class Sort(PlanNode):
+    # a stable sort: rows with equal keys stay in the order of the input
+    __slots__ = fields = ("input", "keys", "by_index")
+    inputs = ("input",)
+
+    def __init__(self, input, keys, by_index = False):
+        self.input = input
+        self.keys = keys
+        self.by_index = by_index
+
+
+class TopN(PlanNode):
+    # the first count rows of a stable sort
+    __slots__ = fields = ("input", "keys", "count", "by_index")
+    inputs = ("input",)
+
+    def __init__(self, input, keys, count, by_index = False):
+        self.input = input
+        self.keys = keys
+        self.count = count
+        self.by_index = by_index
+
+
+class Filter(PlanNode):
+    __slots__ = fields = ("input", "condition", "by_terms")
+    inputs = ("input",)
+
+    def __init__(self, input, condition, by_terms = False):
+        self.input = input
+        self.condition = condition # the CONDITION node of the AST
+        self.by_terms = by_terms # a conjunction is computed term by term by runtime.filter_mask()
+
+
+class Limit(PlanNode):
+    __slots__ = fields = ("input", "count")
+    inputs = ("input",)
+
+    def __init__(self, input, count):
+        self.input = input
+        self.count = count
+
+
+class Project(PlanNode):
+    __slots__ = fields = ("input", "columns", "by_index")
+    inputs = ("input",)
+
+    def __init__(self, input, columns, by_index = False):
+        self.input = input
+        self.columns = columns
+        self.by_index = by_index
+
+
+class Concat(PlanNode):
+    __slots__ = fields = ("relations",)
+    inputs = ("relations",)
+
+    def __init__(self, relations):
+        self.relations = relations
+
+
+class Shared(PlanNode):
+    # a relation the previous DISPLAY or STORE already computed, whose result is reused
+    __slots__ = fields = ("input",)
+    inputs = ("input",)
+
+    def __init__(self, input):
+        self.input = input
+
+
+class Aggregate(PlanNode):
+    __slots__ = fields = ("input", "column", "function", "by_index")
+    inputs = ("input",)
+
+    def __init__(self, input, column, function, by_index = False):
+        self.input = input
+        self.column = column
+        self.function = function # sum, average, max, min or count
+        self.by_index = by_index
+
+
+class Aggregates(PlanNode):
+    # several aggregates of one relation, computed together; aggregates are (column, function, by_index) tuples
+    __slots__ = fields = ("input", "aggregates")
+    inputs = ("input",)
+
+    def __init__(self, input, aggregates):
+        self.input = input
+        self.aggregates = aggregates
+
+
+class Fused(PlanNode):
+    # an aggregate whose value is at position in the result of an earlier Aggregates
+    __slots__ = fields = ("aggregate", "position")
+    inputs = ("aggregate",)
+
+    def __init__(self, aggregate, position):
+        self.aggregate = aggregate
+        self.position = position
+
+
+class Prefetched(PlanNode):
+    # the DataFrame of a Scan that an earlier Prefetch started reading, at position in its scans
+    __slots__ = fields = ("scan", "position")
+    inputs = ("scan",)
+
+    def __init__(self, scan, position):
+        self.scan = scan
+        self.position = position
+
+
+class Bind(PlanNode):
+    __slots__ = fields = ("tag", "relation")
+    inputs = ("relation",)
+
+    def __init__(self, tag, relation):
+        self.tag = tag
+        self.relation = relation
+
+
+class Display(PlanNode):
+    __slots__ = fields = ("relation",)
+    inputs = ("relation",)
+
+    def __init__(self, relation):
+        self.relation = relation
+
+
+class Write(PlanNode):
+    __slots__ = fields = ("relation", "path")
+    inputs = ("relation",)
+
+    def __init__(self, relation, path):
+        self.relation = relation
+        self.path = path
+
+
+class MergeFiles(PlanNode):
+    # a MERGE with save = true that concatenates whole files, as they are on disk
+    __slots__ = fields = ("paths", "path")
+
+    def __init__(self, paths, path):
+        self.paths = paths # the path literals of the files, with their quotes
+        self.path = path
+
+
+class Print(PlanNode):
+    __slots__ = fields = ("message", "aggregate")
+    inputs = ("aggregate",)
+
+    def __init__(self, message, aggregate = None):
+        self.message = message # the message literal, with its quotes
+        self.aggregate = aggregate
+
+
+class AppendRows(PlanNode):
+    __slots__ = fields = ("path", "rows")
+
+    def __init__(self, path, rows):
+        self.path = path
+        self.rows = rows # lists of values without their quotes
+
+
+class DeleteRows(PlanNode):
+    __slots__ = fields = ("tag", "path", "rows")
+
+    def __init__(self, tag, path, rows):
+        self.tag = tag
+        self.path = path
+        self.rows = rows # tuples of values, numbers converted to float
+
+
+class CreateFile(PlanNode):
+    __slots__ = fields = ("path",)
+
+    def __init__(self, path):
+        self.path = path
+
+
+class DeleteFile(PlanNode):
+    __slots__ = fields = ("path",)
+
+    def __init__(self, path):
+        self.path = path
+
+
+class Prefetch(PlanNode):
+    # starts reading the files of later LOADs on a thread pool
+    __slots__ = fields = ("scans",)
+    inputs = ("scans",)
+
+    def __init__(self, scans):
+        self.scans = scans
+
+
+class Statement:
+    __slots__ = ("kind", "steps")
+
+    def __init__(self, kind, steps):
+        self.kind = kind # the node type of the statement in the AST
+        self.steps = steps
+
+    def __repr__(self):
+        return f"Statement({self.kind!r}, {self.steps!r})"
+
+
+class Program:
+    __slots__ = ("statements",)
+
+    def __init__(self, statements):
+        self.statements = statements
+
+    def steps(self):
+        return [step for statement in self.statements for step in statement.steps]
+
+    def display_plan(self):
+        for statement in self.statements:
+            print(statement.kind)
+            for step in statement.steps:
+                print(f"    {step!r}")
+
+
+def tag_value(attribute):
+    return attribute.children[2].value[1:-1]
+
+
+class PlanBuilder:
+    # walks the statements in order, resolving the active tag and path exactly like the code generators did
+    def __init__(self):
+        self.active_tag = "a0"
+        self.active_path = ""
+        self.path_map = {}
+
+    def build(self, program):
+        return Program([Statement(node.node_type, self.build_statement(node)) for node in program.children])
+
+    def build_statement(self, node):
+        kind = node.node_type
+        if kind == "LOAD-STMT":
+            return self.build_load(node)
+        elif kind in ["DISPLAY-STMT", "STORE-STMT"]:
+            return self.build_display_or_store(node)
+        elif kind == "PRINT-STMT":
+            return self.build_print(node)
+        elif kind == "MERGE-STMT":
+            return self.build_merge(node)
+        elif kind == "DELETE-STMT":
+            tag = tag_value(node.children[0])
+            return [DeleteFile(self.path_map[tag])]
+        elif kind == "CREATE-STMT":
+            path = node.children[0].value
+            self.active_path = path
+            self.active_tag = "a0"
+            return [CreateFile(path)]
+        elif kind == "ADD-STMT":
+            rows = [[value.value[1:-1] for value in row.children] for row in node.children[0].children]
+            # the file is read again, so the active tag sees the new rows
+            return [AppendRows(self.active_path, rows), Bind(self.active_tag, Scan(self.active_path, True))]
+        elif kind == "REMOVE-STMT":
+            rows = [tuple(float(value.value.strip('"')) if value.value.strip('"').replace('.', '', 1).isdigit()
+                          else value.value.strip('"') for value in row.children)
+                    for row in node.children[0].children]
+            return [DeleteRows(self.active_tag, self.active_path, rows)]
+        return []
+
+    def build_load(self, node):
+        path = ""
+        header = False
+        tag = "a0"
+
+        for child in node.children:
+            if child is None: continue
+            if child.node_type == "PATH":
+                path = child.value
+            elif child.node_type == "HEADER-ATTR":
+                header = child.children[2].value == "true"
+            elif child.node_type == "TAG-ATTR":
+                tag = tag_value(child)
+                self.path_map[tag] = path
+
+        self.active_path = path
+        self.active_tag = tag
+        return [Bind(tag, Scan(path, header))]
+
+    def build_display_or_store(self, node):
+        source = Ref(self.active_tag)
+        has_expressions = False
+        columns = []
+        columns_by_index = False
+        num = None
+        sort = None
+        condition = None
+        path = ""
+
+        for child in node.children:
+            if child is None: continue
+            if child.node_type in ["COLUMN-LIST", "COL-INDEX-LIST"]:
+                columns_by_index = child.node_type == "COL-INDEX-LIST"
+                for column in child.children:
+                    if column.node_type in ["COLUMN-EXPR", "COL-INDEX-EXPR"]:
+                        # derived columns are computed on the active tag; a tag attribute does not apply to them
+                        by_index = column.node_type == "COL-INDEX-EXPR"
+                        key = int(column.children[0].value) if by_index else column.children[0].value[1:-1]
+                        source = ColumnExpr(source, key, column.children[1].value, column.children[2].value,
+                                            by_index)
+                        has_expressions = True
+                columns = [column.value if column.node_type in ["COLUMN", "COL-INDEX"] else
+                           column.children[0].value for column in child.children]
+                columns = [int(column) for column in columns] if columns_by_index else \
+                    [column.strip('"') for column in columns]
+            elif child.node_type == "NUM-ATTR":
+                num = child.children[2].value
+            elif child.node_type == "SORT-ATTR":
+                keys = child.children[2]
+                # STORE has always sorted positions as column names
+                if keys.node_type == "COL-INDEX-LIST" and node.node_type == "DISPLAY-STMT":
+                    sort = ([int(key.value) for key in keys.children], True)
+                else:
+                    sort = ([key.value.strip('"') for key in keys.children], False)
+            elif child.node_type == "FILTER-ATTR":
+                condition = child.children[2]
+            elif child.node_type == "TAG-ATTR" and not has_expressions:
+                source = Ref(tag_value(child))
+            elif child.node_type == "PATH-ATTR":
+                path = child.children[2].value
+
+        relation = Sort(source, *(sort or ([], False)))
+        if condition is not None:
+            relation = Filter(relation, condition)
+        if num is not None:
+            relation = Limit(relation, int(num))
+        relation = Project(relation, columns, columns_by_index)
+
+        if node.node_type == "DISPLAY-STMT":
+            return [Display(relation)]
+        return [Write(relation, path), Print('""')]
+
+    def build_print(self, node):
+        message = ""
+        tag = self.active_tag
+        aggregate = None
+
+        for child in node.children:
+            if child is None: continue
+            if child.node_type == "MESSAGE":
+                message = child.value
+            elif child.node_type == "AGGR-FUNC":
+                aggregate = child
+            elif child.node_type == "TAG-ATTR":
+                tag = tag_value(child)
+
+        if aggregate is None:
+            return [Print(message)]
+
+        column = aggregate.children[0]
+        by_index = column.node_type == "COL-INDEX"
+        key = int(column.value) if by_index else column.value[1:-1]
+        return [Print(message, Aggregate(Ref(tag), key, str(aggregate.value).lower(), by_index))]
+
+    def build_merge(self, node):
+        tags = []
+        path = ""
+        save = False
+
+        for child in node.children:
+            if child is None: continue
+            if child.node_type == "PATH-ATTR":
+                path = child.children[2].value
+            elif child.node_type == "SAVE-ATTR":
+                save = child.children[2].value == "true"
+            elif child.node_type == "TAG-LIST":
+                tags = [tag.value[1:-1] for tag in child.children]
+
+        relation = Concat([Ref(tag) for tag in tags])
+        return [Write(relation, path)] if save else [Display(relation)]
+
+
+def build_plan(program):
+    return PlanBuilder().build(program)
+
+
+# rewrite framework: a rule takes a plan node (with its inputs already rewritten) and returns a replacement or None
+# to keep it; a pass takes a Program and returns a new one
+
+def transform(node, rule):
+    if not isinstance(node, PlanNode):
+        return node
+
+    changes = {}
+    for field in node.inputs:
+        value = getattr(node, field)
+        if isinstance(value, list):
+            rewritten = [transform(item, rule) for item in value]
+            if any(new is not old for new, old in zip(rewritten, value)):
+                changes[field] = rewritten
+        else:
+            rewritten = transform(value, rule)
+            if rewritten is not value:
+                changes[field] = rewritten
+    if changes:
+        node = node.replace(**changes)
+
+    replacement = rule(node)
+    return node if replacement is None else replacement
+
+
+def rule_pass(rule):
+    # turns a node rule into a pass over every step of the program
+    def apply(program):
+        return Program([Statement(statement.kind, [transform(step, rule) for step in statement.steps])
+                        for statement in program.statements])
+    return apply
+
+
+def optimise(program, passes):
+    for optimisation_pass in passes:
+        program = optimisation_pass(program)
+    return program
+
+
+def relations(node):
+    # every plan node reachable from node, inputs first
+    if not isinstance(node, PlanNode):
+        return
+    for field in node.inputs:
+        value = getattr(node, field)
+        for item in value if isinstance(value, list) else [value]:
+            yield from relations(item)
+    yield node
+
+
+def condition_columns(condition):
+    # the columns a filter CONDITION reads; a string right of an operator is a value, not a column
+    for i, child in enumerate(condition.children):
+        if child.node_type == 'CONDITION':
+            yield from condition_columns(child)
+        elif child.node_type == 'COLUMN' and not (i > 0 and condition.children[i - 1].node_type == 'OPERATOR'):
+            yield child.value[1:-1]
+
+
+def base_tag(relation):
+    # the tag a chain of single-input relations reads from, or None for a Scan or a Concat
+    while relation is not None:
+        if isinstance(relation, Ref):
+            return relation.tag
+        relation = getattr(relation, "input", None)
+    return None
+
+
+def same_file(path, other):
+    # whether two path literals may name the same file, like "a.csv" and "./a.csv", or a link and its target
+    path, other = path[1:-1], other[1:-1]
+    return os.path.normpath(path) == os.path.normpath(other) or os.path.realpath(path) == os.path.realpath(other)
+
+
+def remove_dead_loads(program):
+    # def-use analysis, backwards over the steps: a tag is live when a later step reads it before binding it again.
+    # A Bind of a file or of another tag (a LOAD, or the read after an ADD) to a tag that is not live is removed, so
+    # an unused LOAD never reads its file. Each step is visited once
+    live = set()
+    statements = []
+    for statement in reversed(program.statements):
+        steps = []
+        for step in reversed(statement.steps):
+            if isinstance(step, Bind):
+                if isinstance(step.relation, (Scan, Ref)) and step.tag not in live:
+                    continue
+                live.discard(step.tag)
+            elif isinstance(step, DeleteRows):
+                live.add(step.tag)
+            live.update(node.tag for node in relations(step) if isinstance(node, Ref))
+            steps.append(step)
+        statements.append(Statement(statement.kind, steps[::-1]))
+    return Program(statements[::-1])
@@ -0,0 +1,351 @@
+import os
+import sys
+
+import program_cache
+import runtime
+from plan import Aggregate, Aggregates, AppendRows, Bind, ColumnExpr, Concat, CreateFile, DeleteFile, DeleteRows, \
+    Derive, Display, Filter, Fused, Limit, MergeFiles, Prefetch, Prefetched, Print, Project, Ref, Scan, Shared, Sort, \
+    TopN, Write, build_plan, optimise
+
+# lowers a plan to Python for both code generators, which only differ by the passes that rewrite the plan first
+
+
+aggr_methods = {
+    "average": "mean",
+    "sum": "sum",
+    "max": "max",
+    "min": "min",
+    "count": "nunique"
+}
+
+operator_map = {
+    '<>': '!=',
+    '=': '==',
+}
+
+# n-ary & / | conditions with more terms than this are emitted as one reduction over a list of masks, since a
+# long infix chain of & or | makes CPython's compiler recurse once per term
+max_infix_terms = 32
+
+def membership_test(node):
+    # "col" = v1 | "col" = v2 | ... on a single column, returned as (column, [v1, v2, ...])
+    if len(node.children) < 3 or node.children[1].value != '|':
+        return None
+
+    column = None
+    values = []
+    for i, child in enumerate(node.children):
+        if i % 2 == 1:
+            if child.value != '|':
+                return None
+            continue
+        if child.node_type != 'CONDITION' or len(child.children) != 3:
+            return None
+        left, operator, right = child.children
+        if left.node_type != 'COLUMN' or operator.value != '=' or right.node_type not in ['COLUMN', 'NUMBER']:
+            return None
+        if column is not None and left.value != column:
+            return None
+        column = left.value
+        values.append(right.value)
+
+    return column, values
+
+def generate_filter_term(node, tag):
+    if node.node_type == 'CONDITION':
+        return generate_filter_expression(node, tag)
+    elif node.node_type == 'COLUMN':
+        return f'{tag}[{node.value}]'
+    return node.value
+
+def generate_filter_expression(node, tag):
+    membership = membership_test(node)
+    if membership is not None:
+        column, values = membership
+        return f'({tag}[{column}].isin([{", ".join(values)}]))'
+
+    if len(node.children) // 2 + 1 > max_infix_terms and node.children[1].value in ['&', '|']:
+        masks = [generate_filter_term(child, tag) for child in node.children[::2]]
+        reduction = 'all' if node.children[1].value == '&' else 'any'
+        return f'(pd.concat([{", ".join(masks)}], axis=1).{reduction}(axis=1))'
+
+    res = []
+    for i, child in enumerate(node.children):
+        if child.node_type == 'CONDITION':
+            res.append(generate_filter_expression(child, tag))
+        elif child.node_type == 'COLUMN':
+            if i > 0 and node.children[i - 1].node_type == 'OPERATOR':
+                res.append(child.value)
+            else:
+                res.append(f'{tag}[{child.value}]')
+        elif child.node_type == 'OPERATOR':
+            res.append(operator_map[child.value]
+               if operator_map.keys().__contains__(child.value)
+               else child.value)
+        elif child.node_type == 'NUMBER':
+            res.append(child.value)
+
+    return process_sub_expression(res)
+
+def generate_filter_mask(node, tag):
+    # a conjunction is computed by runtime.filter_mask(), which evaluates its most selective terms first and the
+    # others only on the rows they keep
+    if len(node.children) >= 3 and node.children[1].value == '&' \
+            and all(child.node_type == 'CONDITION' for child in node.children[::2]):
+        terms = [f'lambda rows: {generate_filter_expression(child, "rows")}' for child in node.children[::2]]
+        return f'filter_mask({tag}, [{", ".join(terms)}])'
+    return generate_filter_expression(node, tag)
+
+def process_sub_expression(sub_expression):
+    if isinstance(sub_expression, str):
+        return sub_expression
+
+    if isinstance(sub_expression, list):
+        if len(sub_expression) == 3 and isinstance(sub_expression[1], str) and sub_expression[1] in ['&', '|']:
+            left_expr = process_sub_expression(sub_expression[0])
+            operator = sub_expression[1]
+            right_expr = process_sub_expression(sub_expression[2])
+            return f"({left_expr} {operator} {right_expr})"
+        else:
+            sub_expressions = [process_sub_expression(item) for item in sub_expression]
+            return f"({' '.join(sub_expressions)})"
+
+# runtime.place_imports() removes the imports a program does not use
+import_header = ("from pathlib import Path\nimport pandas as pd\nfrom runtime import aggregate\n"
+                 "from runtime import filter_mask\nfrom runtime import merge_files\nfrom runtime import prefetch\n"
+                 "from runtime import top_n\n\n")
+
+def frame_name(relation):
+    # the DataFrame variable that filter and sort expressions of a relation chain refer to
+    if isinstance(relation, (ColumnExpr, Derive)):
+        return 'a1'
+    elif isinstance(relation, Ref):
+        return relation.tag
+    return frame_name(relation.input)
+
+def generate_columns(frame, project):
+    return f'{frame}.loc[:, {project.columns}]' if not project.by_index \
+        else f'{frame}.iloc[:, {[column - 1 for column in project.columns]}]'
+
+def generate_keys(sort):
+    return f'[{frame_name(sort)}.columns[i] for i in {[key - 1 for key in sort.keys]}]' if sort.by_index \
+        else sort.keys
+
+def generate_aggregate_column(frame, column, by_index):
+    return f'{frame}.columns[{column}]' if by_index else f'"{column}"'
+
+def generate_relation(relation, prelude):
+    # returns the expression for relation; derived columns are computed into a1 by the lines added to prelude
+    if isinstance(relation, Ref):
+        return relation.tag
+
+    elif isinstance(relation, Scan):
+        if relation.columns is not None:
+            # a column the program reads but the file lacks still fails where it is read, not in read_csv
+            return f"pd.read_csv({relation.path}, header=0, usecols=lambda column: column in {relation.columns})"
+        return f"pd.read_csv({relation.path}, header={'[0]' if relation.header else 'None'})"
+
+    elif isinstance(relation, ColumnExpr):
+        source = generate_relation(relation.input, prelude)
+        column = relation.column - 1 if relation.by_index else f'"{relation.column}"'
+        prelude.append(f'a1 = {source}.copy()\na1[{column}] = a1[{column}] {relation.operator} {relation.operand}\n')
+        return 'a1'
+
+    elif isinstance(relation, Derive):
+        code = f'a1 = {generate_relation(relation.input, prelude)}.copy(deep=False)\n'
+        for column, operator, operand, by_index in relation.expressions:
+            key = column - 1 if by_index else f'"{column}"'
+            code += f'a1[{key}] = a1[{key}] {operator} {operand}\n'
+        prelude.append(code)
+        return 'a1'
+
+    elif isinstance(relation, Sort):
+        # a sort without keys leaves every row where it is
+        kind = ', kind="stable"' if relation.keys else ''
+        return f'{generate_relation(relation.input, prelude)}.sort_values(by={generate_keys(relation)}{kind})'
+
+    elif isinstance(relation, TopN):
+        return f'top_n({generate_relation(relation.input, prelude)}, {generate_keys(relation)}, {relation.count})'
+
+    elif isinstance(relation, Filter):
+        mask = generate_filter_mask(relation.condition, frame_name(relation)) if relation.by_terms \
+            else generate_filter_expression(relation.condition, frame_name(relation))
+        if isinstance(relation.input, Project) and not relation.input.by_index:
+            return f'{generate_relation(relation.input.input, prelude)}.loc[{mask}, {relation.input.columns}]'
+        return f'{generate_relation(relation.input, prelude)}.loc[{mask}]'
+
+    elif isinstance(relation, Limit):
+        return f'{generate_relation(relation.input, prelude)}.head({relation.count})'
+
+    elif isinstance(relation, Project):
+        return generate_columns(generate_relation(relation.input, prelude), relation)
+
+    elif isinstance(relation, Shared):
+        return 'a4'
+
+    elif isinstance(relation, Concat):
+        return f"pd.concat([{', '.join(generate_relation(item, prelude) for item in relation.relations)}])"
+
+    elif isinstance(relation, Aggregate):
+        frame = generate_relation(relation.input, prelude)
+        column = generate_aggregate_column(frame, relation.column, relation.by_index)
+        return f'{frame}[{column}].{aggr_methods[relation.function]}()'
+
+    elif isinstance(relation, Aggregates):
+        frame = generate_relation(relation.input, prelude)
+        requests = [f'({column}, "{aggr_methods[function]}", True)' if by_index else
+                    f'("{column}", "{aggr_methods[function]}")' for column, function, by_index in relation.aggregates]
+        return f'aggregate({frame}, [{", ".join(requests)}])'
+
+    elif isinstance(relation, Fused):
+        return f'a3[{relation.position}]'
+
+    elif isinstance(relation, Prefetched):
+        return f'a5[{relation.position}].result()'
+
+def generate_result(relation, prelude):
+    # DISPLAY and STORE compute their rows into a4, unless a4 already holds them
+    if isinstance(relation, Shared):
+        return ''
+    return f'a4 = ({generate_relation(relation, prelude)})\n'
+
+def generate_step(step):
+    prelude = []
+
+    if isinstance(step, Bind):
+        code = f'{step.tag} = {generate_relation(step.relation, prelude)}'
+
+    elif isinstance(step, Display):
+        if isinstance(step.relation, Project):
+            code = (f'{generate_result(step.relation.input, prelude)}'
+                    f'print({generate_columns("a4", step.relation)})')
+        else:
+            code = f'print({generate_relation(step.relation, prelude)})'
+        code += '\nprint()'
+
+    elif isinstance(step, Write):
+        if isinstance(step.relation, Project):
+            code = (f'{generate_result(step.relation.input, prelude)}'
+                    f'{generate_columns("a4", step.relation)}.to_csv({step.path}, index=False)')
+        else:
+            code = f'{generate_relation(step.relation, prelude)}.to_csv({step.path}, index=False)'
+
+    elif isinstance(step, Prefetch):
+        readers = [f'lambda: {generate_relation(scan, prelude)}' for scan in step.scans]
+        code = f'a5 = prefetch([{", ".join(readers)}])'
+
+    elif isinstance(step, MergeFiles):
+        paths = f'[{", ".join(step.paths)}]'
+        code = (f'if not merge_files({paths}, {step.path}):\n'
+                f'\tpd.concat([pd.read_csv(path, header=[0]) for path in {paths}]).to_csv({step.path}, index=False)')
+
+    elif isinstance(step, Print):
+        code = f'print({step.message}, {generate_relation(step.aggregate, prelude)})' if step.aggregate \
+            else f'print({step.message})'
+
+    elif isinstance(step, AppendRows):
+        code = f'with open({step.path}, "a") as file:'
+        for row in step.rows:
+            code += f'\n\tfile.write("{",".join(row)}\\n")'
+
+    elif isinstance(step, DeleteRows):
+        code = f'''
+a2 = {step.tag}.apply(lambda row: tuple(row.dropna().values) in {step.rows}, axis=1)
+{step.tag} = {step.tag}[~a2]
+{step.tag}.to_csv({step.path}, index=False, header=False)
+        '''
+
+    elif isinstance(step, CreateFile):
+        code = f'open({step.path}, "w").close()'
+
+    elif isinstance(step, DeleteFile):
+        code = f'file_path = Path({step.path})\nfile_path.unlink()'
+
+    return "".join(prelude) + code
+
+def generate_statements(node, passes):
+    # lowers the plan of a PROGRAM node, rewritten by passes, and returns the code of each statement
+    program = optimise(build_plan(node), passes)
+
+    chunks = []
+    import_flag = False
+    for statement in program.statements:
+        code = "\n".join(generate_step(step) for step in statement.steps)
+        if statement.kind == "LOAD-STMT" and not import_flag:
+            # the imports of a LOAD that was removed as unused still end with the blank line
+            code = import_header + code if code else import_header[:-1]
+            import_flag = True
+        chunks.append(code)
+    return chunks
+
+def generate_python_code(node, passes):
+    return "".join(chunk + "\n" for chunk in generate_statements(node, passes) if chunk)
+
+def compile_source(source_code, passes):
+    # returns the generated Python code and the .csvlang line of each of its lines, or None after reporting lexical
+    # or syntax errors
+    # the front end is only imported when there is no cached program to run
+    from parser import parse_source
+
+    ast, parser, errors = parse_source(source_code)
+
+    if len(errors) != 0:
+        print("\nLexical Errors Found:\n")
+        for error in errors:
+            print(error)
+        print("")
+        return None
+
+    parser.report_errors()
+    if not parser.is_success:
+        return None
+
+    code, line_map = runtime.generate_with_line_map(generate_statements(ast, passes), parser.statement_lines)
+    return runtime.place_imports(code, line_map)
+
+def main(passes, optimised):
+    # runs a generator's command line: optimised tells the program cache which generator's code it holds
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description = "Code Generator for CSV Lang")
+    arg_parser.add_argument("file", help = "Path to the CSV Lang source code")
+    arg_parser.add_argument("--no-cache", action = "store_true",
+                            help = f"Do not read or write compiled programs in {program_cache.cache_directory_name}")
+    arg_parser.add_argument("--load-threads", type = int, default = runtime.load_threads,
+                            help = f"Threads that read the files of LOADs ahead ({runtime.load_threads} here)")
+
+    args = arg_parser.parse_args()
+
+    # Read the file
+    try:
+        with open(args.file, "r") as file:
+            source_code = file.read()
+    except FileNotFoundError:
+        print(f"\nError: File {args.file} not found.\n")
+        sys.exit(1)
+
+    # a cache hit skips scanning, parsing and code generation
+    cached = None if args.no_cache else program_cache.load(args.file, source_code, optimised)
+
+    if cached is not None:
+        generated_code, code_object = cached
+    else:
+        compiled = compile_source(source_code, passes)
+        if compiled is None:
+            return
+        generated_code, line_map = compiled
+        code_object = None
+
+    print("\nGenerated Python Code:\n")
+    print(generated_code)
+
+    if code_object is None:
+        code_object = runtime.compile_program(generated_code, os.path.abspath(args.file), line_map, source_code)
+        if not args.no_cache:
+            program_cache.store(args.file, source_code, optimised, generated_code, code_object)
+
+    print("CSVLang Output\n")
+    runtime.load_threads = args.load_threads
+    runtime.run_program(code_object)
+    print("")
+
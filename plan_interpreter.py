@@ -0,0 +1,328 @@
+import ast
+import operator
+import os
+import sys
+import time
+from functools import reduce
+
+import runtime
+from optimised_code_generator import optimisation_passes
+from plan import Aggregate, Aggregates, AppendRows, Bind, ColumnExpr, Concat, CreateFile, DeleteFile, DeleteRows, \
+    Derive, Display, Filter, Fused, Limit, MergeFiles, Prefetch, Prefetched, Print, Project, Ref, Scan, Shared, Sort, \
+    TopN, Write, build_plan, optimise
+from plan_generator import aggr_methods, frame_name, membership_test
+
+# runs the optimised plan of a program by calling pandas and the runtime directly, without generating Python or
+# exec-ing it. It prints exactly what the code of optimised_code_generator.py prints
+
+operators = {
+    '=': operator.eq,
+    '<>': operator.ne,
+    '<': operator.lt,
+    '>': operator.gt,
+    '<=': operator.le,
+    '>=': operator.ge,
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+    '%': operator.mod,
+    '&': operator.and_,
+    '|': operator.or_,
+}
+
+
+def literal(value):
+    # CSVLang strings and numbers are written as the generated code writes them, as Python literals
+    return ast.literal_eval(value)
+
+
+def condition_operand(node, frame, after_operator):
+    if node.node_type == 'CONDITION':
+        return condition_value(node, frame)
+    elif node.node_type == 'COLUMN':
+        # a string right of an operator is a value, not a column
+        return literal(node.value) if after_operator else frame[literal(node.value)]
+    return literal(node.value)
+
+
+def condition_value(node, frame):
+    # the value generate_filter_expression() computes for a CONDITION node, with frame (a DataFrame or
+    # runtime.FilterRows) in place of the tag
+    membership = membership_test(node)
+    if membership is not None:
+        column, values = membership
+        return frame[literal(column)].isin([literal(value) for value in values])
+
+    values = [condition_operand(child, frame, i > 0 and node.children[i - 1].node_type == 'OPERATOR')
+              for i, child in enumerate(node.children) if child.node_type != 'OPERATOR']
+    if len(values) == 1:
+        return values[0]
+    # comparisons and arithmetic are binary, & and | chains are flat and use one operator throughout
+    return reduce(operators[node.children[1].value], values)
+
+
+def condition_mask(node, frame):
+    # what generate_filter_mask() computes for a Filter with by_terms: a conjunction goes through runtime.filter_mask()
+    if len(node.children) >= 3 and node.children[1].value == '&' \
+            and all(child.node_type == 'CONDITION' for child in node.children[::2]):
+        return runtime.filter_mask(frame, [lambda rows, child=child: condition_value(child, rows)
+                                           for child in node.children[::2]])
+    return condition_value(node, frame)
+
+
+def aggregate_column(frame, column, by_index):
+    return frame.columns[column] if by_index else column
+
+
+class Interpreter:
+    def __init__(self):
+        # the tags of the program and the frames the generated code keeps in a1 to a5
+        self.frames = {}
+        # called as hook(statement index, Statement, seconds) after each statement
+        self.statement_hooks = []
+        # the index of the statement being run, which is the failing one after an exception
+        self.statement_index = None
+
+    def run(self, program):
+        for index, statement in enumerate(program.statements):
+            self.statement_index = index
+            start = time.perf_counter()
+            for step in statement.steps:
+                self.run_step(step)
+            seconds = time.perf_counter() - start
+            for hook in self.statement_hooks:
+                hook(index, statement, seconds)
+
+    def columns(self, frame, project):
+        return frame.loc[:, project.columns] if not project.by_index \
+            else frame.iloc[:, [column - 1 for column in project.columns]]
+
+    def keys(self, relation):
+        if relation.by_index:
+            frame = self.frames[frame_name(relation)]
+            return [frame.columns[i] for i in [key - 1 for key in relation.keys]]
+        return relation.keys
+
+    def mask(self, filter):
+        frame = self.frames[frame_name(filter)]
+        return condition_mask(filter.condition, frame) if filter.by_terms else condition_value(filter.condition, frame)
+
+    def derive(self, frame, expressions, deep):
+        derived = frame.copy(deep=deep)
+        for column, operator_value, operand, by_index in expressions:
+            key = column - 1 if by_index else column
+            derived[key] = operators[operator_value](derived[key], literal(operand))
+        self.frames['a1'] = derived
+        return derived
+
+    def evaluate(self, relation):
+        if isinstance(relation, Ref):
+            return self.frames[relation.tag]
+
+        elif isinstance(relation, Scan):
+            import pandas as pd
+
+            if relation.columns is not None:
+                return pd.read_csv(literal(relation.path), header=0,
+                                   usecols=lambda column: column in relation.columns)
+            return pd.read_csv(literal(relation.path), header=[0] if relation.header else None)
+
+        elif isinstance(relation, ColumnExpr):
+            expression = (relation.column, relation.operator, relation.operand, relation.by_index)
+            return self.derive(self.evaluate(relation.input), [expression], True)
+
+        elif isinstance(relation, Derive):
+            return self.derive(self.evaluate(relation.input), relation.expressions, False)
+
+        elif isinstance(relation, Sort):
+            frame = self.evaluate(relation.input)
+            return frame.sort_values(by=self.keys(relation), kind="stable")
+
+        elif isinstance(relation, TopN):
+            frame = self.evaluate(relation.input)
+            return runtime.top_n(frame, self.keys(relation), relation.count)
+
+        elif isinstance(relation, Filter):
+            if isinstance(relation.input, Project) and not relation.input.by_index:
+                frame = self.evaluate(relation.input.input)
+                mask = self.mask(relation)
+                return frame.loc[mask, relation.input.columns]
+            frame = self.evaluate(relation.input)
+            return frame.loc[self.mask(relation)]
+
+        elif isinstance(relation, Limit):
+            return self.evaluate(relation.input).head(relation.count)
+
+        elif isinstance(relation, Project):
+            return self.columns(self.evaluate(relation.input), relation)
+
+        elif isinstance(relation, Shared):
+            return self.frames['a4']
+
+        elif isinstance(relation, Concat):
+            import pandas as pd
+
+            return pd.concat([self.evaluate(item) for item in relation.relations])
+
+        elif isinstance(relation, Aggregate):
+            frame = self.evaluate(relation.input)
+            column = aggregate_column(frame, relation.column, relation.by_index)
+            return getattr(frame[column], aggr_methods[relation.function])()
+
+        elif isinstance(relation, Aggregates):
+            frame = self.evaluate(relation.input)
+            return runtime.aggregate(frame, [(column, aggr_methods[function], by_index)
+                                             for column, function, by_index in relation.aggregates])
+
+        elif isinstance(relation, Fused):
+            return self.frames['a3'][relation.position]
+
+        elif isinstance(relation, Prefetched):
+            return self.frames['a5'][relation.position].result()
+
+    def result(self, relation):
+        # DISPLAY and STORE compute their rows into a4, unless a4 already holds them
+        if not isinstance(relation, Shared):
+            self.frames['a4'] = self.evaluate(relation)
+        return self.frames['a4']
+
+    def run_step(self, step):
+        if isinstance(step, Bind):
+            self.frames[step.tag] = self.evaluate(step.relation)
+
+        elif isinstance(step, Display):
+            if isinstance(step.relation, Project):
+                print(self.columns(self.result(step.relation.input), step.relation))
+            else:
+                print(self.evaluate(step.relation))
+            print()
+
+        elif isinstance(step, Write):
+            if isinstance(step.relation, Project):
+                frame = self.columns(self.result(step.relation.input), step.relation)
+            else:
+                frame = self.evaluate(step.relation)
+            frame.to_csv(literal(step.path), index=False)
+
+        elif isinstance(step, Prefetch):
+            self.frames['a5'] = runtime.prefetch([lambda scan=scan: self.evaluate(scan) for scan in step.scans])
+
+        elif isinstance(step, MergeFiles):
+            import pandas as pd
+
+            paths = [literal(path) for path in step.paths]
+            if not runtime.merge_files(paths, literal(step.path)):
+                pd.concat([pd.read_csv(path, header=[0]) for path in paths]).to_csv(literal(step.path), index=False)
+
+        elif isinstance(step, Print):
+            if step.aggregate:
+                print(literal(step.message), self.evaluate(step.aggregate))
+            else:
+                print(literal(step.message))
+
+        elif isinstance(step, AppendRows):
+            with open(literal(step.path), "a") as file:
+                for row in step.rows:
+                    file.write(",".join(row) + "\n")
+
+        elif isinstance(step, DeleteRows):
+            frame = self.frames[step.tag]
+            removed = frame.apply(lambda row: tuple(row.dropna().values) in step.rows, axis=1)
+            self.frames['a2'] = removed
+            self.frames[step.tag] = frame[~removed]
+            self.frames[step.tag].to_csv(literal(step.path), index=False, header=False)
+
+        elif isinstance(step, CreateFile):
+            open(literal(step.path), "w").close()
+
+        elif isinstance(step, DeleteFile):
+            os.unlink(literal(step.path))
+
+
+def build_program(source_code, passes = optimisation_passes):
+    # returns the optimised plan and the .csvlang line of each statement, or None after reporting lexical or syntax
+    # errors like the code generators do
+    from parser import parse_source
+
+    tree, parser, errors = parse_source(source_code)
+
+    if len(errors) != 0:
+        print("\nLexical Errors Found:\n")
+        for error in errors:
+            print(error)
+        print("")
+        return None
+
+    parser.report_errors()
+    if not parser.is_success:
+        return None
+
+    return optimise(build_plan(tree), passes), parser.statement_lines
+
+
+def main():
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description = "Plan interpreter for CSV Lang")
+    arg_parser.add_argument("file", help = "Path to the CSV Lang source code")
+    arg_parser.add_argument("--emit-python", action = "store_true",
+                            help = "Print the Python code optimised_code_generator.py generates instead of running")
+    arg_parser.add_argument("--timings", action = "store_true",
+                            help = "Report the time of each statement on stderr")
+    arg_parser.add_argument("--chunk-rows", type = int,
+                            help = "Stream the loaded files in chunks of this many rows instead of reading them whole")
+    arg_parser.add_argument("--spill-directory",
+                            help = "Where a streamed sort writes its sorted runs (the system temporary directory)")
+    arg_parser.add_argument("--load-threads", type = int, default = runtime.load_threads,
+                            help = f"Threads that read the files of LOADs ahead ({runtime.load_threads} here)")
+
+    args = arg_parser.parse_args()
+
+    # Read the file
+    try:
+        with open(args.file, "r") as file:
+            source_code = file.read()
+    except FileNotFoundError:
+        print(f"\nError: File {args.file} not found.\n")
+        sys.exit(1)
+
+    if args.emit_python:
+        import optimised_code_generator
+
+        compiled = optimised_code_generator.compile_source(source_code)
+        if compiled is not None:
+            print(compiled[0], end="")
+        return
+
+    runtime.load_threads = args.load_threads
+    if args.chunk_rows is None:
+        built = build_program(source_code)
+    else:
+        import streaming
+
+        built = build_program(source_code, streaming.streaming_passes)
+    if built is None:
+        return
+    program, statement_lines = built
+
+    if args.chunk_rows is None:
+        interpreter = Interpreter()
+    else:
+        interpreter = streaming.StreamingInterpreter(args.chunk_rows, spill_directory = args.spill_directory)
+    if args.timings:
+        def report(index, statement, seconds):
+            print(f"{args.file}:{statement_lines[index]} {statement.kind} {seconds:.6f}s", file=sys.stderr)
+        interpreter.statement_hooks.append(report)
+
+    try:
+        interpreter.run(program)
+    except Exception as error:
+        # point at the CSVLang statement that failed, as the tracebacks of the generated code do
+        line = statement_lines[interpreter.statement_index]
+        source_lines = source_code.splitlines()
+        error.add_note(f'  File "{os.path.abspath(args.file)}", line {line}\n    {source_lines[line - 1].strip()}')
+        raise
+
+if __name__ == "__main__":
+    main()
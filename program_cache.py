@@ -0,0 +1,93 @@
+import hashlib
+import importlib.util
+import marshal
+import os
+
+# compiled programs are cached next to their source, like __pycache__ for .py files
+cache_directory_name = "__csvcache__"
+cache_suffix = ".csvc"
+
+# once a cache directory grows past this size, the least recently used entries are evicted
+max_cache_size = 32 * 1024 * 1024
+
+compiler_modules = ["scanner.py", "parser.py", "plan.py", "plan_generator.py", "code_generator.py",
+                    "optimised_code_generator.py", "program_cache.py", "runtime.py"]
+
+_compiler_version = None
+
+
+def compiler_version():
+    # any edit to the compiler or a different Python bytecode format invalidates every entry
+    global _compiler_version
+    if _compiler_version is None:
+        digest = hashlib.sha256(importlib.util.MAGIC_NUMBER)
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for module in compiler_modules:
+            with open(os.path.join(directory, module), "rb") as file:
+                digest.update(file.read())
+        _compiler_version = digest.hexdigest()
+    return _compiler_version
+
+
+def cache_key(source_file, source_code, optimised):
+    # the code object records the path of its source file for tracebacks, so the path is part of the key
+    digest = hashlib.sha256(compiler_version().encode())
+    digest.update(b"optimised" if optimised else b"plain")
+    digest.update(source_file.encode())
+    digest.update(source_code.encode())
+    return digest.hexdigest()
+
+
+def cache_path(source_file, source_code, optimised):
+    source_file = os.path.abspath(source_file)
+    directory = os.path.join(os.path.dirname(source_file), cache_directory_name)
+    return os.path.join(directory, cache_key(source_file, source_code, optimised) + cache_suffix)
+
+
+def load(source_file, source_code, optimised):
+    # returns (generated_code, code_object) or None on a miss
+    path = cache_path(source_file, source_code, optimised)
+    try:
+        with open(path, "rb") as file:
+            generated_code, code_object = marshal.load(file)
+        os.utime(path) # the modification time is the entry's last use
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    return generated_code, code_object
+
+
+def store(source_file, source_code, optimised, generated_code, code_object):
+    path = cache_path(source_file, source_code, optimised)
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as file:
+            marshal.dump((generated_code, code_object), file)
+        os.replace(temporary_path, path)
+        evict(directory)
+    except OSError:
+        pass # the cache is only an optimisation, so an unwritable directory is not an error
+
+
+def evict(directory, max_size = None):
+    if max_size is None:
+        max_size = max_cache_size
+
+    entries = []
+    total_size = 0
+    for entry in os.scandir(directory):
+        if entry.name.endswith(cache_suffix):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total_size += stat.st_size
+
+    entries.sort()
+    for mtime, size, path in entries:
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total_size -= size
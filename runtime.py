@@ -0,0 +1,345 @@
+import os
+import re
+
+# the imports generated code may need, with the pattern of a line that uses each
+imports = {
+    "import pandas as pd": re.compile(r'\bpd\.'),
+    "from runtime import aggregate": re.compile(r'\baggregate\('),
+    "from runtime import filter_mask": re.compile(r'\bfilter_mask\('),
+    "from runtime import merge_files": re.compile(r'\bmerge_files\('),
+    "from runtime import prefetch": re.compile(r'\bprefetch\('),
+    "from runtime import top_n": re.compile(r'\btop_n\('),
+}
+
+# code objects compiled in this process, so running the same program again does not compile it again
+compiled_programs = {}
+
+
+def generate_with_line_map(statement_code, statement_lines):
+    # joins the code generated for each statement (exactly as generate_python_code does) and returns it with the
+    # .csvlang line of every generated line; a statement whose steps were all removed generates no lines
+    chunks = []
+    line_map = []
+    for code, line in zip(statement_code, statement_lines):
+        if not code:
+            continue
+        chunk = code + "\n"
+        chunks.append(chunk)
+        line_map.extend([line or 1] * chunk.count("\n"))
+    return "".join(chunks), line_map
+
+
+def place_imports(generated_code, line_map):
+    # importing pandas dominates the start-up time, so programs that never touch pd do not import it, and a program
+    # that uses pd before its first LOAD (an ADD after a CREATE) imports it just before that use. The other imports
+    # are only generated here, just before their first use; returns the code and its line map
+    for module_import, use_pattern in imports.items():
+        generated_code, line_map = place_import(generated_code, line_map, module_import, use_pattern)
+    return generated_code, line_map
+
+
+def place_import(generated_code, line_map, module_import, use_pattern):
+    lines = generated_code.splitlines()
+    import_index = lines.index(module_import) if module_import in lines else None
+    use_index = next((i for i, line in enumerate(lines) if use_pattern.search(line)), None)
+
+    if use_index is not None and import_index is not None and import_index < use_index:
+        return generated_code, line_map
+
+    if import_index is not None:
+        del lines[import_index]
+        line_map = line_map[:import_index] + line_map[import_index + 1:]
+        if use_index is not None and use_index > import_index:
+            use_index -= 1
+    if use_index is not None:
+        indentation = lines[use_index][:len(lines[use_index]) - len(lines[use_index].lstrip())]
+        lines.insert(use_index, indentation + module_import)
+        line_map = line_map[:use_index] + [line_map[use_index]] + line_map[use_index:]
+
+    return "\n".join(lines) + "\n", line_map
+
+
+def top_n(frame, keys, count):
+    # frame.sort_values(by=keys, kind="stable").head(count) without sorting every row: each of those rows has a first
+    # key no greater than the count-th smallest first key, so a partition finds that key and only the rows up to it
+    # are sorted. They stay in frame order, so rows with equal keys keep the order of the stable sort
+    import numpy as np
+    import pandas as pd
+
+    first = frame[keys[0]]
+    present = np.flatnonzero(first.notna().to_numpy())
+    # missing keys sort last, so they only matter when fewer than count rows have a key
+    if 0 < count < len(present):
+        values = first.to_numpy()[present]
+        try:
+            if values.dtype == object:
+                # strings compare in Python, so they are partitioned by their rank among the distinct keys
+                values = pd.factorize(values, sort=True)[0]
+            threshold = np.partition(values, count - 1)[count - 1]
+            frame = frame.iloc[present[values <= threshold]]
+        except TypeError:
+            # keys numpy cannot order, like numbers mixed with strings, are left to sort_values
+            pass
+    return frame.sort_values(by=keys, kind="stable").head(count)
+
+
+# rows of the sample that orders the terms of a conjunction, and the size from which a frame is sampled
+filter_sample_rows = 1024
+filter_sampled_rows = 1 << 16
+
+
+class FilterRows:
+    # the columns a term of a filter reads, at the rows that are still alive (all of them for None)
+    def __init__(self, frame, positions):
+        self.frame = frame
+        self.positions = positions
+        self.columns = {}
+
+    def __getitem__(self, column):
+        values = self.columns.get(column)
+        if values is None:
+            values = self.frame[column]
+            if self.positions is not None:
+                values = values.take(self.positions)
+            self.columns[column] = values
+        return values
+
+
+def term_mask(frame, term, positions):
+    import numpy as np
+
+    mask = np.array(term(FilterRows(frame, positions)), dtype=bool)
+    # a term without a column is the same for every row
+    return np.full(len(frame) if positions is None else len(positions), bool(mask)) if mask.ndim == 0 else mask
+
+
+def filter_mask(frame, terms):
+    # the rows of frame where every term (a function of the columns) holds, as a boolean mask. On a large frame the
+    # terms are ordered by how many rows of a sample pass them, fewest first. A term is computed for all rows while
+    # most of them are alive, and after that only for the rows every earlier term kept; once no row is left, the
+    # other terms are not computed
+    import numpy as np
+
+    rows = len(frame)
+    if len(terms) > 1 and rows >= filter_sampled_rows:
+        sample = np.linspace(0, rows - 1, filter_sample_rows).astype(np.intp)
+        passed = [np.count_nonzero(term_mask(frame, term, sample)) for term in terms]
+        terms = [terms[i] for i in sorted(range(len(terms)), key=passed.__getitem__)]
+
+    mask = term_mask(frame, terms[0], None)
+    for term in terms[1:]:
+        alive = np.count_nonzero(mask)
+        if alive == 0:
+            break
+        if alive * 2 > rows:
+            mask &= term_mask(frame, term, None)
+        else:
+            positions = np.flatnonzero(mask)
+            mask[positions] = term_mask(frame, term, positions)
+    return mask
+
+
+# rows of a column reduced at a time, small enough for the CPU cache to keep them for every function
+aggregate_block_rows = 1 << 16
+
+
+class Failed:
+    # an aggregate whose computation raised error
+    def __init__(self, error):
+        self.error = error
+
+
+class Aggregated:
+    # the results of aggregate(), in order; reading a result that failed raises its error
+    def __init__(self, values):
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, position):
+        value = self.values[position]
+        if isinstance(value, Failed):
+            raise value.error
+        return value
+
+
+def aggregate(frame, requests):
+    # the results of the (column, pandas method) requests of the PRINTs of one tag, in order; a column given by its
+    # position is requested as (position, method, True). The requests on an integer column are computed in one pass
+    # over the column, block by block; the others call the pandas method. A request that fails, like one of a column
+    # the frame lacks, only raises where its PRINT reads the result, so the PRINTs before that one still run
+    requests = [(request[0], request[1], len(request) > 2 and request[2]) for request in requests]
+    results = {}
+    for column, by_index in dict.fromkeys((column, by_index) for column, method, by_index in requests):
+        methods = list(dict.fromkeys(method for requested_column, method, requested_by_index in requests
+                                     if (requested_column, requested_by_index) == (column, by_index)))
+        try:
+            series = frame[frame.columns[column] if by_index else column]
+        except Exception as error:
+            values = [Failed(error)] * len(methods)
+        else:
+            try:
+                values = aggregate_column(series, methods)
+            except Exception:
+                values = [aggregate_method(series, method) for method in methods]
+        results.update(((column, by_index, method), value) for method, value in zip(methods, values))
+    return Aggregated([results[column, by_index, method] for column, method, by_index in requests])
+
+
+def aggregate_method(series, method):
+    try:
+        return getattr(series, method)()
+    except Exception as error:
+        return Failed(error)
+
+
+def aggregate_column(series, methods):
+    import numpy as np
+
+    fused = {"max", "min", "sum", "mean"}
+    if not (isinstance(series.dtype, np.dtype) and series.dtype.kind in "iu" and len(series)
+            and fused.issuperset(methods)):
+        return [getattr(series, method)() for method in methods]
+
+    values = series.to_numpy()
+    maxima = []
+    minima = []
+    sums = []
+    for start in range(0, len(values), aggregate_block_rows):
+        block = values[start:start + aggregate_block_rows]
+        maxima.append(block.max())
+        minima.append(block.min())
+        sums.append(block.sum())
+
+    # these are exactly what pandas returns: integer sums wrap around the same way in any order
+    results = {"max": np.max(maxima), "min": np.min(minima), "sum": np.sum(sums)}
+    if "mean" in methods:
+        # pandas adds the values up as floats, which is exact, and equal to the integer sum, while no partial sum can
+        # reach 2 ** 53
+        if max(abs(int(results["max"])), abs(int(results["min"]))) * len(values) < 2 ** 53:
+            results["mean"] = np.float64(results["sum"]) / np.float64(len(values))
+        else:
+            results["mean"] = series.mean()
+    return [results[method] for method in methods]
+
+
+# bytes copied at a time when the kernel cannot copy between the files itself
+merge_buffer_bytes = 1 << 20
+
+
+def merge_files(paths, output):
+    # MERGE with save = true of files read with a header, without parsing them: the header of the first file is
+    # written once and then the rows of every file, byte for byte. Returns False and writes nothing when the headers
+    # differ or pandas would not keep them as they are (quotes, empty or repeated names, an empty file), or when the
+    # output is one of the files, so the caller concatenates DataFrames instead
+    import os
+
+    headers = []
+    for path in paths:
+        with open(path, "rb") as file:
+            headers.append(file.readline())
+    names = headers[0].rstrip(b"\r\n")
+    fields = names.split(b",")
+    if any(header.rstrip(b"\r\n") != names for header in headers) or b'"' in names or b"\r" in names \
+            or not all(fields) or len(set(fields)) != len(fields):
+        return False
+    if any(os.path.realpath(path) == os.path.realpath(output) for path in paths):
+        return False
+
+    with open(output, "wb") as target:
+        target.write(headers[0] if headers[0].endswith(b"\n") else headers[0] + b"\n")
+        for path, header in zip(paths, headers):
+            with open(path, "rb") as source:
+                size = os.fstat(source.fileno()).st_size
+                if size == len(header):
+                    continue
+                copy_bytes(source, target, len(header), size - len(header))
+                source.seek(size - 1)
+                if source.read(1) != b"\n":
+                    target.write(b"\n")
+    return True
+
+
+def copy_bytes(source, target, offset, count):
+    # copies count bytes of source from offset to the end of target, inside the kernel where it can
+    import os
+    import shutil
+
+    target.flush()
+    try:
+        while count > 0:
+            copied = os.copy_file_range(source.fileno(), target.fileno(), count, offset)
+            if copied == 0:
+                break
+            offset += copied
+            count -= copied
+    except (AttributeError, OSError):
+        # no copy_file_range() on this platform, or not between these file systems
+        source.seek(offset)
+        shutil.copyfileobj(source, target, merge_buffer_bytes)
+
+
+# threads that read the files of LOADs ahead of them; with fewer than 2 each file is read at its LOAD
+load_threads = min(4, os.cpu_count() or 1)
+
+
+class Deferred:
+    # a read that is made when its LOAD asks for the DataFrame
+    def __init__(self, reader):
+        self.reader = reader
+
+    def result(self):
+        return self.reader()
+
+
+def prefetch(readers):
+    # starts the reads (functions returning a DataFrame) of the LOADs of files no earlier statement writes, in
+    # program order on a pool of load_threads threads, and returns a future of each, which its LOAD waits for. The C
+    # parser of pandas releases the GIL while it tokenises, so the files are parsed at the same time. A read that
+    # fails raises at its LOAD, as it does without the pool
+    if load_threads < 2:
+        return [Deferred(reader) for reader in readers]
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    pool = ThreadPoolExecutor(max_workers=load_threads, thread_name_prefix="csvlang-load")
+    futures = [pool.submit(reader) for reader in readers]
+    # the threads exit once the reads are done
+    pool.shutdown(wait=False)
+    return futures
+
+
+def compile_program(generated_code, filename = "<csvlang>", line_map = None, source_code = None):
+    # compiles the generated code once; with a line map the code object reports the .csvlang file and line of the
+    # statement that generated each line, so tracebacks and profiles point at the CSVLang source
+    key = (generated_code, filename, None if line_map is None else tuple(line_map))
+    code_object = compiled_programs.get(key)
+    if code_object is not None:
+        return code_object
+
+    if line_map is None:
+        code_object = compile(generated_code, filename, "exec")
+    else:
+        import ast
+
+        source_lines = source_code.splitlines() if source_code is not None else []
+        tree = ast.parse(generated_code, filename)
+        for node in ast.walk(tree):
+            if hasattr(node, "lineno") and node.lineno is not None:
+                line = line_map[node.lineno - 1] if node.lineno <= len(line_map) else 1
+                node.lineno = node.end_lineno = line
+                # the columns belong to the generated code, so the whole .csvlang line is reported instead
+                node.col_offset = 0
+                node.end_col_offset = len(source_lines[line - 1]) if line <= len(source_lines) else 0
+        code_object = compile(tree, filename, "exec")
+
+    compiled_programs[key] = code_object
+    return code_object
+
+
+def run_program(code_object):
+    # each run gets a fresh namespace, so programs never see the generator's globals or each other's tags
+    namespace = {"__name__": "__csvlang__", "__file__": code_object.co_filename}
+    exec(code_object, namespace)
+    return namespace
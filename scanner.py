@@ -1,4 +1,5 @@
 import argparse
+import re
 import sys
 
 
@@ -12,13 +13,17 @@ token_classes = {
     "STRING": "string", # any valid string
 }
 
+# error state of the DFA, reported by tokenize() in place of a token class
+ERROR = "error"
+
+keywords = frozenset(["LOAD", "CREATE", "ADD", "REMOVE", "DELETE", "DISPLAY", "STORE", "MERGE", "AVERAGE", "SUM",
+                      "MAX", "MIN", "COUNT", "PRINT", "save", "num", "sort", "filter", "tag", "path", "header"])
+literals = frozenset(["true", "false"])
+
 def is_keyword(lexeme):
-    keywords = ["LOAD", "CREATE", "ADD", "REMOVE", "DELETE", "DISPLAY", "STORE", "MERGE", "AVERAGE", "SUM",
-                "MAX", "MIN", "COUNT", "PRINT", "save", "num", "sort", "filter", "tag", "path", "header"]
     return lexeme in keywords
 
 def is_literal(lexeme):
-    literals = ["true", "false"]
     return lexeme in literals
 
 def is_operator(char):
@@ -33,7 +38,140 @@ def is_digit(char):
 def is_letter(char):
     return char.isalpha()
 
-def scanner(program):
+# master pattern with one alternative per DFA state, tried in the same priority order as char_scanner()
+master_pattern = re.compile(r'''
+    (?P<whitespace>\s+)
+  | (?P<word>[A-Za-z]+)
+  | (?P<number>[0-9]+)
+  | (?P<operator><>|<=|>=|[-+*/%=&|<>])
+  | (?P<separator>[(),;])
+  | (?P<string>"[^"]*"?)
+  | (?P<other>.)
+''', re.VERBOSE | re.DOTALL)
+
+def letter_run_end(program, i):
+    # non-ascii letters are rare, so they are matched here instead of in the master pattern
+    length = len(program)
+    while i < length and program[i].isalpha():
+        i += 1
+    return i
+
+def tokenize(program):
+    # yields (token_class, lexeme, line, column) lazily, or (ERROR, message, line, column) for invalid input
+    match = master_pattern.match
+    length = len(program)
+    position = 0
+    line = 1
+    line_start = 0
+
+    while position < length:
+        m = match(program, position)
+        state = m.lastgroup
+        start = position
+        position = m.end()
+
+        if state == "whitespace":
+            newlines = program.count("\n", start, position)
+            if newlines:
+                line += newlines
+                line_start = program.rindex("\n", start, position) + 1
+            continue
+
+        column = start - line_start + 1
+
+        if state == "word" or (state == "other" and is_letter(program[start])):
+            if state == "other" or (position < length and program[position] >= "\x80"):
+                position = letter_run_end(program, position)
+            lexeme = program[start:position]
+            if lexeme in keywords:
+                yield token_classes["KEYWORD"], lexeme, line, column # accepting state
+            elif lexeme in literals:
+                yield token_classes["LITERAL"], lexeme, line, column # accepting state
+            else:
+                yield ERROR, f"Invalid keyword or literal: {lexeme}", line, column
+
+        elif state == "number":
+            lexeme = m.group()
+            if lexeme[0] == "0" and len(lexeme) > 1:
+                yield ERROR, f"Invalid number with leading zero(s): {lexeme}", line, column
+            else:
+                yield token_classes["NUMBER"], lexeme, line, column # accepting state
+
+        elif state == "operator":
+            yield token_classes["OPERATOR"], m.group(), line, column # accepting state
+
+        elif state == "separator":
+            yield token_classes["SEPARATOR"], m.group(), line, column # accepting state
+
+        elif state == "string":
+            lexeme = m.group()
+            if len(lexeme) > 1 and lexeme[-1] == '"':
+                yield token_classes["STRING"], lexeme, line, column # accepting state
+            else:
+                yield ERROR, f"Unclosed string: {lexeme}", line, column
+            newlines = lexeme.count("\n")
+            if newlines:
+                line += newlines
+                line_start = program.rindex("\n", start, position) + 1
+
+        # Handle unrecognized character
+        else:
+            yield ERROR, f"Unrecognized character: {program[start]}", line, column
+
+# lexemes of every DFA state, for the ascii fast path of scanner()
+lexeme_pattern = re.compile(r'\s*([A-Za-z]+|[0-9]+|<>|<=|>=|[-+*/%=&|<>(),;]|"[^"]*"?|\S)|\s+\Z')
+
+fixed_token_classes = {lexeme: token_classes["KEYWORD"] for lexeme in keywords}
+fixed_token_classes.update({lexeme: token_classes["LITERAL"] for lexeme in literals})
+fixed_token_classes.update({lexeme: token_classes["OPERATOR"] for lexeme in ["<>", "<=", ">=", *"+-*/%=&|<>"]})
+fixed_token_classes.update({lexeme: token_classes["SEPARATOR"] for lexeme in "(),;"})
+
+def classify(lexeme):
+    first_char = lexeme[0]
+    if first_char == '"':
+        return token_classes["STRING"] if len(lexeme) > 1 and lexeme[-1] == '"' else ERROR
+    if is_digit(first_char):
+        return token_classes["NUMBER"] if first_char != "0" or len(lexeme) == 1 else ERROR
+    return ERROR
+
+def error_message(lexeme):
+    first_char = lexeme[0]
+    if first_char == '"':
+        return f"Unclosed string: {lexeme}"
+    if is_digit(first_char):
+        return f"Invalid number with leading zero(s): {lexeme}"
+    if is_letter(first_char):
+        return f"Invalid keyword or literal: {lexeme}"
+    return f"Unrecognized character: {lexeme}"
+
+def scanner(program, positions=False):
+    if positions or not program.isascii():
+        tokens = []
+        errors = []
+        for token_class, lexeme, line, column in tokenize(program):
+            if token_class == ERROR:
+                errors.append(lexeme)
+            elif positions:
+                tokens.append((token_class, lexeme, line, column))
+            else:
+                tokens.append((token_class, lexeme))
+        return tokens, errors
+
+    # ascii fast path: the regex engine slices every lexeme and the classes come from a dict lookup
+    lexemes = lexeme_pattern.findall(program)
+    if lexemes and not lexemes[-1]:
+        lexemes.pop() # trailing whitespace
+    token_class_of = fixed_token_classes.get
+    classes = [token_class_of(lexeme) or classify(lexeme) for lexeme in lexemes]
+    if ERROR not in classes:
+        return list(zip(classes, lexemes)), []
+
+    tokens = [(token_class, lexeme) for token_class, lexeme in zip(classes, lexemes) if token_class != ERROR]
+    errors = [error_message(lexeme) for token_class, lexeme in zip(classes, lexemes) if token_class == ERROR]
+    return tokens, errors
+
+# original character-by-character DFA, kept as the reference implementation for tests and benchmarks
+def char_scanner(program):
     i = 0
     length = len(program)
     tokens = []
@@ -0,0 +1,486 @@
+import math
+import operator
+import os
+import pickle
+import tempfile
+from functools import reduce
+
+import runtime
+from optimised_code_generator import optimisation_passes, prefetch_loads, reuse_shared_results
+from plan import Aggregate, Aggregates, AppendRows, Bind, ColumnExpr, Concat, CreateFile, DeleteFile, DeleteRows, \
+    Derive, Display, Filter, Limit, MergeFiles, Print, Project, Ref, Scan, Sort, TopN, Write
+from plan_generator import aggr_methods, frame_name
+from plan_interpreter import Interpreter, aggregate_column, literal
+
+# streaming execution: a LOAD is only read when a statement uses it, one chunk of rows at a time, and DISPLAY, STORE
+# and PRINT consume the chunks as they come, so a program holds about one chunk of each file it reads. A sort spills
+# sorted runs of rows to temporary files and merges them; only a REMOVE holds a whole file
+
+# a STORE cannot reuse the rows of the DISPLAY before it, since they are not kept, and reading whole files ahead
+# would hold them
+streaming_passes = [optimisation_pass for optimisation_pass in optimisation_passes
+                    if optimisation_pass not in [reuse_shared_results, prefetch_loads]]
+
+
+class ChunkedSource:
+    # the rows of a LOADed file, read again in chunks each time a statement uses them
+    def __init__(self, scan, chunk_rows):
+        import pandas as pd
+
+        self.path = literal(scan.path)
+        if scan.columns is not None:
+            self.options = {"header": 0, "usecols": lambda column: column in scan.columns}
+        else:
+            self.options = {"header": [0] if scan.header else None}
+        self.chunk_rows = chunk_rows
+        # reading the header now makes a missing file fail at its LOAD, like a read of the whole file
+        self.columns = pd.read_csv(self.path, nrows=0, **self.options).columns
+        self.dtypes = None
+
+    def column_dtypes(self):
+        # the dtype of each column in a read of the whole file: pandas infers it for each chunk, so a first pass over
+        # the chunks finds the type common to all of them, as read_csv does when it joins the blocks it parsed
+        import pandas as pd
+        from pandas.core.dtypes.cast import find_common_type
+
+        if self.dtypes is None:
+            chunk_dtypes = {}
+            with pd.read_csv(self.path, chunksize=self.chunk_rows, **self.options) as reader:
+                # a file without rows has no dtypes of its own
+                for chunk in reader:
+                    if len(chunk) == 0:
+                        continue
+                    for column, dtype in chunk.dtypes.items():
+                        chunk_dtypes.setdefault(column, []).append(dtype)
+            self.dtypes = {column: find_common_type(dtypes) for column, dtypes in chunk_dtypes.items()}
+        return self.dtypes
+
+    def chunks(self):
+        import pandas as pd
+
+        dtypes = self.column_dtypes()
+        with pd.read_csv(self.path, chunksize=self.chunk_rows, **self.options) as reader:
+            empty = True
+            for chunk in reader:
+                empty = False
+                # a chunk whose own values give a column a narrower dtype, like integers before the first missing
+                # value, is cast to the dtype of the whole file
+                casts = {column: dtype for column, dtype in dtypes.items() if chunk[column].dtype != dtype}
+                yield chunk.astype(casts) if casts else chunk
+        if empty:
+            # an empty file still has its columns
+            yield pd.read_csv(self.path, nrows=0, **self.options)
+
+    def read(self):
+        import pandas as pd
+
+        return pd.read_csv(self.path, **self.options)
+
+
+class PartialAggregate:
+    # a pandas aggregate method computed chunk by chunk, the partial results of the chunks merged at the end
+    def __init__(self, method):
+        self.method = method
+        self.partials = []
+        self.rows = 0
+        self.values = set()
+        self.empty = None
+
+    def add(self, series):
+        if len(series) == 0:
+            self.empty = series
+        elif self.method == "nunique":
+            self.values.update(series.dropna().unique())
+        elif self.method == "mean":
+            # pandas sums integers and booleans as floats for a mean, so large integers do not wrap around
+            self.partials.append((series.astype("float64") if series.dtype.kind in "iub" else series).sum())
+            self.rows += series.count()
+        else:
+            self.partials.append(getattr(series, self.method)())
+
+    def result(self):
+        import numpy as np
+        import pandas as pd
+
+        if self.method == "nunique":
+            return len(self.values)
+        if not self.partials:
+            return getattr(self.empty, self.method)()
+        if self.method == "sum":
+            return partial_sum(self.partials)
+        elif self.method == "mean":
+            return partial_sum(self.partials) / self.rows if self.rows else np.nan
+        # the minimum or maximum of the chunks that have a value
+        return getattr(pd.Series(self.partials), self.method)()
+
+
+def partial_sum(partials):
+    # float sums are rounded once by math.fsum, so they do not depend on where the chunks end; integers wrap around
+    # as they do in pandas, and infinities are left to +
+    import numpy as np
+
+    if all(isinstance(partial, (float, np.floating)) and math.isfinite(partial) for partial in partials):
+        return np.float64(math.fsum(partials))
+    return reduce(operator.add, partials)
+
+
+def aggregate_result(partial):
+    try:
+        return partial.result()
+    except Exception as error:
+        return runtime.Failed(error)
+
+
+def frame_text(chunks):
+    # print(frame) of the rows of all chunks, keeping only the rows it shows: all of them up to display.max_rows,
+    # the first and last display.min_rows / 2 beyond that
+    import pandas as pd
+    from pandas.io.formats.format import get_dataframe_repr_params
+
+    params = get_dataframe_repr_params()
+    max_rows = params["max_rows"]
+    shown = min(params["min_rows"], max_rows) if max_rows and params["min_rows"] else max_rows
+    if not max_rows or shown < 2:
+        return repr(pd.concat(list(chunks)))
+
+    half = shown // 2
+    head = None
+    tail = None
+    rows = 0
+    for chunk in chunks:
+        rows += len(chunk)
+        head = chunk.head(max_rows + 1) if head is None else pd.concat([head, chunk.head(max_rows + 1 - len(head))])
+        tail = chunk.tail(half) if tail is None else pd.concat([tail, chunk]).tail(half)
+
+    if rows <= max_rows:
+        return repr(head)
+    # one row more than is shown, so to_string() leaves out the middle row as it would all the middle rows
+    frame = pd.concat([head.head(half + 1), tail])
+    text = frame.to_string(**{**params, "max_rows": 2 * half, "min_rows": 2 * half, "show_dimensions": False})
+    if params["show_dimensions"]:
+        text += f"\n\n[{rows} rows x {len(frame.columns)} columns]"
+    return text
+
+
+# the most runs of an external sort merged at once; a run is spilled in blocks of 1 / merge_fan_in of the rows of a
+# run, so the blocks that are merged hold about as many rows as one run, but at least merge_block_rows rows, since
+# each step of a merge costs about as much as sorting a few thousand rows
+merge_fan_in = 16
+merge_block_rows = 1024
+
+
+def write_run(frames, directory, block_rows):
+    # spills the rows of sorted frames to a file, in blocks that are read back one at a time
+    file_descriptor, path = tempfile.mkstemp(suffix=".run", dir=directory)
+    with os.fdopen(file_descriptor, "wb") as file:
+        for frame in frames:
+            for start in range(0, len(frame), block_rows):
+                pickle.dump(frame.iloc[start:start + block_rows], file, pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def read_run(path):
+    with open(path, "rb") as file:
+        while True:
+            try:
+                yield pickle.load(file)
+            except EOFError:
+                return
+
+
+def merge_runs(runs, keys):
+    # the rows of sorted runs (iterators of frames), sorted, as a stable sort of the runs one after the other would
+    # put them. Each step sorts the current block of every run and returns the rows up to the last row of the block
+    # that comes first: no row of a block not read yet can come before it
+    import numpy as np
+    import pandas as pd
+
+    active = [(block, run) for block, run in ((next(run, None), run) for run in runs) if block is not None]
+    while len(active) > 1:
+        blocks = [block for block, run in active]
+        combined = pd.concat(blocks)
+        order = combined[keys].reset_index(drop=True).sort_values(by=keys, kind="stable").index.to_numpy()
+        ranks = np.empty(len(order), dtype=np.intp)
+        ranks[order] = np.arange(len(order))
+        ends = np.cumsum([len(block) for block in blocks])
+        taken = order[:ranks[ends - 1].min() + 1]
+        yield combined.iloc[taken]
+
+        counts = np.bincount(np.repeat(np.arange(len(blocks)), [len(block) for block in blocks])[taken],
+                             minlength=len(blocks))
+        remaining = []
+        for (block, run), count in zip(active, counts):
+            block = block.iloc[count:]
+            if len(block) == 0:
+                block = next(run, None)
+            if block is not None:
+                remaining.append((block, run))
+        active = remaining
+
+    for block, run in active:
+        yield block
+        yield from run
+
+
+def concat_dtypes(frames, columns):
+    # the dtype of each column of pd.concat() of frames (DataFrames or ChunkedSources): the type common to the frames
+    # with rows, as in a read of one file. A column some frame lacks is missing in its rows, so integers in it become
+    # floats, and booleans objects
+    import numpy as np
+    from pandas.core.dtypes.cast import find_common_type
+
+    frame_dtypes = [frame.column_dtypes() if isinstance(frame, ChunkedSource) else
+                    dict(frame.dtypes) if len(frame) else {} for frame in frames]
+    dtypes = {}
+    for column in columns:
+        found = [frame_dtype[column] for frame_dtype in frame_dtypes if column in frame_dtype]
+        if not found:
+            continue
+        dtype = find_common_type(found)
+        if any(column not in frame.columns for frame in frames) and dtype.kind in "iub":
+            dtype = np.dtype("float64") if dtype.kind in "iu" else np.dtype(object)
+        dtypes[column] = dtype
+    return dtypes
+
+
+def same_file(path, other):
+    return os.path.abspath(path) == os.path.abspath(other)
+
+
+class StreamingInterpreter(Interpreter):
+    def __init__(self, chunk_rows, run_rows = None, spill_directory = None):
+        super().__init__()
+        self.chunk_rows = chunk_rows
+        # the rows a sort holds, and where it spills them
+        self.run_rows = chunk_rows if run_rows is None else run_rows
+        self.spill_directory = spill_directory
+        # the chunk each relation being streamed evaluates to, by id() of the relation
+        self.chunk_inputs = {}
+
+    def evaluate(self, relation):
+        chunk = self.chunk_inputs.get(id(relation))
+        if chunk is not None:
+            return chunk
+        if isinstance(relation, Ref) and isinstance(self.frames[relation.tag], ChunkedSource):
+            return self.frames[relation.tag].read()
+        return super().evaluate(relation)
+
+    def evaluate_on(self, relation, source, chunk):
+        # relation, with its input source evaluating to chunk
+        self.chunk_inputs[id(source)] = chunk
+        try:
+            return super().evaluate(relation)
+        finally:
+            del self.chunk_inputs[id(source)]
+
+    def chunks(self, relation):
+        # the rows of relation, as frames that together are what evaluate() returns
+        import pandas as pd
+
+        if isinstance(relation, Ref):
+            source = self.frames[relation.tag]
+            if not isinstance(source, ChunkedSource):
+                yield source
+                return
+            try:
+                for chunk in source.chunks():
+                    # filter and sort expressions read the tag, which is the current chunk
+                    self.frames[relation.tag] = chunk
+                    yield chunk
+            finally:
+                self.frames[relation.tag] = source
+
+        elif isinstance(relation, (Filter, Project, ColumnExpr, Derive)):
+            source = relation.input
+            if isinstance(relation, Filter) and isinstance(relation.input, Project) and not relation.input.by_index:
+                source = relation.input.input
+            for chunk in self.chunks(source):
+                yield self.evaluate_on(relation, source, chunk)
+
+        elif isinstance(relation, Limit):
+            remaining = relation.count
+            stream = self.chunks(relation.input)
+            try:
+                for chunk in stream:
+                    yield chunk.head(remaining)
+                    remaining -= min(remaining, len(chunk))
+                    if remaining == 0:
+                        # the rest of the file is not read
+                        break
+            finally:
+                stream.close()
+
+        elif isinstance(relation, Sort):
+            yield from self.sorted_chunks(relation, None)
+
+        elif isinstance(relation, TopN) and relation.count > self.run_rows:
+            yield from self.sorted_chunks(relation, relation.count)
+
+        elif isinstance(relation, TopN):
+            # the first rows of the rows so far and a chunk are the first rows of both
+            best = None
+            for chunk in self.chunks(relation.input):
+                rows = chunk if best is None else pd.concat([best, chunk])
+                best = runtime.top_n(rows, self.keys(relation), relation.count)
+            yield best
+
+        elif isinstance(relation, Concat) and all(isinstance(item, Ref) for item in relation.relations):
+            # the columns of all tags, in the order pd.concat() puts them, each with the dtype pd.concat() gives it
+            frames = [self.frames[item.tag] for item in relation.relations]
+            columns = pd.concat([pd.DataFrame(columns=frame.columns) for frame in frames]).columns
+            dtypes = concat_dtypes(frames, columns)
+            for item in relation.relations:
+                for chunk in self.chunks(item):
+                    if not chunk.columns.equals(columns):
+                        chunk = chunk.reindex(columns=columns)
+                    casts = {column: dtype for column, dtype in dtypes.items() if chunk[column].dtype != dtype}
+                    yield chunk.astype(casts) if casts else chunk
+
+        else:
+            yield self.evaluate(relation)
+
+    def sorted_chunks(self, relation, count):
+        # the first count (all for None) rows of the input of relation, sorted by its keys with an external merge
+        # sort: sorted runs of run_rows rows are spilled and merged, merge_fan_in at a time
+        import pandas as pd
+
+        block_rows = max(merge_block_rows, self.run_rows // merge_fan_in)
+        readers = []
+        with tempfile.TemporaryDirectory(prefix="csvlang-sort-", dir=self.spill_directory) as directory:
+            try:
+                runs = []
+                buffered = []
+                rows = 0
+                keys = None
+                for chunk in self.chunks(relation.input):
+                    if keys is None:
+                        # by index keys are columns of the first chunk of a1 when the sort reads derived columns
+                        keys = self.keys(relation)
+                    buffered.append(chunk)
+                    rows += len(chunk)
+                    if rows >= self.run_rows:
+                        run = pd.concat(buffered).sort_values(by=keys, kind="stable").head(count)
+                        runs.append(write_run([run], directory, block_rows))
+                        buffered = []
+                        rows = 0
+
+                last = pd.concat(buffered).sort_values(by=keys, kind="stable").head(count) if buffered else None
+                if not runs:
+                    # the rows fit in one run
+                    yield last
+                    return
+                if rows:
+                    runs.append(write_run([last], directory, block_rows))
+
+                while len(runs) > merge_fan_in:
+                    groups = [runs[start:start + merge_fan_in] for start in range(0, len(runs), merge_fan_in)]
+                    merged = []
+                    for group in groups:
+                        group_readers = [read_run(path) for path in group]
+                        readers.extend(group_readers)
+                        merged.append(write_run(merge_runs(group_readers, keys), directory, block_rows))
+                        for reader in group_readers:
+                            reader.close()
+                        for path in group:
+                            os.remove(path)
+                    runs = merged
+
+                readers.extend(read_run(path) for path in runs)
+                remaining = count
+                for frame in merge_runs(readers[-len(runs):], keys):
+                    if remaining is not None:
+                        frame = frame.head(remaining)
+                        remaining -= len(frame)
+                    yield frame
+                    if remaining == 0:
+                        # the rest of the runs is not merged
+                        break
+            finally:
+                # the open runs are closed before their directory is removed, also when the sort fails or its rows are
+                # not all read
+                for reader in readers:
+                    reader.close()
+
+    def keys(self, relation):
+        # by index keys name columns of the tag, a ChunkedSource while no chunk of it is read
+        if relation.by_index and isinstance(self.frames.get(frame_name(relation)), ChunkedSource):
+            columns = self.frames[frame_name(relation)].columns
+            return [columns[i] for i in [key - 1 for key in relation.keys]]
+        return super().keys(relation)
+
+    def aggregates(self, relation, requests):
+        # as with runtime.aggregate, a request that fails only raises where its result is read
+        partials = [PartialAggregate(aggr_methods[function]) for column, function, by_index in requests]
+        for chunk in self.chunks(relation):
+            for i, (column, function, by_index) in enumerate(requests):
+                if isinstance(partials[i], runtime.Failed):
+                    continue
+                try:
+                    partials[i].add(chunk[aggregate_column(chunk, column, by_index)])
+                except Exception as error:
+                    partials[i] = runtime.Failed(error)
+        return runtime.Aggregated([partial if isinstance(partial, runtime.Failed) else aggregate_result(partial)
+                                   for partial in partials])
+
+    def write_chunks(self, relation, path):
+        first = True
+        for chunk in self.chunks(relation):
+            chunk.to_csv(path, index=False, header=first, mode="w" if first else "a")
+            first = False
+
+    def materialise(self, path):
+        # a file that is about to change is read first by the LOADs that have not read it yet
+        read = {}
+        for tag, frame in self.frames.items():
+            if isinstance(frame, ChunkedSource) and same_file(frame.path, path):
+                if id(frame) not in read:
+                    read[id(frame)] = frame.read()
+                self.frames[tag] = read[id(frame)]
+
+    def run_step(self, step):
+        import pandas as pd
+
+        if isinstance(step, Bind):
+            if isinstance(step.relation, Scan):
+                self.frames[step.tag] = ChunkedSource(step.relation, self.chunk_rows)
+            elif isinstance(step.relation, Ref):
+                self.frames[step.tag] = self.frames[step.relation.tag]
+            elif isinstance(step.relation, Aggregates):
+                self.frames[step.tag] = self.aggregates(step.relation.input, step.relation.aggregates)
+            else:
+                self.frames[step.tag] = pd.concat(list(self.chunks(step.relation)))
+
+        elif isinstance(step, Display):
+            print(frame_text(self.chunks(step.relation)))
+            print()
+
+        elif isinstance(step, Write):
+            self.materialise(literal(step.path))
+            self.write_chunks(step.relation, literal(step.path))
+
+        elif isinstance(step, MergeFiles):
+            self.materialise(literal(step.path))
+            paths = [literal(path) for path in step.paths]
+            if not runtime.merge_files(paths, literal(step.path)):
+                # the files are read again chunk by chunk, under tags no program can name
+                tags = [("merge", i) for i in range(len(paths))]
+                for tag, path in zip(tags, step.paths):
+                    self.frames[tag] = ChunkedSource(Scan(path, True), self.chunk_rows)
+                try:
+                    self.write_chunks(Concat([Ref(tag) for tag in tags]), literal(step.path))
+                finally:
+                    for tag in tags:
+                        del self.frames[tag]
+
+        elif isinstance(step, Print) and isinstance(step.aggregate, Aggregate):
+            aggregate = step.aggregate
+            value = self.aggregates(aggregate.input, [(aggregate.column, aggregate.function, aggregate.by_index)])[0]
+            print(literal(step.message), value)
+
+        else:
+            if isinstance(step, (AppendRows, DeleteRows, CreateFile, DeleteFile)):
+                self.materialise(literal(step.path))
+            if isinstance(step, DeleteRows) and isinstance(self.frames[step.tag], ChunkedSource):
+                # REMOVE rewrites the file from the rows of the tag
+                self.frames[step.tag] = self.frames[step.tag].read()
+            super().run_step(step)
@@ -1,6 +1,6 @@
 import sys
 sys.path.append(sys.path[0] + '/../..')
-from scanner import scanner
+from scanner import scanner, char_scanner
 
 
 def test_scanner():
@@ -167,5 +167,28 @@ def test_scanner():
     print("All tests passed!")
 
 
+def test_scanner_positions():
+    # Test case 1: Line and column offsets of every token
+    program1 = 'LOAD ("a.csv",\n  header = true);\n"x\ny" @ 02'
+
+    tokens, errors = scanner(program1, positions = True)
+    expected_tokens = [('keyword', 'LOAD', 1, 1), ('separator', '(', 1, 6), ('string', '"a.csv"', 1, 7),
+                       ('separator', ',', 1, 14), ('keyword', 'header', 2, 3), ('operator', '=', 2, 10),
+                       ('literal', 'true', 2, 12), ('separator', ')', 2, 16), ('separator', ';', 2, 17),
+                       ('string', '"x\ny"', 3, 1)]
+    expected_errors = ['Unrecognized character: @', 'Invalid number with leading zero(s): 02']
+
+    assert tokens == expected_tokens, "Test case 1 failed"
+    assert errors == expected_errors, "Test case 1 failed"
+
+    # Test case 2: Same tokens and errors as the character-by-character DFA
+    program2 = 'DISPLAY ("goods", num = 0, sort = (1)) <> >= <= < > é MAXIMUM TRUE "open \n'
+    for program in [program1, program2, program2 + "  ", program2.replace("é", "e")]:
+        assert scanner(program) == char_scanner(program), "Test case 2 failed"
+
+    print("All tests passed!")
+
+
 if __name__ == "__main__":
     test_scanner()
+    test_scanner_positions()
@@ -3,7 +3,8 @@ import unittest
 from unittest.mock import patch
 import sys
 sys.path.append(sys.path[0] + '/../..')
-from parser import main
+from parser import main, parse_source, ASTArena, Parser, Token
+from incremental import IncrementalParser
 
 
 class TestParser(unittest.TestCase):
@@ -221,5 +222,132 @@ Aggregate function should have a column name or a column index as the parameter
 
 
 
+    # Testing the lazy token stream
+    def test_lazy_token_stream(self):
+        statement = 'DISPLAY ("goods", "sales", num = 2, sort = ("goods"), filter = ("sales" >= 10));\n'
+
+        ast, parser, errors = parse_source(statement * 2000)
+
+        self.assertEqual([], errors)
+        self.assertTrue(parser.is_success)
+        self.assertEqual(2000, len(ast.children))
+        self.assertLess(len(parser.tokens.buffer), 128)
+
+        tokens = (Token(token_type, value) for token_type, value in [("keyword", "DELETE"), ("separator", "("),
+                  ("keyword", "tag"), ("operator", "="), ("string", '"a"'), ("separator", ")"), ("separator", ";")])
+        ast, is_success = Parser(tokens).parse()
+        self.assertTrue(is_success)
+        self.assertEqual("DELETE-STMT", ast.children[0].node_type)
+
+        ast, parser, errors = parse_source('LOAD ("a.csv" header = true);\nDISPLAY (02, @);')
+        self.assertIsNone(ast)
+        self.assertEqual(['Invalid number with leading zero(s): 02', 'Unrecognized character: @'], errors)
+
+
+    # Testing the flat arena representation of the AST
+    def test_ast_arena(self):
+        with open('../../sample_programs/programming_assignment_2/Program3.csvlang') as file:
+            ast, parser, errors = parse_source(file.read())
+
+        arena = ASTArena.from_tree(ast)
+        self.assertEqual(ast.kind, arena.root().kind)
+
+        with patch('sys.stdout', new=io.StringIO()) as tree_output:
+            ast.display_tree()
+        with patch('sys.stdout', new=io.StringIO()) as arena_output:
+            arena.root().display_tree()
+        self.assertEqual(tree_output.getvalue(), arena_output.getvalue())
+
+        print_stmt = arena.root().children[3]
+        self.assertEqual("PRINT-STMT", print_stmt.node_type)
+        self.assertEqual('"The maximum sales: "', print_stmt.children[0].value)
+        self.assertIsNone(print_stmt.children[2])
+
+    # Testing flat n-ary & / | conditions and operator precedence
+    def test_condition_precedence(self):
+        def filter_node(condition):
+            ast, parser, errors = parse_source(f'DISPLAY ("goods", filter = ({condition}));')
+            self.assertTrue(parser.is_success)
+            return ast.children[0].children[1].children[2]
+
+        node = filter_node(" | ".join(f'"goods" = "item{i}"' for i in range(5000)))
+        self.assertEqual(9999, len(node.children))
+        self.assertEqual("|", node.children[1].value)
+
+        node = filter_node('("a" = 1 & "b" = 2) | "c" + 1 * 2 > 3')
+        self.assertEqual("|", node.children[1].value)
+        self.assertEqual("&", node.children[0].children[1].value)
+        comparison = node.children[2]
+        self.assertEqual(">", comparison.children[1].value)
+        self.assertEqual("+", comparison.children[0].children[1].value)
+        self.assertEqual("*", comparison.children[0].children[2].children[1].value)
+
+        node = filter_node('("a" = 1 & "b" = 2) & "c" = 3')
+        self.assertEqual(3, len(node.children))
+
+        node = filter_node('"a" = 1 & (' * 2000 + '"a" = 1' + ")" * 2000)
+        for depth in range(2000):
+            self.assertEqual("&", node.children[1].value)
+            node = node.children[2]
+        self.assertEqual("=", node.children[1].value)
+
+    # Testing that & and | mixed without parentheses group from the right, as the recursive parser grouped them
+    def test_mixed_logical_operators(self):
+        def grouping(condition):
+            ast, parser, errors = parse_source(f'DISPLAY ("x", "y", filter = ({condition}));')
+            self.assertTrue(parser.is_success, condition)
+            node = ast.children[0].children[1].children[2]
+            return [child.children[1].value if child.node_type == 'CONDITION' and len(child.children) > 1
+                    else child.value for child in node.children]
+
+        self.assertEqual(["=", "&", "|"], grouping('"x" = 1 & "y" = 5 | "x" = 3'))
+        self.assertEqual(["=", "|", "&"], grouping('"x" = 1 | "y" = 5 & "x" = 3'))
+        self.assertEqual(["=", "&", "=", "&", "|"], grouping('"x" = 1 & "y" = 5 & "x" = 3 | "y" = 2 & "x" = 4'))
+        self.assertEqual(["=", "&", "|"], grouping('("x" = 1) & ("y" = 5 | "x" = 2 & "y" = 9)'))
+
+        for condition, grouping in [('"x" = 1 & ("y" = 5 | "x" = 3)', ["=", "|"]),
+                                    ('("x" = 1 & "y" = 5) | "x" = 3', ["&", "="])]:
+            ast, parser, errors = parse_source(f'DISPLAY ("x", "y", filter = ({condition}));')
+            self.assertTrue(parser.is_success)
+            node = ast.children[0].children[1].children[2]
+            self.assertEqual(grouping, [node.children[0].children[1].value, node.children[2].children[1].value])
+
+    # Testing the incremental re-parse of changed statements
+    def test_incremental_parser(self):
+        def display(ast):
+            with patch('sys.stdout', new=io.StringIO()) as output:
+                ast.display_tree()
+            return output.getvalue()
+
+        with open('../../sample_programs/programming_assignment_2/Program3.csvlang') as file:
+            source_code = file.read()
+
+        incremental = IncrementalParser()
+        ast, errors = incremental.update(source_code)
+        self.assertEqual([], errors)
+        self.assertTrue(incremental.is_success)
+        self.assertEqual(display(parse_source(source_code)[0]), display(ast))
+        first_statement = ast.children[0]
+
+        ast, errors = incremental.update(source_code)
+        self.assertEqual(0, incremental.reparsed)
+
+        edited = source_code.replace('"sales"', '"sale"', 1)
+        ast, errors = incremental.update(edited)
+        self.assertEqual(1, incremental.reparsed)
+        self.assertIs(first_statement, ast.children[0])
+        self.assertEqual(display(parse_source(edited)[0]), display(ast))
+
+        broken = 'DISPLAY ("a");\nDISPLAY ("a" num = 2);\nDISPLAY ("b");\nDISPLAY (;'
+        ast, errors = incremental.update(broken)
+        ast, parser, full_errors = parse_source(broken)
+        self.assertFalse(incremental.is_success)
+        self.assertEqual(parser.errors, incremental.errors)
+
+        ast, errors = incremental.update('DISPLAY ("a");\nDISPLAY (02, @);')
+        self.assertIsNone(ast)
+        self.assertEqual(['Invalid number with leading zero(s): 02', 'Unrecognized character: @'], errors)
+
+
 if __name__ == '__main__':
     unittest.main()
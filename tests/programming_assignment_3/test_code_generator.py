@@ -1,9 +1,17 @@
 import io
+import os
+import shutil
 import sys
+import tempfile
+import traceback
 import unittest
 from unittest.mock import patch
 sys.path.append(sys.path[0] + '/../..')
-from code_generator import main
+from code_generator import main, compile_source
+from plan_generator import generate_filter_expression
+from parser import parse_source
+import program_cache
+import runtime
 
 
 class TestCodeGenerator(unittest.TestCase):
@@ -86,7 +94,7 @@ from pathlib import Path
 import pandas as pd
 
 a0 = pd.read_csv("csv_files/sales.csv", header=[0])
-a4 = (a0.sort_values(by=['goods']).head(2))
+a4 = (a0.sort_values(by=['goods'], kind="stable").head(2))
 print(a4.loc[:, ['goods', 'sales']])
 print()
 a4 = (a0.sort_values(by=[]).loc[(((a0["sales"] >= 10) & (a0["goods"] == "Paper")) | (a0["sales"] == 5))])
@@ -129,6 +137,97 @@ Expected string, found keyword header at line 1'''
             self.assertEqual(expected_output, received_output.strip())
 
 
+    # Testing filters with many & / | terms
+    def test_large_filters(self):
+        def filter_node(condition):
+            ast, parser, errors = parse_source(f'DISPLAY ("goods", filter = ({condition}));')
+            return ast.children[0].children[1].children[2]
+
+        allow_list = " | ".join(f'"goods" = "item{i}"' for i in range(10000))
+        expression = generate_filter_expression(filter_node(allow_list), 'a0')
+        self.assertTrue(expression.startswith('(a0["goods"].isin(["item0", "item1", '))
+
+        conjunction = " & ".join(f'"sales" > {i}' for i in range(10000))
+        expression = generate_filter_expression(filter_node(conjunction), 'a0')
+        self.assertTrue(expression.startswith('(pd.concat([(a0["sales"] > 0), (a0["sales"] > 1), '))
+        self.assertTrue(expression.endswith('], axis=1).all(axis=1))'))
+        compile(expression, '<filter>', 'eval')
+
+        expression = generate_filter_expression(filter_node('("sales" > 1 & "sales" < 9) | "goods" = "Pen"'), 'a0')
+        self.assertEqual('(((a0["sales"] > 1) & (a0["sales"] < 9)) | (a0["goods"] == "Pen"))', expression)
+
+    # Testing the compiled program cache
+    def test_program_cache(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        program = os.path.join(directory, 'Program1.csvlang')
+        shutil.copy('sample_programs/programming_assignment_3/Program1.csvlang', program)
+
+        def run(*options):
+            with patch('sys.argv', ['code_generator.py', program, *options]):
+                with patch('sys.stdout', new=io.StringIO()) as mocked_stdout:
+                    main()
+            return mocked_stdout.getvalue()
+
+        first_output = run()
+        cache_directory = os.path.join(directory, program_cache.cache_directory_name)
+        self.assertEqual(1, len(os.listdir(cache_directory)))
+
+        # a hit does not scan, parse or generate code
+        with patch('parser.parse_source', side_effect=AssertionError):
+            self.assertEqual(first_output, run())
+            self.assertRaises(AssertionError, run, '--no-cache')
+
+        with open(program, 'a') as file:
+            file.write('\n')
+        self.assertEqual(first_output, run())
+        self.assertEqual(2, len(os.listdir(cache_directory)))
+
+        program_cache.evict(cache_directory, 0)
+        self.assertEqual([], os.listdir(cache_directory))
+
+    # Testing compiled code objects that report .csvlang lines
+    def test_compile_program(self):
+        source_code = ('LOAD ("csv_files/sales.csv", header = true);\n\nDISPLAY ("goods", num = 1);\n'
+                       'PRINT ("Total: ",\n    SUM("missing"));\n')
+        generated_code, line_map = compile_source(source_code)
+        self.assertEqual(len(generated_code.splitlines()), len(line_map))
+        self.assertEqual([1, 1, 1, 1, 3, 3, 3, 4], line_map)
+
+        code_object = runtime.compile_program(generated_code, 'Program.csvlang', line_map, source_code)
+        self.assertIs(code_object, runtime.compile_program(generated_code, 'Program.csvlang', line_map, source_code))
+
+        with patch('sys.stdout', new=io.StringIO()):
+            try:
+                runtime.run_program(code_object)
+                frames = []
+            except KeyError as error:
+                frames = traceback.extract_tb(error.__traceback__)
+        self.assertIn(('Program.csvlang', 4), [(frame.filename, frame.lineno) for frame in frames])
+
+        code_object = runtime.compile_program('a0 = 1\n')
+        self.assertEqual(1, runtime.run_program(code_object)['a0'])
+        self.assertNotIn('a0', runtime.run_program(runtime.compile_program('b0 = 2\n')))
+
+    # Testing that pandas is only imported by programs that use it
+    def test_lazy_pandas_import(self):
+        generated_code, line_map = compile_source('PRINT ("Started");\nPRINT ("Finished");\n')
+        self.assertEqual('print("Started")\nprint("Finished")\n', generated_code)
+        self.assertEqual([1, 2], line_map)
+
+        generated_code, line_map = compile_source('CREATE ("out.csv");\nADD (("a", "b"), ("1", "2"));\n'
+                                                  'DISPLAY ("a", header = true);\n')
+        lines = generated_code.splitlines()
+        self.assertEqual('import pandas as pd', lines[4])
+        self.assertTrue(lines[5].startswith('a0 = pd.read_csv("out.csv"'))
+        self.assertEqual(len(lines), len(line_map))
+        self.assertEqual(2, line_map[4])
+
+        generated_code, line_map = compile_source('LOAD ("csv_files/sales.csv", header = true, tag = "batch");\n'
+                                                  'DELETE (tag = "batch");\n')
+        self.assertNotIn('import pandas as pd', generated_code)
+        self.assertIn('from pathlib import Path', generated_code)
+
 
 if __name__ == '__main__':
     unittest.main()
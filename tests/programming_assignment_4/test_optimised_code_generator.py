@@ -1,9 +1,19 @@
 import io
+import os
 import sys
+import tempfile
 import unittest
 from unittest.mock import patch
 sys.path.append(sys.path[0] + '/../..')
-from optimised_code_generator import main
+from optimised_code_generator import copy_merged_files, filter_before_sort, fuse_aggregates, generate_python_code, \
+    lift_column_expressions, main, prefetch_loads, prune_loaded_columns, reuse_loaded_files, reuse_shared_results, \
+    simplify_filters
+from parser import parse_source
+from plan import Aggregate, Aggregates, AppendRows, Bind, Concat, CreateFile, Display, Filter, Limit, MergeFiles, \
+    Prefetch, Prefetched, Project, Ref, Scan, Shared, Sort, Write, base_tag, build_plan, optimise, relations, \
+    remove_dead_loads, rule_pass
+from plan_generator import generate_filter_expression
+from runtime import aggregate, filter_mask, merge_files, prefetch, top_n
 
 
 class TestCodeGenerator(unittest.TestCase):
@@ -22,11 +32,10 @@ class TestCodeGenerator(unittest.TestCase):
 from pathlib import Path
 import pandas as pd
 
-a0 = pd.read_csv("csv_files/student_scores.csv", header=[0])
-a4 = (a0.sort_values(by=[]).head(2))
+a0 = pd.read_csv("csv_files/student_scores.csv", header=0, usecols=lambda column: column in ['name', 'score'])
+a4 = (a0.head(2))
 print(a4.loc[:, ['name', 'score']])
 print()
-a4 = (a0.sort_values(by=[]).head(2))
 a4.loc[:, ['name', 'score']].to_csv("csv_files/student_scores_new.csv", index=False)
 print("")
 print("The average score: ", a0["score"].mean())
@@ -56,17 +65,20 @@ The average score:  19.0'''
 
 from pathlib import Path
 import pandas as pd
+from runtime import aggregate
+from runtime import top_n
 
-a0 = pd.read_csv("csv_files/sales.csv", header=[0])
-a4 = (a0.sort_values(by=['goods']).head(2))
+a0 = pd.read_csv("csv_files/sales.csv", header=0, usecols=lambda column: column in ['goods', 'sales'])
+a4 = (top_n(a0, ['goods'], 2))
 print(a4.loc[:, ['goods', 'sales']])
 print()
-a4 = (a0.sort_values(by=[]).loc[(((a0["sales"] >= (2 << 0) + (2 << 2)) & (a0["goods"] == "Paper")) | (a0["sales"] == 5))])
+a4 = (a0.loc[(((a0["sales"] >= 10) & (a0["goods"] == "Paper")) | (a0["sales"] == 5)), ['goods', 'sales']])
 print(a4.loc[:, ['goods', 'sales']])
 print()
-print("The maximum sales: ", a0["sales"].max())
-print("The minimum sales: ", a0["sales"].min())
-print("The total number of goods: ", a0["goods"].nunique())
+a3 = aggregate(a0, [("sales", "max"), ("sales", "min"), ("goods", "nunique")])
+print("The maximum sales: ", a3[0])
+print("The minimum sales: ", a3[1])
+print("The total number of goods: ", a3[2])
 
 CSVLang Output
 
@@ -98,17 +110,20 @@ The total number of goods:  3'''
 
 from pathlib import Path
 import pandas as pd
+from runtime import aggregate
+from runtime import top_n
 
-a0 = pd.read_csv("csv_files/sales.csv", header=[0])
-a4 = (a0.sort_values(by=['goods']).head(2))
+a0 = pd.read_csv("csv_files/sales.csv", header=0, usecols=lambda column: column in ['goods', 'sales'])
+a4 = (top_n(a0, ['goods'], 2))
 print(a4.loc[:, ['goods', 'sales']])
 print()
-a4 = (a0.sort_values(by=[]).loc[(((a0["sales"] >= 28) & (a0["goods"] == "Paper")) | (a0["sales"] == 5))])
+a4 = (a0.loc[(((a0["sales"] >= 28) & (a0["goods"] == "Paper")) | (a0["sales"] == 5)), ['goods', 'sales']])
 print(a4.loc[:, ['goods', 'sales']])
 print()
-print("The maximum sales: ", a0["sales"].max())
-print("The minimum sales: ", a0["sales"].min())
-print("The total number of goods: ", a0["goods"].nunique())
+a3 = aggregate(a0, [("sales", "max"), ("sales", "min"), ("goods", "nunique")])
+print("The maximum sales: ", a3[0])
+print("The minimum sales: ", a3[1])
+print("The total number of goods: ", a3[2])
 
 CSVLang Output
 
@@ -143,10 +158,10 @@ import pandas as pd
 
 batch1 = pd.read_csv("csv_files/matrix.csv", header=None)
 batch2 = batch1
-a4 = (batch1.sort_values(by=[]))
+a4 = (batch1)
 print(a4.iloc[:, [0, 1]])
 print()
-a4 = (batch2.sort_values(by=[]))
+a4 = (batch2)
 print(a4.iloc[:, [1]])
 print()
 
@@ -162,6 +177,610 @@ CSVLang Output
 
             self.assertEqual(expected_output, received_output.strip())
 
+    def test_logical_plan(self):
+        ast, parser, errors = parse_source('LOAD ("a.csv", header = true, tag = "x");\n'
+                                           'LOAD ("a.csv", header = true, tag = "y");\n'
+                                           'DISPLAY ("n", num = 3, filter = ("n" > 1), tag = "y");\n'
+                                           'ADD (("1", "2"));\n'
+                                           'LOAD ("a.csv", header = true, tag = "z");\n')
+        program = build_plan(ast)
+
+        self.assertEqual([Bind("x", Scan('"a.csv"', True))], program.statements[0].steps)
+        display = program.statements[2].steps[0]
+        condition = display.relation.input.input.condition
+        self.assertEqual("CONDITION", condition.node_type)
+        self.assertEqual(Project(Limit(Filter(Sort(Ref("y"), []), condition), 3), ["n"]), display.relation)
+        self.assertEqual("y", base_tag(display.relation))
+        self.assertEqual([AppendRows('"a.csv"', [["1", "2"]]), Bind("y", Scan('"a.csv"', True))],
+                         program.statements[3].steps)
+
+        # the second LOAD reuses x; the file changes before the third, so it is read again
+        steps = optimise(program, [reuse_loaded_files]).steps()
+        self.assertEqual(Bind("y", Ref("x")), steps[1])
+        self.assertEqual(Bind("z", Scan('"a.csv"', True)), steps[-1])
+
+        # as it is when it is written through another spelling of its path
+        ast, parser, errors = parse_source('LOAD ("a.csv", header = true, tag = "x");\n'
+                                           'STORE ("n", path = "./a.csv", tag = "x");\n'
+                                           'LOAD ("a.csv", header = true, tag = "z");\n')
+        steps = optimise(build_plan(ast), [reuse_loaded_files]).steps()
+        self.assertEqual(Bind("z", Scan('"a.csv"', True)), steps[-1])
+
+        # a rule rewrites every relation of every step, and untouched plans are returned as they are
+        drop_limits = rule_pass(lambda node: node.input if isinstance(node, Limit) else None)
+        self.assertNotIn(Limit, [type(node) for node in relations(drop_limits(program).steps()[2])])
+        self.assertIs(program.steps()[0], rule_pass(lambda node: None)(program).steps()[0])
+
+    def test_filter_before_sort(self):
+        ast, parser, errors = parse_source('LOAD ("a.csv", header = true);\n'
+                                           'DISPLAY (1, 2, num = 2, sort = (2), filter = ("n" > 1));\n'
+                                           'DISPLAY ("n", num = 2, filter = ("n" > 1));\n')
+        display, no_sort = optimise(build_plan(ast), [rule_pass(filter_before_sort)]).steps()[1:]
+        self.assertEqual(Limit(Sort(Filter(Ref("a0"), display.relation.input.input.input.condition), [2], True),
+                               2), display.relation.input)
+        self.assertEqual(Limit(Filter(Ref("a0"), no_sort.relation.input.input.condition), 2), no_sort.relation.input)
+
+        lines = generate_python_code(ast).splitlines()
+        self.assertIn('a4 = (top_n(a0.loc[(a0["n"] > 1)], [a0.columns[i] for i in [1]], 2))', lines)
+        self.assertIn('a4 = (a0.loc[(a0["n"] > 1), [\'n\']].head(2))', lines)
+
+    def test_prune_loaded_columns(self):
+        ast, parser, errors = parse_source('LOAD ("a.csv", header = true, tag = "x");\n'
+                                           'LOAD ("a.csv", header = true, tag = "y");\n'
+                                           'LOAD ("b.csv", header = true, tag = "z");\n'
+                                           'LOAD ("c.csv", header = true, tag = "m");\n'
+                                           'LOAD ("d.csv", header = false, tag = "n");\n'
+                                           'DISPLAY ("g", "s", sort = ("d"), filter = ("k" = "v" | "g" = "s"), '
+                                           'tag = "x");\n'
+                                           'PRINT ("Total: ", SUM("t"), tag = "y");\n'
+                                           'DISPLAY (1, tag = "z");\n'
+                                           'MERGE ("m", "n");\n'
+                                           'LOAD ("e.csv", header = true);\n'
+                                           'REMOVE (("1", "2"));\n'
+                                           'LOAD ("f.csv", header = true);\n'
+                                           'DISPLAY ("w" + 1, tag = "x");\n'
+                                           'ADD (("1", "2"));\n'
+                                           'PRINT ("Count: ", COUNT("u"));\n')
+        program = optimise(build_plan(ast), [reuse_loaded_files, prune_loaded_columns])
+        scans = [step.relation for step in program.steps() if isinstance(step, Bind) and
+                 isinstance(step.relation, Scan)]
+
+        # y is x, so the first LOAD reads the columns of both; "v" and "s" are values, not columns
+        self.assertEqual(["d", "k", "g", "s", "t"], scans[0].columns)
+        # positions, MERGE and REMOVE need every column, and so does a file without a header
+        self.assertEqual([None] * 4, [scan.columns for scan in scans[1:5]])
+        # a column expression reads the active tag; ADD reads f.csv again
+        self.assertEqual([["w"], ["u"]], [scan.columns for scan in scans[5:]])
+
+        code = generate_python_code(ast)
+        # the files are read ahead on a thread pool
+        self.assertIn('a5 = prefetch([lambda: pd.read_csv("a.csv", header=0, usecols=lambda column: column in [', code)
+        self.assertIn('lambda: pd.read_csv("b.csv", header=[0])', code)
+
+    def test_reuse_shared_results(self):
+        query = 'num = 2, sort = ("s"), filter = ("s" > 1 & "g" = "x")'
+        ast, parser, errors = parse_source(f'LOAD ("a.csv", header = true);\n'
+                                           f'DISPLAY ("g", {query});\n'
+                                           f'STORE ("s", {query}, path = "b.csv");\n'
+                                           f'PRINT ("Done");\n'
+                                           f'DISPLAY ("g", "s", {query});\n'
+                                           f'DISPLAY ("g", num = 2);\n'
+                                           f'DISPLAY ("g", num = 2);\n'
+                                           f'ADD (("x", "2"));\n'
+                                           f'DISPLAY ("g", num = 2);\n'
+                                           f'REMOVE (("x", "2"));\n'
+                                           f'DISPLAY ("g", num = 2);\n'
+                                           f'LOAD ("c.csv", header = true, tag = "other");\n'
+                                           f'DISPLAY ("g", num = 2, tag = "a0");\n')
+        program = reuse_shared_results(build_plan(ast))
+        shared = [isinstance(step.relation.input, Shared) for step in program.steps()
+                  if isinstance(step, (Display, Write))]
+        # the query is computed once for its first three uses; ADD and REMOVE change a0, another tag does not
+        self.assertEqual([False, True, True, False, True, False, False, True], shared)
+
+        lines = generate_python_code(ast).splitlines()
+        self.assertEqual(1, sum(line.startswith('a4 = (top_n(a0.loc[') for line in lines))
+        self.assertIn('a4.loc[:, [\'s\']].to_csv("b.csv", index=False)', lines)
+
+    def test_fuse_aggregates(self):
+        ast, parser, errors = parse_source('LOAD ("a.csv", header = true, tag = "x");\n'
+                                           'LOAD ("b.csv", header = true, tag = "y");\n'
+                                           'PRINT ("Max: ", MAX("s"), tag = "x");\n'
+                                           'DISPLAY ("s", tag = "x");\n'
+                                           'PRINT ("Sum: ", SUM("s"), tag = "x");\n'
+                                           'PRINT ("Max again: ", MAX("s"), tag = "x");\n'
+                                           'PRINT ("Count: ", COUNT(2), tag = "y");\n'
+                                           'PRINT ("Count: ", COUNT(1), tag = "x");\n'
+                                           'PRINT ("Min: ", MIN("s"), tag = "y");\n'
+                                           'ADD (("1", "2"));\n'
+                                           'PRINT ("Average: ", AVERAGE("s"), tag = "y");\n'
+                                           'PRINT ("Sum: ", SUM("s"), tag = "y");\n')
+        steps = fuse_aggregates(build_plan(ast)).steps()
+
+        # the aggregates of x are computed at the first, with each one computed once
+        self.assertEqual(Bind("a3", Aggregates(Ref("x"), [("s", "max", False), ("s", "sum", False)])), steps[2])
+        self.assertEqual([0, 1, 0], [steps[i].aggregate.position for i in [3, 5, 6]])
+        # aggregates of y and x take turns with a3, and ADD reads y again, so only the last two are fused again
+        self.assertEqual([Aggregate] * 3, [type(steps[i].aggregate) for i in [7, 8, 9]])
+        self.assertEqual(Bind("a3", Aggregates(Ref("y"), [("s", "average", False), ("s", "sum", False)])), steps[12])
+
+        lines = generate_python_code(ast).splitlines()
+        self.assertIn('a3 = aggregate(x, [("s", "max"), ("s", "sum")])', lines)
+        self.assertIn('print("Count: ", x[x.columns[1]].nunique())', lines)
+        self.assertIn('print("Sum: ", a3[1])', lines)
+
+    def test_fused_aggregate_errors(self):
+        import pandas as pd
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "a.csv")
+            with open(path, "w") as file:
+                file.write("x\n1\n3\n2\n")
+            ast, parser, errors = parse_source(f'LOAD ("{path}", header = true);\n'
+                                               'PRINT ("max: ", MAX("x"));\n'
+                                               'PRINT ("bad: ", MAX("nope"));\n')
+            code = generate_python_code(ast)
+            self.assertIn('a3 = aggregate(a0, [("x", "max"), ("nope", "max")])', code.splitlines())
+
+            # the PRINT before the aggregate of a missing column still runs
+            with patch('sys.stdout', new=io.StringIO()) as mocked_stdout:
+                self.assertRaises(KeyError, exec, code, {})
+            self.assertEqual("max:  3\n", mocked_stdout.getvalue())
+
+        results = aggregate(pd.DataFrame({"x": [1, 3, 2]}), [("x", "max"), (4, "nunique", True), (0, "sum", True)])
+        self.assertEqual(3, len(results))
+        self.assertEqual(3, results[0])
+        self.assertRaises(IndexError, results.__getitem__, 1)
+        self.assertEqual(6, results[2])
+
+    def test_copy_merged_files(self):
+        import os
+        import tempfile
+
+        ast, parser, errors = parse_source('LOAD ("a.csv", header = true, tag = "x");\n'
+                                           'LOAD ("b.csv", header = true, tag = "y");\n'
+                                           'LOAD ("c.csv", header = false, tag = "z");\n'
+                                           'MERGE ("x", "y", save = true, path = "d.csv");\n'
+                                           'MERGE ("x", "z", save = true, path = "d.csv");\n'
+                                           'MERGE ("x", "y", save = true, path = "b.csv");\n'
+                                           'STORE ("s", path = "b.csv");\n'
+                                           'MERGE ("x", "y", save = true, path = "e.csv");\n'
+                                           'LOAD ("b.csv", header = true, tag = "y");\n'
+                                           'ADD (("1", "2"));\n'
+                                           'MERGE ("y", "x", save = true, path = "f.csv");\n'
+                                           'REMOVE (("1", "2"));\n'
+                                           'MERGE ("x", "y", save = true, path = "g.csv");\n')
+        steps = copy_merged_files(build_plan(ast)).steps()
+        merges = [step for step in steps if isinstance(step, MergeFiles)
+                  or isinstance(step, Write) and isinstance(step.relation, Concat)]
+
+        # a file without a header, the output among the inputs, and a file written or tag changed since its LOAD
+        # keep the DataFrames; ADD reads y again, with its new rows
+        self.assertEqual([MergeFiles(['"a.csv"', '"b.csv"'], '"d.csv"'),
+                          Write(Concat([Ref("x"), Ref("z")]), '"d.csv"'),
+                          Write(Concat([Ref("x"), Ref("y")]), '"b.csv"'),
+                          Write(Concat([Ref("x"), Ref("y")]), '"e.csv"'),
+                          MergeFiles(['"b.csv"', '"a.csv"'], '"f.csv"'),
+                          Write(Concat([Ref("x"), Ref("y")]), '"g.csv"')], merges)
+
+        # a file written through another spelling of its path, or the output under one, keeps the DataFrames
+        ast, parser, errors = parse_source('LOAD ("csv_files/a.csv", header = true, tag = "x");\n'
+                                           'LOAD ("csv_files/b.csv", header = true, tag = "y");\n'
+                                           'MERGE ("x", "y", save = true, path = "./csv_files/b.csv");\n'
+                                           'LOAD ("csv_files/a.csv", header = true, tag = "x");\n'
+                                           'LOAD ("csv_files/c.csv", header = true, tag = "y");\n'
+                                           'STORE ("s", path = "csv_files/../csv_files/a.csv");\n'
+                                           'MERGE ("x", "y", save = true, path = "d.csv");\n')
+        steps = copy_merged_files(build_plan(ast)).steps()
+        self.assertEqual([Write(Concat([Ref("x"), Ref("y")]), '"./csv_files/b.csv"'),
+                          Write(Concat([Ref("x"), Ref("y")]), '"d.csv"')],
+                         [step for step in steps if isinstance(step, MergeFiles)
+                          or isinstance(step, Write) and isinstance(step.relation, Concat)])
+
+        # the LOADs are only read by MERGE, so they are removed
+        ast, parser, errors = parse_source('LOAD ("a.csv", header = true, tag = "x");\n'
+                                           'LOAD ("b.csv", header = true, tag = "y");\n'
+                                           'MERGE ("x", "y", save = true, path = "c.csv");\n')
+        code = generate_python_code(ast)
+        self.assertNotIn("read_csv(\"a.csv\"", code)
+        with tempfile.TemporaryDirectory() as directory:
+            directory_before = os.getcwd()
+            os.chdir(directory)
+            try:
+                for a, b, expected in [("n,s\nx,1\n", "n,s\ny,2\nz,3", "n,s\nx,1\ny,2\nz,3\n"),
+                                       # different headers are aligned by name
+                                       ("n,s\nx,1\n", "s,n\n2,y\n", "n,s\nx,1\ny,2\n")]:
+                    for name, content in [("a.csv", a), ("b.csv", b)]:
+                        with open(name, "w") as file:
+                            file.write(content)
+                    exec(code, {})
+                    with open("c.csv") as file:
+                        self.assertEqual(expected, file.read())
+            finally:
+                os.chdir(directory_before)
+
+    def test_merge_files(self):
+        import os
+        import tempfile
+        import pandas as pd
+
+        with tempfile.TemporaryDirectory() as directory:
+            def write(name, content):
+                with open(os.path.join(directory, name), "wb") as file:
+                    file.write(content)
+                return os.path.join(directory, name)
+
+            output = os.path.join(directory, "out.csv")
+            rows = b"".join(b"%d,%d\n" % (i, i * 7 % 11) for i in range(5000))
+            paths = [write("a.csv", b"x,y\n" + rows), write("b.csv", b"x,y\n"), write("c.csv", b"x,y\r\n1,2"),
+                     write("d.csv", b"x,y")]
+            self.assertTrue(merge_files(paths, output))
+            with open(output, "rb") as file:
+                self.assertEqual(b"x,y\n" + rows + b"1,2\n", file.read())
+            # the same file as the DataFrames write, which read these rows as they are written
+            with open(output) as file:
+                self.assertEqual(pd.concat([pd.read_csv(path, header=[0]) for path in paths]).to_csv(index=False),
+                                 file.read())
+
+            os.remove(output)
+            # headers that differ, or that pandas renames, and an output that is one of the inputs
+            for headers in [[b"x,y\n", b"y,x\n"], [b"x,y\n", b"x,y,z\n"], [b'"x",y\n', b'"x",y\n'],
+                            [b"x,x\n", b"x,x\n"], [b"x,,y\n", b"x,,y\n"], [b"\n", b"\n"]]:
+                paths = [write("a.csv", headers[0] + b"1,2\n"), write("b.csv", headers[1] + b"3,4\n")]
+                self.assertFalse(merge_files(paths, output), headers)
+            paths = [write("a.csv", b"x,y\n1,2\n"), write("b.csv", b"x,y\n3,4\n")]
+            self.assertFalse(merge_files(paths, os.path.join(directory, ".", "b.csv")))
+            self.assertFalse(os.path.exists(output))
+
+            # without copy_file_range() the files are copied through a buffer
+            with patch('os.copy_file_range', side_effect=OSError):
+                self.assertTrue(merge_files(paths, output))
+            with open(output, "rb") as file:
+                self.assertEqual(b"x,y\n1,2\n3,4\n", file.read())
+
+    def test_prefetch_loads(self):
+        import os
+        import tempfile
+
+        source_code = ('PRINT ("Start");\n'
+                       'LOAD ("a.csv", header = true, tag = "x");\n'
+                       'LOAD ("b.csv", header = false, tag = "y");\n'
+                       'STORE ("n", path = "./c.csv", tag = "x");\n'
+                       'LOAD ("c.csv", header = true, tag = "z");\n'
+                       'LOAD ("d.csv", header = true, tag = "w");\n'
+                       'DISPLAY (1, 2, tag = "y");\n'
+                       'DISPLAY ("n", tag = "z");\n'
+                       'PRINT ("Total: ", SUM("s"), tag = "w");\n')
+        ast, parser, errors = parse_source(source_code)
+        statements = prefetch_loads(build_plan(ast)).statements
+
+        # c.csv is written (through another spelling of its path) before its LOAD, so it is read there; the others
+        # are read from the first LOAD
+        self.assertEqual([Prefetch([Scan('"a.csv"', True), Scan('"b.csv"', False), Scan('"d.csv"', True)]),
+                          Bind("x", Prefetched(Scan('"a.csv"', True), 0))], statements[1].steps)
+        self.assertEqual([Bind("z", Scan('"c.csv"', True))], statements[4].steps)
+        self.assertEqual([Bind("w", Prefetched(Scan('"d.csv"', True), 2))], statements[5].steps)
+
+        code = generate_python_code(ast)
+        with tempfile.TemporaryDirectory() as directory:
+            directory_before = os.getcwd()
+            os.chdir(directory)
+            try:
+                outputs = []
+                for threads in [0, 4]:
+                    for name, content in [("a.csv", "n,s\nx,1\ny,2\n"), ("b.csv", "1,2\n3,4\n"),
+                                          ("c.csv", "old\n"), ("d.csv", "n,s\nz,5\nw,6\n")]:
+                        with open(name, "w") as file:
+                            file.write(content)
+                    with patch('runtime.load_threads', threads), \
+                            patch('sys.stdout', new=io.StringIO()) as mocked_stdout:
+                        exec(code, {})
+                    outputs.append(mocked_stdout.getvalue())
+                self.assertEqual(outputs[0], outputs[1])
+                self.assertIn("   n\n0  x\n1  y\n", outputs[1])
+                self.assertTrue(outputs[1].endswith("Total:  11\n"))
+
+                # a file that cannot be read fails at its LOAD, after the statements before it
+                os.remove("d.csv")
+                for threads in [0, 4]:
+                    with patch('runtime.load_threads', threads), \
+                            patch('sys.stdout', new=io.StringIO()) as mocked_stdout:
+                        with self.assertRaises(FileNotFoundError):
+                            exec(code, {})
+                    self.assertEqual("Start\n\n", mocked_stdout.getvalue())
+            finally:
+                os.chdir(directory_before)
+
+    def test_prefetch(self):
+        import threading
+
+        threads = []
+        def read(value):
+            threads.append(threading.current_thread().name)
+            return value
+
+        # without a pool each read is made when its result is asked for
+        with patch('runtime.load_threads', 1):
+            futures = prefetch([lambda: read(1), lambda: read(2)])
+        self.assertEqual([], threads)
+        self.assertEqual([2, 1], [futures[1].result(), futures[0].result()])
+        self.assertEqual([threading.current_thread().name] * 2, threads)
+
+        threads.clear()
+        with patch('runtime.load_threads', 4):
+            futures = prefetch([lambda: read(1), lambda: read(2), lambda: 1 / 0])
+        self.assertEqual([1, 2], [future.result() for future in futures[:2]])
+        self.assertTrue(all(name.startswith("csvlang-load") for name in threads))
+        with self.assertRaises(ZeroDivisionError):
+            futures[2].result()
+
+    def test_column_expressions(self):
+        import os
+        import tempfile
+        import code_generator
+        import optimised_code_generator
+
+        ast, parser, errors = parse_source('LOAD ("a.csv", header = true);\n'
+                                           'DISPLAY ("g", "s" + 10, "t" * 2, num = 2, sort = ("g"), '
+                                           'filter = ("u" > 1));\n')
+        display = optimise(build_plan(ast), [rule_pass(lift_column_expressions)]).steps()[1]
+        # the expressions become one Derive, computed after the filter and sort that do not read them
+        self.assertEqual([("s", "+", "10", False), ("t", "*", "2", False)], display.relation.input.expressions)
+        self.assertEqual(Limit, type(display.relation.input.input))
+
+        # both generators sort stably, so rows with equal keys are in the same order, even on more than 16 rows
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "a.csv"), "w") as file:
+                file.write("g,s,t,u\n" + "".join(f"{'xyz'[i % 3]},{i % 7},{i % 5},{i}\n" for i in range(40)))
+            with open(os.path.join(directory, "b.csv"), "w") as file:
+                file.write("".join(f"{i % 4},{i % 3},{i}\n" for i in range(20)))
+
+            statements = ['DISPLAY ("g", "s" + 10, "t" * 2, num = 3, sort = ("g", "u"), filter = ("t" > 1));',
+                          'DISPLAY ("g", "s" + 10, num = 3, sort = ("s", "u"), filter = ("s" > 12));',
+                          'DISPLAY ("s" * 2, "s" - 1, "u", sort = ("s", "u"), filter = ("u" > 30 | "s" = 1));',
+                          'STORE ("g", "t" + 1, num = 4, filter = ("g" = "y"), path = "c.csv");',
+                          'LOAD ("b.csv", header = false);',
+                          'DISPLAY (1 + 5, 2, 3, num = 4, sort = (1, 3));',
+                          'DISPLAY (2 * 3, 3, sort = (3));',
+                          'LOAD ("a.csv", header = true);',
+                          'DISPLAY ("g", "u", num = 7, sort = ("s"));',
+                          'DISPLAY ("g", "u", sort = ("t"), filter = ("s" > 2));']
+            source_code = 'LOAD ("a.csv", header = true);\n' + "\n".join(statements) + '\nDISPLAY ("g", path = "c.csv");\n'
+            ast, parser, errors = parse_source(source_code)
+
+            outputs = []
+            directory_before = os.getcwd()
+            os.chdir(directory)
+            try:
+                for generator in [code_generator, optimised_code_generator]:
+                    with patch('sys.stdout', new=io.StringIO()) as mocked_stdout:
+                        exec(generator.generate_python_code(ast), {})
+                    with open("c.csv") as file:
+                        outputs.append(mocked_stdout.getvalue() + file.read())
+            finally:
+                os.chdir(directory_before)
+
+        self.assertEqual(outputs[0], outputs[1])
+
+    def test_remove_dead_loads(self):
+        import os
+        import tempfile
+
+        # tags that are prefixes of each other, and of the paths and columns of the other statements
+        ast, parser, errors = parse_source('LOAD ("s.csv", header = true, tag = "s");\n'
+                                           'LOAD ("sales.csv", header = true, tag = "sales");\n'
+                                           'LOAD ("sales1.csv", header = true, tag = "sales1");\n'
+                                           'LOAD ("sales2.csv", header = true, tag = "sales1");\n'
+                                           'LOAD ("sales.csv", header = true, tag = "sale");\n'
+                                           'PRINT ("Total: ", SUM("sales"), tag = "sales");\n'
+                                           'DISPLAY ("s", "sales1", tag = "sales1");\n'
+                                           'LOAD ("sales3.csv", header = true, tag = "sales3");\n'
+                                           'CREATE ("sales3.csv");\n'
+                                           'ADD (("sales", "sales1"), ("1", "2"));\n')
+        program = remove_dead_loads(build_plan(ast))
+
+        # s, sale and the a0 that ADD reads are never used, and sales1.csv is bound again before its use
+        self.assertEqual([[], [Bind("sales", Scan('"sales.csv"', True))], [],
+                          [Bind("sales1", Scan('"sales2.csv"', True))], []], [s.steps for s in program.statements[:5]])
+        self.assertEqual([[], [CreateFile('"sales3.csv"')], [AppendRows('"sales3.csv"', [["sales", "sales1"],
+                                                                                        ["1", "2"]])]],
+                         [statement.steps for statement in program.statements[7:]])
+
+        # y only reads the file of x, which is then live; neither is once y is unused
+        ast, parser, errors = parse_source('LOAD ("a.csv", header = true, tag = "x");\n'
+                                           'LOAD ("a.csv", header = true, tag = "y");\n'
+                                           'DISPLAY ("n", tag = "y");\n'
+                                           'LOAD ("b.csv", header = true, tag = "p");\n'
+                                           'LOAD ("b.csv", header = true, tag = "q");\n'
+                                           'PRINT ("Done");\n')
+        steps = optimise(build_plan(ast), [reuse_loaded_files, remove_dead_loads]).steps()
+        self.assertEqual([Bind("x", Scan('"a.csv"', True)), Bind("y", Ref("x"))], steps[:2])
+        self.assertEqual(2, len([step for step in steps if isinstance(step, Bind)]))
+
+        # an unused LOAD never opens its file, which need not exist
+        ast, parser, errors = parse_source('LOAD ("missing.csv", header = true, tag = "sales");\n'
+                                           'LOAD ("sales.csv", header = true, tag = "sales_2024");\n'
+                                           'PRINT ("Total: ", SUM("sales"), tag = "sales_2024");\n')
+        code = generate_python_code(ast)
+        self.assertNotIn("missing.csv", code)
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "sales.csv"), "w") as file:
+                file.write("goods,sales\nPaper,2\nPen,3\n")
+            directory_before = os.getcwd()
+            os.chdir(directory)
+            try:
+                with patch('sys.stdout', new=io.StringIO()) as mocked_stdout:
+                    exec(code, {})
+            finally:
+                os.chdir(directory_before)
+        self.assertEqual("Total:  5\n", mocked_stdout.getvalue())
+
+    def test_simplify_filters(self):
+        import os
+        import tempfile
+        import code_generator
+
+        def simplified(condition):
+            ast, parser, errors = parse_source(f'LOAD ("a.csv", header = true);\n'
+                                               f'DISPLAY ("x", filter = ({condition}));\n')
+            passes = [rule_pass(filter_before_sort), rule_pass(simplify_filters)]
+            relation = optimise(build_plan(ast), passes).steps()[1].relation.input
+            if isinstance(relation, Filter):
+                return generate_filter_expression(relation.condition, "a0")
+            return relation
+
+        # every operator, folded with the types of Python: / makes floats, - negative numbers
+        self.assertEqual('(a0["x"] > 10)', simplified('"x" > 2 * 5'))
+        self.assertEqual('(a0["x"] >= 28)', simplified('"x" >= ((30 + 12) - 14)'))
+        self.assertEqual('(a0["x"] < 3.5)', simplified('"x" < 7 / 2'))
+        self.assertEqual('(a0["x"] <= 1)', simplified('"x" <= 7 % 3'))
+        self.assertEqual('(a0["x"] != -2)', simplified('"x" <> 8 - 10'))
+        self.assertEqual('(a0["x"] == 6)', simplified('"x" = 2 * 3'))
+        self.assertEqual('(a0["x"] == "a")', simplified('"x" = "a"'))
+        # the column goes left of its constants, and + 0, - 0 and * 1 go
+        self.assertEqual('(a0["x"] > 3)', simplified('3 < "x" * 1'))
+        self.assertEqual('(3 < "x")', simplified('3 < "x"'))
+        self.assertEqual('((a0["x"] + 2) > 5)', simplified('2 + "x" * 1 > 5 - 0'))
+        self.assertEqual('(a0["y"] >= (a0["x"]))', simplified('"y" >= "x" - 0'))
+        self.assertEqual('((a0["x"] / 2) > (1 / 0))', simplified('"x" / 2 > 1 / 0'))
+        # a result too large for a float is left to the program, which gets inf
+        large = "1" + "0" * 300
+        self.assertEqual(f'(a0["x"] < (1e+300 * {large}))', simplified(f'"x" < {large} / 1 * {large}'))
+        self.assertEqual(f'(a0["x"] < {large}{"0" * 300})', simplified(f'"x" < {large} * {large}'))
+        # comparisons of a column with numbers are merged
+        self.assertEqual('(a0["x"] > 10)', simplified('"x" > 5 & "x" > 10'))
+        self.assertEqual('((a0["x"] > 5) & (a0["x"] <= 10) & (a0["y"] == 1))',
+                         simplified('"x" > 5 & "y" = 1 & "x" <= 10 & ("x" >= 2 & "x" <> 20)'))
+        self.assertEqual('(a0["x"] == 4)', simplified('"x" >= 4 & "x" <= 4'))
+        self.assertEqual('((a0["x"] < 10) & (a0["x"] != 3))', simplified('"x" <> 3 & "x" <> 20 & "x" < 10'))
+        self.assertEqual('((a0["x"] > 5) | (a0["x"] == 1))', simplified('"x" > 5 | "x" > 10 | "x" = 7 | "x" = 1'))
+        self.assertEqual('((a0["x"] > 5) | (a0["x"] != 1))', simplified('"x" > 5 | "x" <> 1'))
+        # terms that always hold or never do
+        self.assertEqual(Ref("a0"), simplified('1 = 1'))
+        self.assertEqual(Ref("a0"), simplified('"x" > 1 | 2 >= 1'))
+        self.assertEqual('(a0["y"] < 4)', simplified('("x" > 1 & 2 <= 1) | "y" < 4'))
+        for condition in ['1 <> 1 | 2 > 3', '"x" > 10 & "x" < 5', '"x" = 3 & "x" = 4', '"x" = 3 & "x" <> 3',
+                          '"x" > 4 & "x" < 4', '"x" >= 4 & "x" < 4']:
+            self.assertEqual(Limit(Ref("a0"), 0), simplified(condition), condition)
+        # but not while another term is arithmetic that fails when the program runs
+        self.assertEqual('((a0["x"] > 5) & (a0["x"] < 3) & (a0["y"] < (10 % 0)))',
+                         simplified('"x" > 5 & "x" < 3 & "y" < 10 % 0'))
+        self.assertEqual('((1 == 2) & (a0["y"] < (10 % 0)))', simplified('1 = 2 & "y" < 10 % 0'))
+        self.assertEqual('((1 == 1) | (a0["y"] < (10 % 0)))', simplified('1 = 1 | "y" < 10 % 0'))
+
+        # the rows kept are those of the code generator, which does not simplify, missing values included
+        conditions = ['"x" > 2 * 5', '"x" >= 7 / 2 & "x" < 50 % 17', '3 < "x" * 1 & "x" <> 8 - 2', '"x" * 1 + 0 = 6',
+                      '"x" + 2 > 5 & "y" <= 10', '"x" > 5 & "x" > 10', '"x" >= 4 & "x" <= 4', '"x" <> 3 & "x" <> 20',
+                      '"x" > 10 & "x" < 5', '"x" > 5 | "x" > 10 | "x" = 7 | "x" = 1', '"x" > 5 | "x" <> 1',
+                      '("x" > 1 & 2 <= 1) | "y" < 4', '"x" = 3 & "x" = 4', '"x" <> 2 & "x" <> 2']
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "a.csv"), "w") as file:
+                file.write("x,y\n" + "".join(f"{'' if i % 7 == 0 else i % 13},{i}\n" for i in range(40)))
+            source_code = 'LOAD ("a.csv", header = true);\n' + "".join(
+                f'DISPLAY ("x", "y", filter = ({condition}));\n' for condition in conditions)
+            ast, parser, errors = parse_source(source_code)
+
+            outputs = []
+            directory_before = os.getcwd()
+            os.chdir(directory)
+            try:
+                for generator in [code_generator, sys.modules["optimised_code_generator"]]:
+                    with patch('sys.stdout', new=io.StringIO()) as mocked_stdout:
+                        exec(generator.generate_python_code(ast), {})
+                    outputs.append(mocked_stdout.getvalue())
+            finally:
+                os.chdir(directory_before)
+
+        self.assertEqual(outputs[0], outputs[1])
+
+    def test_top_n(self):
+        import numpy as np
+        import pandas as pd
+
+        generator = np.random.default_rng(0)
+        frame = pd.DataFrame({"goods": generator.choice(["Paper", "Eggs", "Bread", None], 500),
+                              "sales": generator.integers(0, 20, 500).astype(float)})
+        frame.loc[generator.integers(0, 500, 50), "sales"] = np.nan
+        frame.index = generator.permutation(500) % 300 # duplicate labels, as after a MERGE
+
+        for keys in [["sales"], ["goods"], ["goods", "sales"], ["sales", "goods"]]:
+            for count in [0, 1, 10, 100, 460, 600]:
+                expected = frame.sort_values(by=keys, kind="stable").head(count)
+                received = top_n(frame, keys, count)
+                self.assertTrue(expected.equals(received), (keys, count))
+                self.assertEqual(list(expected.index), list(received.index))
+
+    def test_aggregate(self):
+        import numpy as np
+        import pandas as pd
+
+        generator = np.random.default_rng(0)
+        frame = pd.DataFrame({"int": generator.integers(-100, 100, 200000), "small": generator.integers(0, 9, 70000)
+                              .astype(np.uint8).tolist() + [0] * 130000, "float": generator.normal(0, 1, 200000),
+                              "goods": generator.choice(["Paper", "Eggs"], 200000)})
+        frame["small"] = frame["small"].astype(np.uint8)
+        requests = [(column, method) for column in frame.columns for method in ["max", "min", "sum", "mean"]
+                    if column != "goods"] + [("goods", "nunique"), ("int", "max"), ("goods", "max")]
+
+        for received, (column, method) in zip(aggregate(frame, requests), requests):
+            expected = getattr(frame[column], method)()
+            self.assertEqual(type(expected), type(received), (column, method))
+            self.assertEqual(repr(expected), repr(received), (column, method))
+
+    def test_filter_mask(self):
+        import numpy as np
+        import pandas as pd
+
+        generator = np.random.default_rng(0)
+        frame = pd.DataFrame({"sales": generator.integers(0, 1000, 100000).astype(float),
+                              "goods": generator.choice(["Paper", "Eggs", "Bread"], 100000)})
+        frame.loc[generator.integers(0, 100000, 5000), "sales"] = np.nan
+        frame.index = generator.permutation(100000) % 30000 # duplicate labels, as after a MERGE
+
+        rows_seen = []
+        def counted(term):
+            def evaluate(rows):
+                rows_seen.append(len(rows["goods"]))
+                return term(rows)
+            return evaluate
+
+        terms = [lambda rows: rows["sales"] > 100, lambda rows: rows["goods"] == "Paper",
+                 lambda rows: (rows["sales"] < 120) | (rows["sales"] > 990), lambda rows: rows["goods"] != "Pen"]
+        expected = ((frame["sales"] > 100) & (frame["goods"] == "Paper") &
+                    ((frame["sales"] < 120) | (frame["sales"] > 990)) & (frame["goods"] != "Pen")).to_numpy()
+        received = filter_mask(frame, [counted(term) for term in terms])
+        self.assertTrue(np.array_equal(expected, received))
+        # after sampling, the most selective term runs on every row and each of the others on fewer
+        self.assertEqual([1024] * 4 + [100000], rows_seen[:5])
+        self.assertTrue(all(seen < 100000 for seen in rows_seen[5:]))
+
+        # once no row is left, the other terms are not computed
+        rows_seen.clear()
+        received = filter_mask(frame.head(100), [counted(lambda rows: rows["sales"] > 5000)] +
+                               [counted(term) for term in terms])
+        self.assertFalse(received.any())
+        self.assertEqual([100], rows_seen)
+
+        ast, parser, errors = parse_source('LOAD ("a.csv", header = true);\n'
+                                           'DISPLAY ("goods", filter = ("sales" > 1 & "goods" = "Paper"));\n')
+        self.assertIn('a4 = (a0.loc[filter_mask(a0, [lambda rows: (rows["sales"] > 1), '
+                      'lambda rows: (rows["goods"] == "Paper")]), [\'goods\', \'sales\']])',
+                      generate_python_code(ast).splitlines())
+
+        # but not when a term fails in the program, even where an earlier one keeps no row
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "a.csv"), "w") as file:
+                file.write("x,y\n1,2\n")
+            ast, parser, errors = parse_source('LOAD ("a.csv", header = true);\n'
+                                               'DISPLAY ("x", filter = ("x" > 5 & "x" < 3 & "y" < 10 % 0));\n')
+            directory_before = os.getcwd()
+            os.chdir(directory)
+            try:
+                with patch('sys.stdout', new=io.StringIO()):
+                    with self.assertRaises(ZeroDivisionError):
+                        exec(generate_python_code(ast), {})
+            finally:
+                os.chdir(directory_before)
 
 
 if __name__ == '__main__':
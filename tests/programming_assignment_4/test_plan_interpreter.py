@@ -0,0 +1,134 @@
+import io
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+sys.path.append(sys.path[0] + '/../..')
+import optimised_code_generator
+from parser import parse_source
+from plan_interpreter import Interpreter, build_program, main
+
+
+class TestPlanInterpreter(unittest.TestCase):
+
+    def generated_output(self, path):
+        # what the program prints when optimised_code_generator.py runs it
+        with patch('sys.argv', ['optimised_code_generator.py', '--no-cache', path]):
+            with patch('sys.stdout', new=io.StringIO()) as mocked_stdout:
+                optimised_code_generator.main()
+        return mocked_stdout.getvalue().split("CSVLang Output\n\n", 1)[1].rstrip("\n")
+
+    def interpreted_output(self, *arguments):
+        with patch('sys.argv', ['plan_interpreter.py', *arguments]):
+            with patch('sys.stdout', new=io.StringIO()) as mocked_stdout:
+                main()
+        return mocked_stdout.getvalue()
+
+    def test_sample_programs(self):
+        for number in [1, 2, 3]:
+            path = f'sample_programs/programming_assignment_4/Program{number}.csvlang'
+            self.assertEqual(self.generated_output(path), self.interpreted_output(path).rstrip("\n"), path)
+
+    def test_emit_python(self):
+        path = 'sample_programs/programming_assignment_4/Program2.csvlang'
+        with open(path) as file:
+            generated_code = optimised_code_generator.compile_source(file.read())[0]
+        self.assertEqual(generated_code, self.interpreted_output('--emit-python', path))
+
+    def test_syntax_errors(self):
+        output = self.interpreted_output('sample_programs/programming_assignment_2/Program2.csvlang')
+        self.assertIn("Syntax Error(s) Found:", output)
+        self.assertIn("Path attribute is missing in merge statement with save=true at line 3", output)
+
+    def test_same_output_as_generated_code(self):
+        source_code = '''LOAD ("a.csv", header = true);
+DISPLAY ("g", "s" + 10, "t" * 2, num = 3, sort = ("g", "u"), filter = ("t" > 1));
+DISPLAY ("g", "u", filter = ("g" = "x" | "g" = "z") );
+DISPLAY ("g", "s", "u", filter = ("s" > 1 & "t" <> 3 & "g" = "y"), sort = ("u"));
+DISPLAY ("s" * 2, "u", filter = ("u" / 2 > 10 - 3 | "s" % 2 = 1), num = 5);
+DISPLAY (1, 4, sort = (4), num = 3);
+STORE ("g", "t" + 1, num = 4, filter = ("g" = "y"), path = "c.csv");
+PRINT ("Largest u: ", MAX("u"));
+PRINT ("Smallest s: ", MIN(2));
+PRINT ("Groups: ", COUNT("g"));
+PRINT ("Average t: ", AVERAGE("t"));
+LOAD ("b.csv", header = false, tag = "b0");
+MERGE ("a0", "b0", save = true, path = "d.csv");
+DISPLAY (1 + 5, 2, 3, num = 4, sort = (1, 3));
+PRINT ("Sum: ", SUM(2));
+CREATE ("e.csv");
+ADD (("p", "q"), ("1", "2"), ("3", "4"));
+REMOVE (("1", "2"));
+DISPLAY ("p", "q");
+DELETE (tag = "b0");
+'''
+        ast, parser, errors = parse_source(source_code)
+        self.assertEqual([], errors)
+        self.assertTrue(parser.is_success)
+
+        outputs = []
+        with tempfile.TemporaryDirectory() as directory:
+            directory_before = os.getcwd()
+            os.chdir(directory)
+            try:
+                for run in ["generated", "interpreted"]:
+                    with open("a.csv", "w") as file:
+                        file.write("g,s,t,u\n" + "".join(f"{'xyz'[i % 3]},{i % 7},{i % 5},{i}\n" for i in range(40)))
+                    with open("b.csv", "w") as file:
+                        file.write("".join(f"{i % 4},{i % 3},{i}\n" for i in range(20)))
+                    # a.csv and b.csv are read ahead on a thread pool
+                    with patch('runtime.load_threads', 4), patch('sys.stdout', new=io.StringIO()) as mocked_stdout:
+                        if run == "generated":
+                            exec(optimised_code_generator.generate_python_code(ast), {})
+                        else:
+                            Interpreter().run(build_program(source_code)[0])
+                    files = {name: open(name).read() for name in sorted(os.listdir("."))}
+                    outputs.append((mocked_stdout.getvalue(), files))
+                    for name in files:
+                        os.remove(name)
+            finally:
+                os.chdir(directory_before)
+
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertNotIn("b.csv", outputs[1][1])
+
+    def test_statement_hooks(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "a.csv")
+            with open(path, "w") as file:
+                file.write("x,y\n1,2\n3,4\n")
+            source_code = (f'LOAD ("{path}", header = true);\n\nDISPLAY ("x", filter = ("y" > 2));\n'
+                           f'PRINT ("Total: ", SUM("y"));\n')
+            program, statement_lines = build_program(source_code)
+
+            timings = []
+            interpreter = Interpreter()
+            interpreter.statement_hooks.append(lambda index, statement, seconds:
+                                               timings.append((index, statement.kind, seconds)))
+            with patch('sys.stdout', new=io.StringIO()) as mocked_stdout:
+                interpreter.run(program)
+
+        self.assertEqual("   x\n1  3\n\nTotal:  6\n", mocked_stdout.getvalue())
+        self.assertEqual([(0, "LOAD-STMT"), (1, "DISPLAY-STMT"), (2, "PRINT-STMT")],
+                         [(index, kind) for index, kind, seconds in timings])
+        self.assertTrue(all(seconds >= 0 for index, kind, seconds in timings))
+        self.assertEqual([1, 3, 4], statement_lines)
+
+    def test_error_location(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "a.csv")
+            with open(path, "w") as file:
+                file.write("x,y\n1,2\n")
+            program_path = os.path.join(directory, "Program.csvlang")
+            with open(program_path, "w") as file:
+                file.write(f'LOAD ("{path}", header = true);\nDISPLAY ("z");\n')
+
+            with self.assertRaises(KeyError) as context:
+                self.interpreted_output(program_path)
+
+        self.assertEqual([f'  File "{program_path}", line 2\n    DISPLAY ("z");'], context.exception.__notes__)
+
+
+if __name__ == '__main__':
+    unittest.main()
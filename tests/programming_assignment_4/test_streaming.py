@@ -0,0 +1,246 @@
+import io
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+sys.path.append(sys.path[0] + '/../..')
+import numpy as np
+import pandas as pd
+from optimised_code_generator import optimisation_passes
+from plan_interpreter import Interpreter, build_program
+from streaming import PartialAggregate, StreamingInterpreter, frame_text, streaming_passes
+
+
+class TestStreaming(unittest.TestCase):
+
+    def run_program(self, directory, source_code, interpreter, passes):
+        # what the program prints and the files it leaves, starting from the same a.csv and b.csv
+        directory_before = os.getcwd()
+        os.chdir(directory)
+        try:
+            for name in os.listdir("."):
+                os.remove(name)
+            with open("a.csv", "w") as file:
+                file.write("g,s,t,u\n" + "".join(f"{'xyzw'[i * 7 % 4]},{i * 31 % 53},{i % 10},{i}\n"
+                                                  for i in range(500)))
+            with open("b.csv", "w") as file:
+                file.write("".join(f"{i % 4},{i % 3},{i}\n" for i in range(150)))
+            with patch('sys.stdout', new=io.StringIO()) as mocked_stdout:
+                interpreter.run(build_program(source_code, passes)[0])
+            return mocked_stdout.getvalue(), {name: open(name).read() for name in sorted(os.listdir("."))}
+        finally:
+            os.chdir(directory_before)
+
+    def test_same_output_as_whole_files(self):
+        source_code = '''LOAD ("a.csv", header = true);
+DISPLAY ("g", "s", "u");
+DISPLAY ("g", "s" + 10, "t" * 2, num = 3, sort = ("s", "u"), filter = ("t" > 1));
+DISPLAY ("g", "u", filter = ("g" = "x" | "g" = "z"), num = 70);
+DISPLAY ("g", "s", "u", filter = ("s" > 1 & "t" <> 3 & "g" = "y"), sort = ("u"));
+DISPLAY ("s" * 2, "u", filter = ("u" / 2 > 10 - 3 | "s" % 2 = 1), num = 5);
+DISPLAY (1, 4, sort = (2, 4), num = 8);
+DISPLAY ("g", "u", filter = ("s" > 100));
+STORE ("g", "t" + 1, num = 400, filter = ("g" = "y"), path = "c.csv");
+PRINT ("Largest u: ", MAX("u"));
+PRINT ("Smallest s: ", MIN(2));
+PRINT ("Groups: ", COUNT("g"));
+PRINT ("Average t: ", AVERAGE("t"));
+PRINT ("Sum s: ", SUM("s"));
+MERGE ("a0", "a0", save = true, path = "f.csv");
+LOAD ("c.csv", header = true, tag = "c0");
+MERGE ("a0", "c0", save = true, path = "g.csv");
+LOAD ("b.csv", header = false, tag = "b0");
+MERGE ("a0", "b0", save = true, path = "d.csv");
+DISPLAY (1 + 5, 2, 3, sort = (1, 3));
+PRINT ("Sum: ", SUM(2));
+STORE (1, 2, path = "b.csv");
+DISPLAY (1, 2, 3, num = 3);
+CREATE ("e.csv");
+ADD (("p", "q"), ("1", "2"), ("3", "4"));
+REMOVE (("1", "2"));
+DISPLAY ("p", "q");
+'''
+        with tempfile.TemporaryDirectory() as directory:
+            expected = self.run_program(directory, source_code, Interpreter(), optimisation_passes)
+            for chunk_rows in [3, 64, 1000]:
+                received = self.run_program(directory, source_code, StreamingInterpreter(chunk_rows),
+                                            streaming_passes)
+                self.assertEqual(expected, received, chunk_rows)
+
+        # the DISPLAY of all 500 rows shows the first and the last five
+        self.assertIn("..  ..  ..  ...\n495", expected[0])
+        self.assertIn("[500 rows x 3 columns]", expected[0])
+
+    def test_num_stops_reading(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "a.csv")
+            # the rows after the first 100 cannot be parsed, so they must not be read
+            with open(path, "w") as file:
+                file.write("x,y\n" + "".join(f"{i},{i % 3}\n" for i in range(100)) + "1,2,3,4\n" * 100)
+
+            program, statement_lines = build_program(f'LOAD ("{path}", header = true);\n'
+                                                     f'DISPLAY ("x", "y", num = 3, filter = ("y" = 1));\n',
+                                                     streaming_passes)
+            with patch('sys.stdout', new=io.StringIO()) as mocked_stdout:
+                StreamingInterpreter(10).run(program)
+            self.assertEqual("   x  y\n1  1  1\n4  4  1\n7  7  1\n\n", mocked_stdout.getvalue())
+
+            with self.assertRaises(pd.errors.ParserError):
+                pd.read_csv(path)
+
+    def test_dtypes_of_whole_file(self):
+        outputs = []
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "a.csv")
+            # the only missing value of n is in the last chunk, so the chunks before it alone would read n as integers
+            with open(path, "w") as file:
+                file.write("n,g\n" + "".join(f"{i * 10},Desk\n" for i in range(1, 100)) + ",Pen\n")
+            # n is an integer column in b.csv, which MERGE puts first, and b.csv has a column a.csv lacks
+            other_path = os.path.join(directory, "b.csv")
+            with open(other_path, "w") as file:
+                file.write("n,g,k\n0,Pen,True\n")
+            output_path = os.path.join(directory, "c.csv")
+            merged_path = os.path.join(directory, "d.csv")
+            source_code = (f'LOAD ("{path}", header = true);\nDISPLAY ("n", "g", num = 2);\n'
+                           f'STORE ("n", "g", num = 2, path = "{output_path}");\n'
+                           'DISPLAY (1, 2, sort = (2), num = 2);\n'
+                           f'LOAD ("{other_path}", header = true, tag = "b0");\n'
+                           f'MERGE ("b0", "a0", save = true, path = "{merged_path}");\n')
+
+            for interpreter, passes in [(Interpreter(), optimisation_passes),
+                                        (StreamingInterpreter(64), streaming_passes),
+                                        (StreamingInterpreter(3), streaming_passes)]:
+                with patch('sys.stdout', new=io.StringIO()) as mocked_stdout:
+                    interpreter.run(build_program(source_code, passes)[0])
+                with open(output_path) as file, open(merged_path) as merged_file:
+                    outputs.append((mocked_stdout.getvalue(), file.read(), merged_file.read()))
+
+        self.assertTrue(outputs[0][0].startswith("      n     g\n0  10.0  Desk\n1  20.0  Desk\n"))
+        self.assertEqual("n,g\n10.0,Desk\n20.0,Desk\n", outputs[0][1])
+        self.assertTrue(outputs[0][2].startswith("n,g,k\n0.0,Pen,True\n10.0,Desk,\n"))
+        self.assertEqual([outputs[0]] * 3, outputs)
+
+    def test_aggregate_errors(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "a.csv")
+            with open(path, "w") as file:
+                file.write("s\n" + "".join(f"{i * 31 % 53}\n" for i in range(500)))
+            source_code = (f'LOAD ("{path}", header = true);\n'
+                           'PRINT ("max: ", MAX("s"));\nPRINT ("bad: ", MAX("nope"));\n')
+
+            # the PRINT before the aggregate of a missing column still runs
+            for interpreter, passes in [(Interpreter(), optimisation_passes),
+                                        (StreamingInterpreter(64), streaming_passes)]:
+                with patch('sys.stdout', new=io.StringIO()) as mocked_stdout:
+                    self.assertRaises(KeyError, interpreter.run, build_program(source_code, passes)[0])
+                self.assertEqual("max:  52\n", mocked_stdout.getvalue())
+
+    def test_external_sort(self):
+        generator = np.random.default_rng(0)
+        scores = generator.integers(0, 20, 1000).astype(float)
+        scores[generator.random(1000) < 0.05] = np.nan
+        frame = pd.DataFrame({"g": generator.choice(list("abcde"), 1000), "s": scores, "u": np.arange(1000)})
+
+        # an unstable sort orders rows with equal keys in any order, so by index keys end with the unique column
+        statements = ['LOAD ("a.csv", header = true);\n'
+                      'STORE ("g", "s", "u", sort = ("g", "s"), filter = ("u" >= 0), path = "c.csv");',
+                      'LOAD ("a.csv", header = true);\n'
+                      'STORE ("u", "g", sort = ("s"), num = 700, filter = ("u" % 3 <> 1), path = "c.csv");',
+                      'LOAD ("b.csv", header = false);\n'
+                      'DISPLAY (1, 2, 3, sort = (2, 1, 3), num = 400);']
+        with tempfile.TemporaryDirectory() as directory, tempfile.TemporaryDirectory() as spill_directory:
+            frame.to_csv(os.path.join(directory, "a.csv"), index=False)
+            frame.to_csv(os.path.join(directory, "b.csv"), index=False, header=False)
+            for statement in statements:
+                outputs = []
+                # 50 runs of 20 rows are merged in two passes, 4 runs of 300 rows in one
+                for interpreter, passes in [(Interpreter(), optimisation_passes),
+                                            (StreamingInterpreter(10, 20, spill_directory), streaming_passes),
+                                            (StreamingInterpreter(100, 300, spill_directory), streaming_passes)]:
+                    # runs of several blocks, so the merge also reads the blocks after the first
+                    with patch('streaming.merge_block_rows', 8):
+                        outputs.append(self.run_in(directory, statement, interpreter, passes))
+                    self.assertEqual([], os.listdir(spill_directory))
+                self.assertEqual(outputs[0], outputs[1], statement)
+                self.assertEqual(outputs[0], outputs[2], statement)
+
+    def run_in(self, directory, source_code, interpreter, passes):
+        # what a program that reads a.csv or b.csv prints, and the c.csv it writes
+        directory_before = os.getcwd()
+        os.chdir(directory)
+        try:
+            with patch('sys.stdout', new=io.StringIO()) as mocked_stdout:
+                interpreter.run(build_program(source_code, passes)[0])
+            if not os.path.exists("c.csv"):
+                return mocked_stdout.getvalue(), None
+            with open("c.csv") as file:
+                return mocked_stdout.getvalue(), file.read()
+        finally:
+            os.chdir(directory_before)
+
+    def test_external_sort_cleans_up(self):
+        with tempfile.TemporaryDirectory() as directory, tempfile.TemporaryDirectory() as spill_directory:
+            path = os.path.join(directory, "a.csv")
+            # the keys of the last rows are strings, which do not sort with numbers
+            with open(path, "w") as file:
+                file.write("k,v\n" + "".join(f"{i % 17},{i}\n" for i in range(100))
+                           + "".join(f"x,{i}\n" for i in range(100, 110)))
+
+            program, statement_lines = build_program(f'LOAD ("{path}", header = true);\n'
+                                                     f'DISPLAY ("k", "v", sort = ("k"));\n', streaming_passes)
+            with patch('sys.stdout', new=io.StringIO()):
+                with self.assertRaises(TypeError):
+                    StreamingInterpreter(10, 30, spill_directory).run(program)
+            self.assertEqual([], os.listdir(spill_directory))
+
+            # num stops the merge before all runs are read
+            program, statement_lines = build_program(f'LOAD ("{path}", header = true);\n'
+                                                     f'DISPLAY ("v", num = 5, sort = ("v"), filter = ("v" < 50));\n',
+                                                     streaming_passes)
+            with patch('sys.stdout', new=io.StringIO()) as mocked_stdout:
+                StreamingInterpreter(10, 4, spill_directory).run(program)
+            self.assertEqual("   v\n0  0\n1  1\n2  2\n3  3\n4  4\n\n", mocked_stdout.getvalue())
+            self.assertEqual([], os.listdir(spill_directory))
+
+    def test_partial_aggregate(self):
+        series = pd.Series([4.0, np.nan, 1.5, 7.0, np.nan, 2.0, 4.0])
+        for method in ["sum", "mean", "min", "max", "nunique"]:
+            partial = PartialAggregate(method)
+            for start in range(0, len(series), 2):
+                partial.add(series[start:start + 2])
+            self.assertEqual(getattr(series, method)(), partial.result(), method)
+
+        # chunks without a value, or no rows at all
+        partial = PartialAggregate("max")
+        partial.add(pd.Series([np.nan]))
+        partial.add(pd.Series([3.0]))
+        self.assertEqual(3.0, partial.result())
+        for method in ["sum", "mean", "min", "nunique"]:
+            partial = PartialAggregate(method)
+            partial.add(pd.Series([], dtype="int64"))
+            np.testing.assert_equal(getattr(pd.Series([], dtype="int64"), method)(), partial.result())
+
+        # integers are averaged as floats, so their sums do not wrap around
+        series = pd.Series([2 ** 62 + i for i in range(6)], dtype="int64")
+        partial = PartialAggregate("mean")
+        for start in range(0, len(series), 2):
+            partial.add(series[start:start + 2])
+        self.assertAlmostEqual(1, partial.result() / series.mean(), 15)
+
+        partial = PartialAggregate("min")
+        partial.add(pd.Series(["b", "c"]))
+        partial.add(pd.Series(["a"]))
+        self.assertEqual("a", partial.result())
+
+    def test_frame_text(self):
+        frame = pd.DataFrame({"name": [f"n{i}" * (i % 4) for i in range(200)], "value": np.arange(200) * 1.5})
+        for rows in [0, 1, 59, 60, 61, 62, 200]:
+            for chunk_rows in [1, 13, 200]:
+                chunks = [frame.head(rows).iloc[start:start + chunk_rows]
+                          for start in range(0, max(rows, 1), chunk_rows)]
+                self.assertEqual(repr(frame.head(rows)), frame_text(iter(chunks)), (rows, chunk_rows))
+
+
+if __name__ == '__main__':
+    unittest.main()